@@ -2,31 +2,83 @@
 import calendar
 import logging
 import os
-import pytz
-import random
-import string
-from datetime import datetime, timedelta
-from homeassistant.components.recorder import get_instance
-from homeassistant.components.recorder.history import get_significant_states
+from contextlib import nullcontext
+from datetime import datetime
 from homeassistant.components.http import StaticPathConfig
 from homeassistant.components.frontend import async_register_built_in_panel
 from homeassistant.components.frontend import async_remove_panel
 from homeassistant.helpers.entity_registry import async_get, async_entries_for_config_entry
 from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers import config_validation as cv
-import arabic_reshaper
-from bidi.algorithm import get_display
 # import fitz  # PyMuPDF
 
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse, callback
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers.start import async_at_started
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import Platform
 import voluptuous as vol
-from fpdf import FPDF # Import FPDF here for better clarity and to ensure it's available
+
+from .const import (
+    BUNDLE_GROUP_AREA,
+    BUNDLE_GROUP_FLOOR,
+    BUNDLE_GROUP_NONE,
+    CONF_LOOKUP_HORIZON_DAYS,
+    CONF_PREWARM_RENDER,
+    CONF_RETENTION_DELETE_MONTHS,
+    CONF_RETENTION_ENABLED,
+    CONF_RETENTION_HOT_MONTHS,
+    CONF_SCHEDULE_ENABLED,
+    CONF_TARIFFS,
+    DEFAULT_FETCH_BATCH_SIZE,
+    DEFAULT_LOOKUP_HORIZON_DAYS,
+    DEFAULT_FETCH_CONCURRENCY,
+    DEFAULT_RENDER_CONCURRENCY,
+    DEFAULT_RENDER_WORKERS,
+    DEFAULT_RETENTION_DELETE_MONTHS,
+    DEFAULT_RETENTION_HOT_MONTHS,
+    DOMAIN,
+    JOB_PRIORITIES,
+    JOB_PRIORITY_BULK,
+    JOB_PRIORITY_INTERACTIVE,
+    LEDGER_FILENAME_PREFIX,
+    LEDGER_FORMAT_CSV,
+    LEDGER_FORMATS,
+    RENDER_BACKEND_PROCESS,
+    RENDER_BACKEND_THREAD,
+)
+from .download import async_register_views
+from .energy import DATA_LOOKUP_HORIZON, async_calculate_energy_used, get_period_end
+from .generator import async_bill_receipts, async_generate_period_receipts, async_generate_receipts
+from .jobs import async_cancel_jobs, async_setup_job_queue, get_job_queue
+from .ledger import async_open_ledger, get_ledger_filename
+from .meter_index import DATA_METER_INDEX, async_setup_meter_index
+from .metrics import async_setup_metrics, async_shutdown_metrics
+from .receipt_index import (
+    async_close_receipt_index,
+    async_index_receipt,
+    async_lock_receipt_file,
+    async_open_receipt_index,
+    get_receipt_index,
+    get_receipts_dir,
+)
+from .render_backend import async_prewarm_render, async_render_receipt, async_shutdown_render_pool
+from .retention import (
+    DATA_RETENTION,
+    async_run_retention_job,
+    async_setup_retention,
+    async_submit_retention,
+    delete_receipt,
+)
+from .schedule import DATA_SCHEDULE, async_setup_schedule
+from .snapshots import async_get_readings, async_setup_snapshots, async_shutdown_snapshots
+from .tariff import DATA_TARIFFS, async_setup_tariffs
+from .websocket import async_register_websocket_commands
 
 _LOGGER = logging.getLogger(__name__)
 
-DOMAIN = "sensor_pdf_generator"
+PLATFORMS = [Platform.SENSOR]
 
 # Define the service schema for generating the PDF - updated to support multiple entities
 SERVICE_GENERATE_PDF = "generate_pdf"
@@ -35,6 +87,24 @@ SERVICE_GENERATE_PDF_SCHEMA = vol.Schema({
     vol.Optional("filename_prefix", default="sensor_report"): str,  # Changed to prefix since we'll generate multiple files
     vol.Optional("start_date"): str,  # Format: YYYY-MM-DD
     vol.Optional("end_date"): str,    # Format: YYYY-MM-DD
+    # Pipeline tuning: meters per recorder batch and how many batches/renders run at once
+    vol.Optional("fetch_batch_size", default=DEFAULT_FETCH_BATCH_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional("fetch_concurrency", default=DEFAULT_FETCH_CONCURRENCY): vol.All(vol.Coerce(int), vol.Range(min=1, max=8)),
+    vol.Optional("render_concurrency", default=DEFAULT_RENDER_CONCURRENCY): vol.All(vol.Coerce(int), vol.Range(min=1, max=32)),
+    vol.Optional("compiled_template", default=False): cv.boolean,  # Stamp values onto a precompiled layout
+    # Opt in to rendering in a dedicated process pool instead of the shared executor
+    vol.Optional("render_backend", default=RENDER_BACKEND_THREAD): vol.In([RENDER_BACKEND_THREAD, RENDER_BACKEND_PROCESS]),
+    vol.Optional("render_workers", default=DEFAULT_RENDER_WORKERS): vol.All(vol.Coerce(int), vol.Range(min=1, max=8)),
+    # Render all meters as the pages of one document, optionally grouped by area or floor
+    vol.Optional("bundle", default=False): cv.boolean,
+    vol.Optional("bundle_group_by", default=BUNDLE_GROUP_NONE): vol.In([BUNDLE_GROUP_NONE, BUNDLE_GROUP_AREA, BUNDLE_GROUP_FLOOR]),
+    vol.Optional("force", default=False): cv.boolean,  # Render again even if an identical receipt exists
+    # Interactive jobs run before queued bulk runs
+    vol.Optional("priority", default=JOB_PRIORITY_INTERACTIVE): vol.In(list(JOB_PRIORITIES)),
+    # Throttle recorder reads for large runs, backing off while the recorder is busy
+    vol.Optional("max_queries_per_second"): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=100)),
+    # Also write the values of the receipts to a billing ledger in the same pass
+    vol.Optional("ledger_format"): vol.In(LEDGER_FORMATS),
 })
 
 # Keep the old service for backward compatibility
@@ -46,21 +116,65 @@ SERVICE_GENERATE_PDF_SINGLE_SCHEMA = vol.Schema({
     vol.Optional("end_date"): str,    # Format: YYYY-MM-DD
 })
 
+SERVICE_JOB_STATUS = "pdf_job_status"
+SERVICE_JOB_STATUS_SCHEMA = vol.Schema({
+    vol.Optional("job_id"): cv.string,  # All known jobs when omitted
+})
+
+SERVICE_CANCEL_JOB = "cancel_pdf_job"
+SERVICE_CANCEL_JOB_SCHEMA = vol.Schema({
+    vol.Required("job_id"): cv.string,
+})
+
+# Generate the receipts of several periods in one job, reading each meter's history once
+SERVICE_BACKFILL_PDFS = "backfill_pdfs"
+SERVICE_BACKFILL_PDFS_SCHEMA = SERVICE_GENERATE_PDF_SCHEMA.extend({
+    # Either explicit periods, or every month from start_date to end_date
+    vol.Optional("periods"): [vol.Schema({
+        vol.Required("start_date"): str,  # Format: YYYY-MM-DD
+        vol.Required("end_date"): str,    # Format: YYYY-MM-DD
+    })],
+    vol.Optional("priority", default=JOB_PRIORITY_BULK): vol.In(list(JOB_PRIORITIES)),
+})
+
+# Export the values of the receipts of several periods to a ledger without rendering them
+SERVICE_EXPORT_LEDGER = "export_ledger"
+SERVICE_EXPORT_LEDGER_SCHEMA = vol.Schema({
+    vol.Required("total_energy_entity_ids"): vol.Any(str, [str]),
+    vol.Optional("filename_prefix", default=LEDGER_FILENAME_PREFIX): str,
+    vol.Optional("ledger_format", default=LEDGER_FORMAT_CSV): vol.In(LEDGER_FORMATS),
+    # Either explicit periods, or every month from start_date to end_date
+    vol.Optional("start_date"): str,  # Format: YYYY-MM-DD
+    vol.Optional("end_date"): str,    # Format: YYYY-MM-DD
+    vol.Optional("periods"): [vol.Schema({
+        vol.Required("start_date"): str,  # Format: YYYY-MM-DD
+        vol.Required("end_date"): str,    # Format: YYYY-MM-DD
+    })],
+    vol.Optional("fetch_batch_size", default=DEFAULT_FETCH_BATCH_SIZE): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    vol.Optional("fetch_concurrency", default=DEFAULT_FETCH_CONCURRENCY): vol.All(vol.Coerce(int), vol.Range(min=1, max=8)),
+    vol.Optional("priority", default=JOB_PRIORITY_INTERACTIVE): vol.In(list(JOB_PRIORITIES)),
+    vol.Optional("max_queries_per_second"): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=100)),
+})
+
 # Add this after the existing SERVICE_GENERATE_PDF_SCHEMA
 SERVICE_LIST_PDFS = "list_pdfs"
-SERVICE_LIST_PDFS_SCHEMA = vol.Schema({})
-
-# Add a global cache for the timezone object
-_TZ_CACHE = {}
+SERVICE_LIST_PDFS_SCHEMA = vol.Schema({
+    # Without a limit every matching receipt is returned, newest first
+    vol.Optional("limit"): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+    vol.Optional("offset", default=0): vol.All(vol.Coerce(int), vol.Range(min=0)),
+    vol.Optional("entity_id"): cv.entity_id,
+    vol.Optional("start_date"): str,  # Format: YYYY-MM-DD
+    vol.Optional("end_date"): str,    # Format: YYYY-MM-DD
+    # Also list the receipts the retention policy moved into monthly archives
+    vol.Optional("include_archived", default=False): cv.boolean,
+})
 
-async def get_hass_timezone(hass):
-    """Get the pytz timezone object using executor job to avoid blocking."""
-    tz_name = hass.config.time_zone
-    if tz_name in _TZ_CACHE:
-        return _TZ_CACHE[tz_name]
-    tz = await hass.async_add_executor_job(pytz.timezone, tz_name)
-    _TZ_CACHE[tz_name] = tz
-    return tz
+# Apply the retention policy now, with the configured months unless given
+SERVICE_APPLY_RETENTION = "apply_retention"
+SERVICE_APPLY_RETENTION_SCHEMA = vol.Schema({
+    vol.Optional("hot_months"): vol.All(vol.Coerce(int), vol.Range(min=1, max=120)),
+    vol.Optional("delete_months"): vol.All(vol.Coerce(int), vol.Range(min=0, max=600)),  # Never deleted when 0
+})
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the integration and register the custom panel."""
@@ -75,16 +189,86 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
         )
     ])
 
+    # Generate requests run as background jobs. The queue outlives reloads of
+    # the entry, so the panel's job subscriptions keep receiving progress
+    async_setup_job_queue(hass, lambda job: _async_run_generate_job(hass, job))
+
+    # Commands the panel uses instead of service calls and bus events
+    async_register_websocket_commands(
+        hass,
+        SERVICE_GENERATE_PDF_SCHEMA,
+        lambda data: _async_submit_generate(hass, data),
+    )
+    # Authenticated downloads of single receipts and zip archives of many
+    async_register_views(hass)
+
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Sensor PDF Generator from a config entry."""
     _LOGGER.debug("async_setup_entry called for Sensor PDF Generator.")
 
+    # Receipts are listed from an index instead of scanning the receipts folder
+    await async_open_receipt_index(hass)
+
+    # The panel lists breakers from an index kept up to date from the registries
+    for remove_listener in async_setup_meter_index(hass):
+        entry.async_on_unload(remove_listener)
+
+    # Readings of meters that went quiet are looked up this far back
+    hass.data.setdefault(DOMAIN, {})[DATA_LOOKUP_HORIZON] = entry.options.get(
+        CONF_LOOKUP_HORIZON_DAYS, DEFAULT_LOOKUP_HORIZON_DAYS
+    )
+
+    # Receipts are billed at the tariffs of their meters' groups
+    async_setup_tariffs(hass, entry.options.get(CONF_TARIFFS))
+
+    # Readings at month boundaries are snapshotted so standard periods skip the recorder
+    for remove_listener in await async_setup_snapshots(hass):
+        entry.async_on_unload(remove_listener)
+
+    # Generation timings and counters, published by the diagnostic sensors
+    async_setup_metrics(hass)
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    # Optionally generate last month's receipts once it has ended
+    if entry.options.get(CONF_SCHEDULE_ENABLED):
+        for remove_listener in await async_setup_schedule(hass, entry.options):
+            entry.async_on_unload(remove_listener)
+
+    # Optionally archive and delete old receipts in the background
+    if entry.options.get(CONF_RETENTION_ENABLED):
+        for remove_listener in async_setup_retention(hass, entry.options):
+            entry.async_on_unload(remove_listener)
+    entry.async_on_unload(entry.add_update_listener(_async_update_listener))
+
+    # The rendering stack is imported on the first receipt, or ahead of it once started
+    if entry.options.get(CONF_PREWARM_RENDER):
+        entry.async_on_unload(async_at_started(hass, _async_start_prewarm))
+
     # Register the multi-PDF generation service
-    async def handle_generate_pdf_service(call: ServiceCall) -> None:
+    async def handle_generate_pdf_service(call: ServiceCall) -> dict:
         """Wrapper to properly handle the async service call for multiple entities."""
-        await _async_handle_generate_pdf_multiple_service(hass, call)
+        return await _async_handle_generate_pdf_multiple_service(hass, call)
+
+    # Register the multi-period backfill service
+    async def handle_backfill_pdfs_service(call: ServiceCall) -> dict:
+        """Handle the backfill_pdfs service call."""
+        return await _async_handle_backfill_pdfs_service(hass, call)
+
+    # Register the ledger export service
+    async def handle_export_ledger_service(call: ServiceCall) -> dict:
+        """Handle the export_ledger service call."""
+        return await _async_handle_export_ledger_service(hass, call)
+
+    # Register the job status and cancel services
+    async def handle_job_status_service(call: ServiceCall) -> dict:
+        """Handle the pdf_job_status service call."""
+        return await _async_handle_job_status_service(hass, call)
+
+    async def handle_cancel_job_service(call: ServiceCall) -> None:
+        """Handle the cancel_pdf_job service call."""
+        await _async_handle_cancel_job_service(hass, call)
 
     # Register the single PDF generation service (backward compatibility)
     async def handle_generate_pdf_single_service(call: ServiceCall) -> None:
@@ -96,6 +280,11 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         """Handle the list_pdfs service call."""
         return await _async_handle_list_pdfs_service(hass, call)
 
+    # Register the retention service
+    async def handle_apply_retention_service(call: ServiceCall) -> dict:
+        """Handle the apply_retention service call."""
+        return _async_handle_apply_retention_service(hass, entry, call)
+
     # Register the delete PDF service
     async def delete_pdf_service(call: ServiceCall) -> None:
         """Handle delete PDF service call."""
@@ -108,15 +297,25 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         # Sanitize filename to prevent path traversal
         filename = os.path.basename(filename)
         
-        receipts_dir = hass.config.path("www", "receipts")
+        receipts_dir = get_receipts_dir(hass)
         file_path = os.path.join(receipts_dir, filename)
         
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        def remove_pdf_file():
+            index = get_receipt_index(hass)
+            if index is not None:
+                # Archived receipts are removed from their monthly archive right away
+                found = delete_receipt(index, filename)
+            else:
+                found = os.path.exists(file_path)
+                if found:
+                    os.remove(file_path)
+            if found:
                 _LOGGER.info(f"Deleted PDF file: {filename}")
             else:
                 _LOGGER.warning(f"PDF file not found: {filename}")
+
+        try:
+            await hass.async_add_executor_job(remove_pdf_file)
         except Exception as e:
             _LOGGER.error(f"Error deleting PDF file {filename}: {str(e)}")
             raise
@@ -126,6 +325,38 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         SERVICE_GENERATE_PDF,
         handle_generate_pdf_service,
         schema=SERVICE_GENERATE_PDF_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_BACKFILL_PDFS,
+        handle_backfill_pdfs_service,
+        schema=SERVICE_BACKFILL_PDFS_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_EXPORT_LEDGER,
+        handle_export_ledger_service,
+        schema=SERVICE_EXPORT_LEDGER_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_JOB_STATUS,
+        handle_job_status_service,
+        schema=SERVICE_JOB_STATUS_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_CANCEL_JOB,
+        handle_cancel_job_service,
+        schema=SERVICE_CANCEL_JOB_SCHEMA,
     )
     
     hass.services.async_register(
@@ -143,6 +374,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         supports_response=True,
     )
     
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_APPLY_RETENTION,
+        handle_apply_retention_service,
+        schema=SERVICE_APPLY_RETENTION_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
     hass.services.async_register(
         DOMAIN,
         "delete_pdf",
@@ -182,10 +421,26 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     _LOGGER.debug("async_unload_entry called for Sensor PDF Generator.")
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
     # Unregister the services when the integration is unloaded
     hass.services.async_remove(DOMAIN, SERVICE_GENERATE_PDF)
     hass.services.async_remove(DOMAIN, SERVICE_GENERATE_PDF_SINGLE)
+    hass.services.async_remove(DOMAIN, SERVICE_BACKFILL_PDFS)
+    hass.services.async_remove(DOMAIN, SERVICE_EXPORT_LEDGER)
     hass.services.async_remove(DOMAIN, SERVICE_LIST_PDFS)
+    hass.services.async_remove(DOMAIN, SERVICE_JOB_STATUS)
+    hass.services.async_remove(DOMAIN, SERVICE_CANCEL_JOB)
+    hass.services.async_remove(DOMAIN, SERVICE_APPLY_RETENTION)
+    hass.data.get(DOMAIN, {}).pop(DATA_SCHEDULE, None)
+    hass.data.get(DOMAIN, {}).pop(DATA_RETENTION, None)
+    await async_cancel_jobs(hass)
+    await async_shutdown_render_pool(hass)
+    await async_close_receipt_index(hass)
+    await async_shutdown_snapshots(hass)
+    hass.data.get(DOMAIN, {}).pop(DATA_METER_INDEX, None)
+    hass.data.get(DOMAIN, {}).pop(DATA_TARIFFS, None)
+    async_shutdown_metrics(hass)
     _LOGGER.info("Sensor PDF Generator services unregistered.")
     try:
         if hass.data.get("frontend_panels", {}).get("pdf-panel-frontend"):
@@ -196,12 +451,42 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return True
 
 
-async def _async_handle_generate_pdf_multiple_service(hass: HomeAssistant, call: ServiceCall) -> None:
-    """Handle the generate_pdf service call for single or multiple entities."""
-    entity_ids_input = call.data.get("total_energy_entity_ids")
-    filename_prefix = call.data.get("filename_prefix", "sensor_report")
-    start_date_str = call.data.get("start_date")
-    end_date_str = call.data.get("end_date")
+@callback
+def _async_start_prewarm(hass: HomeAssistant) -> None:
+    """Pre-warm the receipt renderer without holding up startup."""
+    hass.async_create_background_task(async_prewarm_render(hass), f"{DOMAIN} render prewarm")
+
+
+async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the integration when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+async def _async_handle_generate_pdf_multiple_service(hass: HomeAssistant, call: ServiceCall) -> dict:
+    """Handle the generate_pdf service call for single or multiple entities.
+
+    The receipts are generated by a background job, and the service returns
+    its ID as soon as it is queued.
+    """
+    try:
+        job = await _async_submit_generate(hass, call.data)
+    except ValueError as e:
+        _LOGGER.error(f"Date parsing or energy conversion error: {e}")
+        hass.bus.async_fire("pdf_generator_complete", {
+            "entity_ids": call.data.get("total_energy_entity_ids"),
+            "success": False,
+            "error": f"Date or energy value error: {str(e)}"
+        })
+        return {"job_id": None}
+    return {"job_id": job.id}
+
+async def _async_submit_generate(hass: HomeAssistant, data: dict):
+    """Queue a generate job for validated generate_pdf data and return it.
+
+    Raises ValueError if the dates cannot be parsed.
+    """
+    entity_ids_input = data.get("total_energy_entity_ids")
+    start_date_str = data.get("start_date")
+    end_date_str = data.get("end_date")
 
     # Normalize entity_ids to always be a list
     if isinstance(entity_ids_input, str):
@@ -211,115 +496,264 @@ async def _async_handle_generate_pdf_multiple_service(hass: HomeAssistant, call:
 
     _LOGGER.info(f"Attempting to generate separate PDFs for entities: {entity_ids}")
 
-    try:
-        # Parse date range or use defaults
-        if start_date_str and end_date_str:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-        else:
-            # Default to current month if no dates provided
-            today = datetime.now()
-            start_date = datetime(today.year, today.month, 1)
-            last_day = calendar.monthrange(today.year, today.month)[1]
-            end_date = datetime(today.year, today.month, last_day)
-
-        _LOGGER.info(f"Calculating energy usage from {start_date} to {end_date}")
+    # Parse date range or use defaults
+    if start_date_str and end_date_str:
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+    else:
+        # Default to current month if no dates provided
+        today = datetime.now()
+        start_date = datetime(today.year, today.month, 1)
+        last_day = calendar.monthrange(today.year, today.month)[1]
+        end_date = datetime(today.year, today.month, last_day)
+
+    return get_job_queue(hass).async_submit(
+        entity_ids,
+        data.get("priority", JOB_PRIORITY_INTERACTIVE),
+        {**data, "start_date": start_date, "end_date": end_date},
+    )
 
-        # Collect data for all entities and generate separate PDFs
-        generated_files = []
-        failed_entities = []
+async def _async_run_generate_job(hass: HomeAssistant, job) -> dict:
+    """Generate the receipts of a queued job and return a summary of the files."""
+    if "periods" in job.data:
+        return await _async_run_backfill_job(hass, job)
+    if "retention" in job.data:
+        return await async_run_retention_job(hass, job)
 
-        for entity_id in entity_ids:
-            try:
-                # Get the current state of the entity
-                entity_state = hass.states.get(entity_id)
-                if entity_state is None:
-                    _LOGGER.warning(f"Entity '{entity_id}' not found, skipping.")
-                    failed_entities.append(entity_id)
-                    continue
-
-                # Get energy values at start and end of period
-                start_energy = await get_energy_at_time(hass, entity_id, start_date)
-                end_energy = await get_energy_at_time(hass, entity_id, end_date)
-
-                if start_energy is None or end_energy is None:
-                    _LOGGER.warning(f"Could not get energy values for {entity_id}. Start: {start_energy}, End: {end_energy}")
-                    # Fallback to current total energy if we can't get historical data
-                    total_energy = float(entity_state.state)
-                    energy_used = total_energy * 0.1  # Fallback calculation
-                else:
-                    total_energy = end_energy
-                    energy_used = end_energy - start_energy
-                    if energy_used < 0:
-                        energy_used = 0  # Handle meter resets
-
-                # Get entity name for the report
-                entity_name = entity_state.attributes.get('friendly_name', entity_id)
-                
-                # Clean entity name for filename
-                clean_name = "".join(c for c in entity_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                clean_name = clean_name.replace(' ', '_')
-                filename = f"{filename_prefix}_{clean_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf"
-                
-                await hass.async_add_executor_job(
-                    generate_pdf_report,
-                    total_energy,
-                    energy_used,
-                    filename,
-                    hass.config.config_dir,
-                    start_date,
-                    end_date,
-                    entity_name  # Pass entity name for the report
-                )
-                generated_files.append({
-                    'filename': filename,
-                    'entity_id': entity_id,
-                    'entity_name': entity_name
-                })
-                
-                _LOGGER.info(f"Energy calculation for {entity_id} - Start: {start_energy}, End: {end_energy}, Used: {energy_used}")
-
-            except Exception as e:
-                _LOGGER.error(f"Error generating PDF for {entity_id}: {e}")
-                failed_entities.append(entity_id)
-
-        if not generated_files:
-            _LOGGER.error("No PDFs were generated successfully.")
-            hass.bus.async_fire("pdf_generator_complete", {
-                "entity_ids": entity_ids,
-                "success": False,
-                "error": "No PDFs were generated successfully",
-                "failed_entities": failed_entities
-            })
-            return
+    entity_ids = job.entity_ids
+    start_date = job.data["start_date"]
+    end_date = job.data["end_date"]
+    filename_prefix = job.data.get("filename_prefix", "sensor_report")
+    queue = get_job_queue(hass)
 
-        _LOGGER.info(f"Generated {len(generated_files)} PDF files successfully")
+    _LOGGER.info(f"Calculating energy usage from {start_date} to {end_date}")
 
-        # Fire an event to notify the frontend panel
+    try:
+        async with _async_open_job_ledger(hass, job, start_date, end_date) as ledger:
+            # Fetch readings batch by batch and render each batch while the next one is fetched
+            results = await async_generate_receipts(
+                hass,
+                entity_ids,
+                filename_prefix,
+                start_date,
+                end_date,
+                job.data,
+                lambda entity_id, result: queue.async_progress(job, entity_id, result),
+                ledger,
+            )
+    except Exception as e:
+        _LOGGER.error(f"Error generating PDFs: {e}")
         hass.bus.async_fire("pdf_generator_complete", {
-            "entity_ids": entity_ids,
-            "success": True,
-            "start_date": start_date_str or start_date.strftime("%Y-%m-%d"),
-            "end_date": end_date_str or end_date.strftime("%Y-%m-%d"),
-            "generated_files": generated_files,
-            "failed_entities": failed_entities,
-            "file_count": len(generated_files)
+            "job_id": job.id,
+            "meter_count": len(entity_ids),
+            "success": False,
+            "error": str(e)
         })
+        raise
 
-    except ValueError as e:
-        _LOGGER.error(f"Date parsing or energy conversion error: {e}")
+    # Collect data for all entities in the order they were requested
+    generated_files = [results[entity_id] for entity_id in entity_ids if results.get(entity_id)]
+    failed_entities = [entity_id for entity_id in entity_ids if not results.get(entity_id)]
+    ledger_info = _get_ledger_info(ledger)
+
+    if not generated_files:
+        _LOGGER.error("No PDFs were generated successfully.")
         hass.bus.async_fire("pdf_generator_complete", {
-            "entity_ids": entity_ids,
+            "job_id": job.id,
+            "meter_count": len(entity_ids),
             "success": False,
-            "error": f"Date or energy value error: {str(e)}"
+            "error": "No PDFs were generated successfully",
+            "failed_count": len(failed_entities),
+            **ledger_info,
         })
+        return {"generated_files": [], "failed_entities": failed_entities, "file_count": 0, **ledger_info}
+
+    # A bundle holds the receipts of several entities in one file
+    filenames = list(dict.fromkeys(file_info['filename'] for file_info in generated_files))
+    _LOGGER.info(f"Generated {len(filenames)} PDF files successfully")
+
+    # Only counts go on the bus, pdf_job_status returns the files of the job
+    hass.bus.async_fire("pdf_generator_complete", {
+        "job_id": job.id,
+        "meter_count": len(entity_ids),
+        "success": True,
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "generated_count": len(generated_files),
+        "failed_count": len(failed_entities),
+        "file_count": len(filenames),
+        "filename": filenames[0] if len(filenames) == 1 else None,
+        **ledger_info,
+    })
+    return {"generated_files": generated_files, "failed_entities": failed_entities, "file_count": len(filenames), **ledger_info}
+
+async def _async_handle_backfill_pdfs_service(hass: HomeAssistant, call: ServiceCall) -> dict:
+    """Handle the backfill_pdfs service call, returning the ID of the queued job."""
+    try:
+        job = await _async_submit_backfill(hass, call.data)
+    except ValueError as e:
+        raise ServiceValidationError(f"Invalid backfill periods: {e}") from e
+    return {"job_id": job.id}
+
+def _get_backfill_periods(data: dict) -> list:
+    """Return the (start_date, end_date) periods of validated backfill_pdfs data.
+
+    Without explicit periods, every month from start_date to end_date is a
+    period running from its 1st to its last day, clipped to those dates.
+    Raises ValueError if the dates cannot be parsed or no period is given.
+    """
+    if data.get("periods"):
+        periods = [
+            (datetime.strptime(period["start_date"], "%Y-%m-%d"), datetime.strptime(period["end_date"], "%Y-%m-%d"))
+            for period in data["periods"]
+        ]
+    elif data.get("start_date") and data.get("end_date"):
+        start_date = datetime.strptime(data["start_date"], "%Y-%m-%d")
+        end_date = datetime.strptime(data["end_date"], "%Y-%m-%d")
+        periods = []
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            last_day = calendar.monthrange(year, month)[1]
+            periods.append((max(datetime(year, month, 1), start_date), min(datetime(year, month, last_day), end_date)))
+            year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    else:
+        raise ValueError("either periods or start_date and end_date are required")
+
+    if not periods:
+        raise ValueError("end_date is before start_date")
+    for start_date, end_date in periods:
+        if end_date < start_date:
+            raise ValueError(f"period ending {end_date:%Y-%m-%d} starts after it")
+    return periods
+
+async def _async_submit_backfill(hass: HomeAssistant, data: dict):
+    """Queue a backfill job for validated backfill_pdfs data and return it.
+
+    Raises ValueError if the periods are invalid.
+    """
+    entity_ids = data["total_energy_entity_ids"]
+    if isinstance(entity_ids, str):
+        entity_ids = [entity_ids]
+    periods = _get_backfill_periods(data)
+    _LOGGER.info(f"Backfilling {len(periods)} periods of receipts for entities: {entity_ids}")
+
+    return get_job_queue(hass).async_submit(
+        entity_ids,
+        data.get("priority", JOB_PRIORITY_BULK),
+        {**data, "periods": periods},
+        len(set(entity_ids)) * len(periods),
+    )
+
+async def _async_run_backfill_job(hass: HomeAssistant, job) -> dict:
+    """Generate the receipts of every period of a backfill job and return a summary of the files."""
+    entity_ids = job.entity_ids
+    queue = get_job_queue(hass)
+
+    periods = job.data["periods"]
+
+    try:
+        async with _async_open_job_ledger(
+            hass, job, min(start for start, _ in periods), max(end for _, end in periods)
+        ) as ledger:
+            period_results = await async_generate_period_receipts(
+                hass,
+                entity_ids,
+                job.data.get("filename_prefix", "sensor_report"),
+                periods,
+                job.data,
+                lambda entity_id, result: queue.async_progress(job, entity_id, result),
+                ledger,
+            )
     except Exception as e:
-        _LOGGER.error(f"Error generating PDFs: {e}")
+        _LOGGER.error(f"Error backfilling PDFs: {e}")
         hass.bus.async_fire("pdf_generator_complete", {
-            "entity_ids": entity_ids,
+            "job_id": job.id,
+            "meter_count": len(entity_ids),
             "success": False,
             "error": str(e)
         })
+        raise
+
+    generated_files = []
+    failed_periods = []
+    for start_date, end_date, results in period_results:
+        period = {"start_date": start_date.strftime("%Y-%m-%d"), "end_date": end_date.strftime("%Y-%m-%d")}
+        for entity_id in entity_ids:
+            if results.get(entity_id):
+                generated_files.append({**results[entity_id], **period})
+            else:
+                failed_periods.append({"entity_id": entity_id, **period})
+    failed_entities = list(dict.fromkeys(failed["entity_id"] for failed in failed_periods))
+    filenames = list(dict.fromkeys(file_info['filename'] for file_info in generated_files))
+    ledger_info = _get_ledger_info(ledger)
+    _LOGGER.info(f"Backfilled {len(filenames)} files, {len(failed_periods)} receipts failed")
+
+    hass.bus.async_fire("pdf_generator_complete", {
+        "job_id": job.id,
+        "meter_count": len(entity_ids),
+        "success": bool(generated_files),
+        "generated_count": len(generated_files),
+        "failed_count": len(failed_entities),
+        "failed_period_count": len(failed_periods),
+        "file_count": len(filenames),
+        **ledger_info,
+    })
+    return {
+        "generated_files": generated_files,
+        "failed_entities": failed_entities,
+        "failed_periods": failed_periods,
+        "file_count": len(filenames),
+        **ledger_info,
+    }
+
+async def _async_handle_export_ledger_service(hass: HomeAssistant, call: ServiceCall) -> dict:
+    """Handle the export_ledger service call, returning the ID of the queued job.
+
+    The export runs as a backfill job that adds every resolved receipt to
+    the ledger instead of rendering it.
+    """
+    try:
+        job = await _async_submit_backfill(hass, {**call.data, "ledger_only": True})
+    except ValueError as e:
+        raise ServiceValidationError(f"Invalid ledger periods: {e}") from e
+    return {"job_id": job.id}
+
+def _async_open_job_ledger(hass: HomeAssistant, job, start_date: datetime, end_date: datetime):
+    """Return a context yielding the LedgerWriter of a job from start_date to end_date, or None if it writes no ledger."""
+    ledger_format = job.data.get("ledger_format")
+    if ledger_format is None:
+        return nullcontext()
+    filename_prefix = job.data.get("filename_prefix", "sensor_report")
+    if not job.data.get("ledger_only"):
+        # Written next to the receipts, so named after them
+        filename_prefix = f"{filename_prefix}_ledger"
+    return async_open_ledger(
+        hass, get_ledger_filename(filename_prefix, start_date, end_date, ledger_format), ledger_format
+    )
+
+def _get_ledger_info(ledger) -> dict:
+    """Return the ledger filename and row count added to a job's result, if it wrote one."""
+    if ledger is None:
+        return {}
+    return {"ledger": ledger.filename, "ledger_rows": ledger.rows}
+
+async def _async_handle_job_status_service(hass: HomeAssistant, call: ServiceCall) -> dict:
+    """Handle the pdf_job_status service call."""
+    queue = get_job_queue(hass)
+    job_id = call.data.get("job_id")
+    if job_id is None:
+        return {"jobs": [job.as_dict() for job in queue.async_jobs()]}
+
+    job = queue.async_get(job_id)
+    if job is None:
+        raise ServiceValidationError(f"Unknown PDF generation job: {job_id}")
+    return job.as_dict()
+
+async def _async_handle_cancel_job_service(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Handle the cancel_pdf_job service call."""
+    job_id = call.data["job_id"]
+    if not get_job_queue(hass).async_cancel(job_id):
+        _LOGGER.warning(f"PDF generation job {job_id} is unknown or already finished")
 
 async def _async_handle_generate_pdf_service(hass: HomeAssistant, call: ServiceCall) -> None:
     """Handle the generate_pdf_single service call (backward compatibility)."""
@@ -350,36 +784,52 @@ async def _async_handle_generate_pdf_service(hass: HomeAssistant, call: ServiceC
 
         _LOGGER.info(f"Calculating energy usage from {start_date} to {end_date}")
 
-        # Get energy values at start and end of period
-        start_energy = await get_energy_at_time(hass, total_energy_entity_id, start_date)
-        end_energy = await get_energy_at_time(hass, total_energy_entity_id, end_date)
+        # Get energy readings at start and end of period, which includes its last day
+        period_end = get_period_end(end_date)
+        start_reading = (await async_get_readings(hass, [total_energy_entity_id], start_date))[total_energy_entity_id]
+        end_reading = (await async_get_readings(hass, [total_energy_entity_id], period_end))[total_energy_entity_id]
+        start_energy = start_reading["state"] if start_reading else None
+        end_energy = end_reading["state"] if end_reading else None
 
-        if start_energy is None or end_energy is None:
+        if start_reading is None or end_reading is None:
             _LOGGER.warning(f"Could not get energy values for the selected period. Start: {start_energy}, End: {end_energy}")
             # Fallback to current total energy if we can't get historical data
             total_energy = float(total_energy_state_now.state)
             energy_used = total_energy * 0.1  # Fallback calculation
         else:
             total_energy = end_energy
-            energy_used = end_energy - start_energy
-            if energy_used < 0:
-                energy_used = 0  # Handle meter resets
+            energy_used = await async_calculate_energy_used(
+                hass, total_energy_entity_id, start_reading, end_reading, start_date, period_end
+            )
 
         _LOGGER.info(f"Energy calculation - Start: {start_energy}, End: {end_energy}, Used: {energy_used}")
 
         # Get entity name for the report
         entity_name = total_energy_state_now.attributes.get('friendly_name', total_energy_entity_id)
-
-        await hass.async_add_executor_job(
-            generate_pdf_report,
-            total_energy,
-            energy_used,
-            filename,
-            hass.config.config_dir,
-            start_date,
-            end_date,
-            entity_name
-        )
+        receipt = {
+            'entity_id': total_energy_entity_id,
+            'entity_name': entity_name,
+            'total_energy': total_energy,
+            'energy_used': energy_used,
+        }
+        await async_bill_receipts(hass, [receipt], start_date, end_date)
+
+        async with async_lock_receipt_file(hass, filename):
+            path = await async_render_receipt(
+                hass,
+                RENDER_BACKEND_THREAD,
+                DEFAULT_RENDER_WORKERS,
+                total_energy,
+                energy_used,
+                filename,
+                hass.config.config_dir,
+                start_date,
+                end_date,
+                entity_name,
+                False,
+                receipt['bill'],
+            )
+            await async_index_receipt(hass, path, [receipt], start_date, end_date)
         _LOGGER.info(f"PDF '{filename}' generated successfully in Home Assistant config directory.")
 
         # Fire an event to notify the frontend panel (optional)
@@ -408,250 +858,59 @@ async def _async_handle_generate_pdf_service(hass: HomeAssistant, call: ServiceC
             "error": str(e)
         })
 
-async def get_energy_at_time(hass, entity_id: str, when: datetime):
-    """Return the sensor's value (as float) at the given datetime."""
-    tz = await get_hass_timezone(hass)
-    when = when.astimezone(tz) if when.tzinfo else tz.localize(when)
-    # Use a wider window to ensure we get the last known state before 'when'
-    start = (when - timedelta(days=7)).astimezone(tz)  # Increased window
-    end = when.astimezone(tz)
-
-    states = await get_instance(hass).async_add_executor_job(
-        get_significant_states,
-        hass,
-        start,
-        end,
-        [entity_id],
-    )
-
-    entity_states = states.get(entity_id, [])
-    if not entity_states:
-        _LOGGER.warning(f"No states found for {entity_id} between {start} and {end}")
-        return None
-
-    last_state = None
-    for state in entity_states:
-        state_time = state.last_updated
-        if state_time.tzinfo is None:
-            state_time = tz.localize(state_time)
-        else:
-            state_time = state_time.astimezone(tz)
-        if state_time <= when:
-            last_state = state
-        else:
-            break
-
-    if not last_state:
-        _LOGGER.warning(f"No valid state found for {entity_id} at {when}")
-        return None
-
-    try:
-        value = float(last_state.state)
-        _LOGGER.debug(f"Found energy value {value} for {entity_id} at {last_state.last_updated}")
-        return value
-    except ValueError:
-        _LOGGER.warning(f"Could not convert state '{last_state.state}' to float for {entity_id}")
-        return None
-
 async def get_monthly_energy(hass, entity_id: str, year: int, month: int):
     """Return the energy used in the given month."""
-    start_of_month = datetime(year, month, 1, 0, 0, 0)
-    last_day = calendar.monthrange(year, month)[1]
-    end_of_month = datetime(year, month, last_day, 23, 59, 59)
+    # The month ends where the next one starts, so both ends are snapshotted boundaries
+    start_of_month = datetime(year, month, 1)
+    end_of_month = datetime(year + month // 12, month % 12 + 1, 1)
 
-    start_val = await get_energy_at_time(hass, entity_id, start_of_month)
-    end_val = await get_energy_at_time(hass, entity_id, end_of_month)
+    start_reading = (await async_get_readings(hass, [entity_id], start_of_month))[entity_id]
+    end_reading = (await async_get_readings(hass, [entity_id], end_of_month))[entity_id]
 
-    if start_val is None:
-        start_val = 0
+    if start_reading is None:
+        start_reading = {"state": 0, "sum": None}
 
-    if end_val is None:
-        end_val = 0
+    if end_reading is None:
+        end_reading = {"state": 0, "sum": None}
 
-    monthly_energy = end_val - start_val
-    return monthly_energy
-
-def generate_pdf_report(total_energy: float, energy_used: float, filename: str, config_dir: str, start_date: datetime = None, end_date: datetime = None, entity_name: str = None) -> None:
-    """Generate a PDF report with English section at the top and Arabic section below using Amiri-Regular.ttf for Arabic."""
-    from fpdf.enums import XPos, YPos
-
-    random_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-    
-    # Use provided date range or default to last month
-    if start_date and end_date:
-        date_range = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
-        period_days = (end_date - start_date).days + 1
-    else:
-        today = datetime.today()
-        first_day_last_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
-        last_day_last_month = first_day_last_month.replace(day=30)
-        date_range = f"{first_day_last_month.strftime('%Y-%m-%d')} to {last_day_last_month.strftime('%Y-%m-%d')}"
-        period_days = (last_day_last_month - first_day_last_month).days + 1
-    
-    counter_cost = 385000
-    cost_multiplier = 32790
-    total_cost = energy_used * cost_multiplier + counter_cost
-
-    pdf = FPDF()
-    pdf.add_page()
-
-    # Use Amiri-Regular.ttf from tts folder inside config_dir
-    font_path = os.path.join(config_dir, "tts", "Amiri-Regular.ttf")
-    if not os.path.exists(font_path):
-        raise FileNotFoundError(
-            f"Amiri-Regular.ttf not found in {os.path.join(config_dir, 'tts')}. "
-            "Please download Amiri-Regular.ttf from https://www.amirifont.org/ and place it in the tts folder inside your Home Assistant config directory."
-        )
-    pdf.add_font("Amiri", "", font_path, uni=True)
-    pdf.add_font("Amiri", "B", font_path, uni=True)
-
-    margin = 10
-    page_width = pdf.w - 2 * margin
-    page_height = pdf.h - 2 * margin
-    pdf.set_draw_color(0, 0, 0)
-    pdf.rect(margin, margin, page_width, page_height)
-
-    # English section
-    pdf.set_xy(margin, margin + 5)
-    pdf.set_font("Amiri", "B", 18)
-    pdf.cell(page_width, 12, "ELECTRICITY RECEIPT", align="C", ln=1)
-    
-    # Add entity name if provided
-    if entity_name:
-        pdf.set_font("Amiri", size=14)
-        # If the entity name contains Arabic characters, reshape + bidi it so Arabic glyphs render correctly
-        def _contains_arabic(s: str) -> bool:
-            if not s:
-                return False
-            for ch in s:
-                # Arabic blocks: \u0600-\u06FF, \u0750-\u077F, \u08A0-\u08FF, \uFB50-\uFDFF, \uFE70-\uFEFF
-                if ("\u0600" <= ch <= "\u06FF") or ("\u0750" <= ch <= "\u077F") or ("\u08A0" <= ch <= "\u08FF") or ("\uFB50" <= ch <= "\uFDFF") or ("\uFE70" <= ch <= "\uFEFF"):
-                    return True
-            return False
-
-        display_name = entity_name
-        if _contains_arabic(entity_name):
-            display_name = get_display(arabic_reshaper.reshape(entity_name))
-
-        pdf.cell(page_width, 8, f"Meter: {display_name}", align="C", ln=1)
-    
-    pdf.set_font("Amiri", size=13)
-    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
-
-    english_labels = [
-        "Report ID:",
-        "Generation Date:",
-        "Billing Period:",
-        "Period Duration:",
-        "Total Energy Reading (kWh):",
-        "Energy Consumed (kWh):",
-        "Fixed Service Charge:",
-        "Rate per kWh:",
-        "Total Amount Due:",
-    ]
-    english_values = [
-        random_id,
-        datetime.now().strftime("%Y-%m-%d %H:%M"),
-        date_range,
-        f"{period_days} days",
-        f"{total_energy:.2f}",
-        f"{energy_used:.2f}",
-        f"{counter_cost:,}",
-        f"{cost_multiplier:,}",
-        f"{total_cost:,}",
-    ]
-
-    for label, value in zip(english_labels, english_values):
-        pdf.set_x(margin + 5)
-        pdf.cell(page_width * 0.5, 10, label, border=0)
-        pdf.cell(page_width * 0.5, 10, value, border=0, ln=1)
-
-    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
-    pdf.ln(5)
-
-    # Arabic section (right-to-left, left margin)
-    pdf.set_font("Amiri", "B", 18)
-    reshaped_title = arabic_reshaper.reshape("إيصال")
-    bidi_title = get_display(reshaped_title)
-    pdf.cell(page_width, 12, bidi_title, align="C", ln=1)
-    
-    # Add entity name in Arabic if provided
-    if entity_name:
-        pdf.set_font("Amiri", size=14)
-        reshaped_meter = arabic_reshaper.reshape(f"العداد: {entity_name}")
-        bidi_meter = get_display(reshaped_meter)
-        pdf.cell(page_width, 8, bidi_meter, align="C", ln=1)
-    
-    pdf.set_font("Amiri", size=13)
-    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
-
-    arabic_labels = [
-        "معرف التقرير",
-        "تاريخ الإصدار",
-        "فترة الفوترة",
-        "مدة الفترة",
-        "إجمالي قراءة الطاقة (ك.و.س)",
-        "الطاقة المستهلكة (ك.و.س)",
-        "رسوم الخدمة الثابتة",
-        "تعرفة كل ك.و.س",
-        "المبلغ الإجمالي المستحق",
-    ]
-    
-    arabic_values = [
-        arabic_reshaper.reshape(str(val)) for val in english_values
-    ]
-
-    # Set X to left margin for visibility
-    for label, value in zip(arabic_labels, arabic_values):
-        reshaped_label = arabic_reshaper.reshape(label)
-        bidi_label = get_display(reshaped_label)
-        bidi_value = get_display(value)
-        pdf.set_x(margin)
-        pdf.cell(page_width * 0.5, 10, bidi_value, border=0, align="R")
-        pdf.cell(page_width * 0.5, 10, bidi_label, border=0, align="R", ln=1)
-
-    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
-
-    # Change output directory to /config/www/receipts/
-    receipts_dir = os.path.join(config_dir, "www", "receipts")
-    os.makedirs(receipts_dir, exist_ok=True)
-    pdf_output_path = os.path.join(receipts_dir, filename)
-    pdf.output(pdf_output_path)
+    return await async_calculate_energy_used(hass, entity_id, start_reading, end_reading, start_of_month, end_of_month)
 
 async def _async_handle_list_pdfs_service(hass: HomeAssistant, call: ServiceCall) -> dict:
     """Handle the list_pdfs service call."""
     try:
-        receipts_dir = os.path.join(hass.config.config_dir, "www", "receipts")
-        
-        # Create directory if it doesn't exist (using executor)
-        def ensure_directory():
-            if not os.path.exists(receipts_dir):
-                os.makedirs(receipts_dir, exist_ok=True)
-            return os.path.exists(receipts_dir)
-        
-        dir_exists = await hass.async_add_executor_job(ensure_directory)
-        if not dir_exists:
-            return {"pdf_files": []}
-        
-        # List all PDF files (using executor)
-        def list_pdf_files():
-            pdf_files = []
-            for filename in os.listdir(receipts_dir):
-                if filename.lower().endswith('.pdf'):
-                    pdf_files.append(filename)
-            
-            # Sort by modification time, newest first
-            pdf_files.sort(key=lambda f: os.path.getmtime(os.path.join(receipts_dir, f)), reverse=True)
-            return pdf_files
-        
-        pdf_files = await hass.async_add_executor_job(list_pdf_files)
-        
-        _LOGGER.debug(f"Found {len(pdf_files)} PDF files: {pdf_files}")
-        return {"pdf_files": pdf_files}
-        
+        index = get_receipt_index(hass)
+        if index is None:
+            return {"pdf_files": [], "receipts": [], "total": 0}
+
+        receipts, total = await hass.async_add_executor_job(
+            index.query,
+            call.data.get("entity_id"),
+            call.data.get("start_date"),
+            call.data.get("end_date"),
+            call.data.get("limit"),
+            call.data.get("offset", 0),
+            call.data.get("include_archived", False),
+        )
+
+        pdf_files = [receipt["filename"] for receipt in receipts]
+        _LOGGER.debug(f"Found {total} PDF files, returning {len(pdf_files)}: {pdf_files}")
+        return {"pdf_files": pdf_files, "receipts": receipts, "total": total}
+
     except Exception as e:
         _LOGGER.error(f"Error listing PDF files: {e}")
-        return {"pdf_files": []}
-
+        return {"pdf_files": [], "receipts": [], "total": 0}
 
 
+@callback
+def _async_handle_apply_retention_service(hass: HomeAssistant, entry: ConfigEntry, call: ServiceCall) -> dict:
+    """Handle the apply_retention service call, returning the ID of the queued job."""
+    hot_months = call.data.get(
+        "hot_months", entry.options.get(CONF_RETENTION_HOT_MONTHS, DEFAULT_RETENTION_HOT_MONTHS)
+    )
+    delete_months = call.data.get(
+        "delete_months", entry.options.get(CONF_RETENTION_DELETE_MONTHS, DEFAULT_RETENTION_DELETE_MONTHS)
+    )
+    if delete_months and delete_months <= hot_months:
+        raise ServiceValidationError("delete_months must be more than hot_months, or 0 to never delete")
+    job = async_submit_retention(hass, hot_months, delete_months)
+    return {"job_id": job.id}
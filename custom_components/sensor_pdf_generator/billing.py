@@ -0,0 +1,34 @@
+"""Bills printed on the receipts, kept apart from the rendering stack and the tariff engine so they import cheaply."""
+
+# The standard tariff, billed to meters without a configured tariff
+DEFAULT_TARIFF_NAME = "standard"
+DEFAULT_FIXED_CHARGE = 385000
+DEFAULT_ENERGY_RATE = 32790
+
+# Charges are rounded to this many decimals
+BILL_PRECISION = 2
+
+
+def get_bill(tariff_name: str, fixed_charge: float, energy_used: float, energy_charge: float, energy_rate: float = None) -> dict:
+    """Return the bill of one meter for a period.
+
+    energy_rate is the rate printed per kWh, by default the average rate of
+    the energy charge.
+    """
+    energy_charge = round(float(energy_charge), BILL_PRECISION)
+    if energy_rate is None:
+        energy_rate = round(energy_charge / energy_used, BILL_PRECISION) if energy_used else 0
+    return {
+        "tariff": tariff_name,
+        "fixed_charge": fixed_charge,
+        "energy_rate": energy_rate,
+        "energy_charge": energy_charge,
+        "total_cost": round(energy_charge + fixed_charge, BILL_PRECISION),
+    }
+
+
+def get_default_bill(energy_used: float) -> dict:
+    """Return the bill of one meter for a period under the standard tariff."""
+    return get_bill(
+        DEFAULT_TARIFF_NAME, DEFAULT_FIXED_CHARGE, energy_used, energy_used * DEFAULT_ENERGY_RATE, DEFAULT_ENERGY_RATE
+    )
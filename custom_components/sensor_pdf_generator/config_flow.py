@@ -3,11 +3,30 @@ import logging
 
 from homeassistant import config_entries
 from homeassistant.core import callback
+from homeassistant.helpers import selector
+import voluptuous as vol
 
-_LOGGER = logging.getLogger(__name__)
+from .const import (
+    CONF_LOOKUP_HORIZON_DAYS,
+    CONF_MAX_QUERIES_PER_SECOND,
+    CONF_PREWARM_RENDER,
+    CONF_RETENTION_DELETE_MONTHS,
+    CONF_RETENTION_ENABLED,
+    CONF_RETENTION_HOT_MONTHS,
+    CONF_SCHEDULE_ENABLED,
+    CONF_SCHEDULE_ENTITY_IDS,
+    CONF_SCHEDULE_HOUR,
+    CONF_TARIFFS,
+    DEFAULT_LOOKUP_HORIZON_DAYS,
+    DEFAULT_MAX_QUERIES_PER_SECOND,
+    DEFAULT_RETENTION_DELETE_MONTHS,
+    DEFAULT_RETENTION_HOT_MONTHS,
+    DEFAULT_SCHEDULE_HOUR,
+    DOMAIN,
+)
+from .tariff import TARIFFS_SCHEMA
 
-# This is the domain of your integration
-DOMAIN = "sensor_pdf_generator"
+_LOGGER = logging.getLogger(__name__)
 
 class SensorPdfGeneratorConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Sensor PDF Generator."""
@@ -44,3 +63,68 @@ class SensorPdfGeneratorConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """Return current entries for this domain."""
         return self.hass.config_entries.async_entries(DOMAIN)
 
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Return the options flow."""
+        return SensorPdfGeneratorOptionsFlow()
+
+
+class SensorPdfGeneratorOptionsFlow(config_entries.OptionsFlow):
+    """Handle the options of Sensor PDF Generator."""
+
+    async def async_step_init(self, user_input=None):
+        """Set up the automatic generation of last month's receipts, the reading lookups, the tariffs and the retention of old receipts."""
+        errors = {}
+        if user_input is not None:
+            try:
+                user_input[CONF_TARIFFS] = TARIFFS_SCHEMA(user_input.get(CONF_TARIFFS) or [])
+            except vol.Invalid as e:
+                _LOGGER.warning(f"Invalid tariffs: {e}")
+                errors[CONF_TARIFFS] = "invalid_tariffs"
+            delete_months = user_input.get(CONF_RETENTION_DELETE_MONTHS, DEFAULT_RETENTION_DELETE_MONTHS)
+            if delete_months and delete_months <= user_input.get(CONF_RETENTION_HOT_MONTHS, DEFAULT_RETENTION_HOT_MONTHS):
+                errors[CONF_RETENTION_DELETE_MONTHS] = "invalid_retention"
+            if not errors:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = {**self.config_entry.options, **(user_input or {})}
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema({
+                vol.Optional(CONF_SCHEDULE_ENABLED, default=options.get(CONF_SCHEDULE_ENABLED, False)): bool,
+                # Every breaker the panel lists when left empty
+                vol.Optional(CONF_SCHEDULE_ENTITY_IDS, default=options.get(CONF_SCHEDULE_ENTITY_IDS, [])): selector.EntitySelector(
+                    selector.EntitySelectorConfig(domain="sensor", multiple=True)
+                ),
+                vol.Optional(CONF_SCHEDULE_HOUR, default=options.get(CONF_SCHEDULE_HOUR, DEFAULT_SCHEDULE_HOUR)): vol.All(
+                    vol.Coerce(int), vol.Range(min=0, max=23)
+                ),
+                vol.Optional(
+                    CONF_MAX_QUERIES_PER_SECOND,
+                    default=options.get(CONF_MAX_QUERIES_PER_SECOND, DEFAULT_MAX_QUERIES_PER_SECOND),
+                ): vol.All(vol.Coerce(float), vol.Range(min=0.1, max=100)),
+                # How far back to look for the last reading of a meter that went quiet
+                vol.Optional(
+                    CONF_LOOKUP_HORIZON_DAYS,
+                    default=options.get(CONF_LOOKUP_HORIZON_DAYS, DEFAULT_LOOKUP_HORIZON_DAYS),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=3650)),
+                # Load the renderer in the background after startup rather than on the first receipt
+                vol.Optional(CONF_PREWARM_RENDER, default=options.get(CONF_PREWARM_RENDER, False)): bool,
+                # A list of tariffs, see tariff.TARIFF_SCHEMA; meters without one pay the standard rates
+                vol.Optional(CONF_TARIFFS, default=options.get(CONF_TARIFFS, [])): selector.ObjectSelector(),
+                # Keep the receipts of the last hot months as files, roll older ones into monthly
+                # archives and delete them after the deletion horizon, never when it is 0
+                vol.Optional(CONF_RETENTION_ENABLED, default=options.get(CONF_RETENTION_ENABLED, False)): bool,
+                vol.Optional(
+                    CONF_RETENTION_HOT_MONTHS,
+                    default=options.get(CONF_RETENTION_HOT_MONTHS, DEFAULT_RETENTION_HOT_MONTHS),
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=120)),
+                vol.Optional(
+                    CONF_RETENTION_DELETE_MONTHS,
+                    default=options.get(CONF_RETENTION_DELETE_MONTHS, DEFAULT_RETENTION_DELETE_MONTHS),
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=600)),
+            }),
+            errors=errors,
+        )
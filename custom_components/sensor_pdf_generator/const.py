@@ -0,0 +1,99 @@
+"""Constants for the Sensor PDF Generator integration."""
+
+DOMAIN = "sensor_pdf_generator"
+
+# Defaults for the multi-meter generation pipeline
+DEFAULT_FETCH_BATCH_SIZE = 50
+DEFAULT_FETCH_CONCURRENCY = 2
+DEFAULT_RENDER_CONCURRENCY = 4
+
+# Where receipts are rendered: the shared Home Assistant executor or a dedicated process pool
+RENDER_BACKEND_THREAD = "thread"
+RENDER_BACKEND_PROCESS = "process"
+DEFAULT_RENDER_WORKERS = 2
+
+# Bump whenever the receipt layout or its texts change, so cached receipts are rendered again
+TEMPLATE_VERSION = 1
+
+# Optional grouping of the pages of a receipt bundle
+BUNDLE_GROUP_NONE = "none"
+BUNDLE_GROUP_AREA = "area"
+BUNDLE_GROUP_FLOOR = "floor"
+BUNDLE_UNGROUPED = "Unassigned"
+
+# Background generation jobs run one at a time per priority, so interactive ones
+# never wait behind scheduled bulk runs
+JOB_PRIORITY_INTERACTIVE = "interactive"
+JOB_PRIORITY_BULK = "bulk"
+JOB_PRIORITIES = (JOB_PRIORITY_INTERACTIVE, JOB_PRIORITY_BULK)
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+EVENT_JOB_PROGRESS = "pdf_generator_progress"
+JOB_PROGRESS_INTERVAL = 1.0  # Seconds between progress updates of a job
+MAX_FINISHED_JOBS = 50
+
+# Breakers billed by the integration: Tuya meters of one model exposing these sensors
+METER_MANUFACTURER = "Tuya"
+METER_MODEL_ID = "vylye9wwllb1av7a"
+METER_SENSOR_TYPES = ("phase_a_current", "phase_a_power", "phase_a_voltage", "total_energy")
+METER_REQUIRED_SENSOR_TYPES = ("phase_a_current", "total_energy")
+
+# Automatic generation of last month's receipts, set in the integration's options
+CONF_SCHEDULE_ENABLED = "schedule_enabled"
+CONF_SCHEDULE_ENTITY_IDS = "schedule_entity_ids"  # Every indexed meter when empty
+CONF_SCHEDULE_HOUR = "schedule_hour"
+CONF_MAX_QUERIES_PER_SECOND = "max_queries_per_second"
+DEFAULT_SCHEDULE_HOUR = 6  # After the recorder's nightly purge
+DEFAULT_MAX_QUERIES_PER_SECOND = 2.0
+SCHEDULE_JOB_SIZE = 100  # Meters per queued job, progress is saved after each one
+SCHEDULE_FILENAME_PREFIX = "monthly_report"
+
+# How many days a meter reading lookup may look back for the last known state
+CONF_LOOKUP_HORIZON_DAYS = "lookup_horizon_days"
+DEFAULT_LOOKUP_HORIZON_DAYS = 30
+
+# Tariffs billing the meters, by entity, area or floor, instead of the standard rates
+CONF_TARIFFS = "tariffs"
+
+# Load the rendering stack in the background once Home Assistant has started,
+# instead of on the first receipt
+CONF_PREWARM_RENDER = "prewarm_render"
+
+# Generation timings are published as rolling percentiles of the last
+# METRICS_WINDOW samples per stage, and sensors update at most this often
+METRICS_WINDOW = 500
+METRICS_UPDATE_INTERVAL = 10  # Seconds
+
+# Billing ledgers export the values of every receipt, one row per meter and period,
+# and are written out every LEDGER_FLUSH_ROWS rows
+LEDGER_FORMAT_CSV = "csv"
+LEDGER_FORMAT_JSONL = "jsonl"
+LEDGER_FORMATS = (LEDGER_FORMAT_CSV, LEDGER_FORMAT_JSONL)
+LEDGER_FLUSH_ROWS = 100
+LEDGER_FILENAME_PREFIX = "ledger"
+
+# Receipts, ledgers and their archives are kept in <config>/sensor_pdf_generator/receipts,
+# outside www so they are only served through the authenticated views. Those found
+# in www/receipts, where earlier releases wrote them, are moved there
+RECEIPTS_DIR = "receipts"
+LEGACY_RECEIPTS_DIR = ("www", "receipts")
+
+# Receipts and ledgers are downloaded through the integration's authenticated views,
+# and zip archives of many are streamed this many bytes at a time
+DOWNLOAD_EXTENSIONS = (".pdf", ".csv", ".jsonl")
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Retention of the receipts folder, set in the integration's options: receipts of the
+# last hot months stay files, older ones are rolled into one zip archive per month in
+# its archive folder, and receipts older than the deletion horizon are removed
+CONF_RETENTION_ENABLED = "retention_enabled"
+CONF_RETENTION_HOT_MONTHS = "retention_hot_months"
+CONF_RETENTION_DELETE_MONTHS = "retention_delete_months"  # Never deleted when 0
+DEFAULT_RETENTION_HOT_MONTHS = 12
+DEFAULT_RETENTION_DELETE_MONTHS = 0
+RETENTION_HOUR = 3  # Daily, before the scheduled receipts
+RETENTION_ARCHIVE_DIR = "archive"
+RETENTION_ARCHIVE_PREFIX = "receipts"
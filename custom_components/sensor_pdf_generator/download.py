@@ -0,0 +1,260 @@
+"""Authenticated downloads of single receipts and of zip archives of many."""
+import asyncio
+import logging
+import os
+import shutil
+import zipfile
+
+from aiohttp import web
+from homeassistant.components.http import KEY_HASS, HomeAssistantView
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import floor_registry as fr
+
+from .const import BUNDLE_GROUP_FLOOR, DOMAIN, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_EXTENSIONS
+from .generator import get_meter_group
+from .jobs import get_job_queue
+from .receipt_index import get_receipt_index, get_receipts_dir
+
+_LOGGER = logging.getLogger(__name__)
+
+URL_RECEIPT = f"/api/{DOMAIN}/receipts/{{filename}}"
+URL_ARCHIVE = f"/api/{DOMAIN}/receipts.zip"
+
+# Receipts can be rendered again under the same name, so clients revalidate them by ETag
+CACHE_CONTROL = "private, no-cache"
+
+
+@callback
+def async_register_views(hass: HomeAssistant) -> None:
+    """Register the download views."""
+    hass.http.register_view(ReceiptView())
+    hass.http.register_view(ReceiptArchiveView())
+
+
+def _get_receipt_path(hass: HomeAssistant, filename: str):
+    """Return the path of a receipt or ledger in the receipts folder, or None for any other name."""
+    if (
+        not filename
+        or os.path.basename(filename) != filename
+        or filename.startswith(".")
+        or not filename.lower().endswith(DOWNLOAD_EXTENSIONS)
+    ):
+        return None
+    return os.path.join(get_receipts_dir(hass), filename)
+
+
+class ReceiptView(HomeAssistantView):
+    """Serve one receipt or ledger, with ETag revalidation and range requests."""
+
+    url = URL_RECEIPT
+    name = f"api:{DOMAIN}:receipt"
+    requires_auth = True
+
+    async def get(self, request: web.Request, filename: str) -> web.StreamResponse:
+        """Return the file, or 304 if the client's copy is current."""
+        hass = request.app[KEY_HASS]
+        path = _get_receipt_path(hass, filename)
+        if path is None:
+            raise web.HTTPNotFound()
+        headers = {
+            "Cache-Control": CACHE_CONTROL,
+            "Content-Disposition": f'inline; filename="{filename}"',
+        }
+        if await hass.async_add_executor_job(os.path.isfile, path):
+            # FileResponse sets the ETag and Last-Modified, answers conditional
+            # requests and serves byte ranges without reading the whole file
+            return web.FileResponse(path, chunk_size=DOWNLOAD_CHUNK_SIZE, headers=headers)
+
+        archive_paths = await _async_get_archive_paths(hass, [filename])
+        if filename not in archive_paths:
+            raise web.HTTPNotFound()
+        try:
+            body, etag = await hass.async_add_executor_job(_read_archived, archive_paths[filename], filename)
+        except (FileNotFoundError, KeyError):
+            raise web.HTTPNotFound()
+        # An archived receipt is small and never changes, so it is served whole
+        headers["ETag"] = etag
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/pdf", headers=headers)
+
+
+def _read_archived(archive_path: str, filename: str) -> tuple:
+    """Return the contents of a receipt in an archive and an ETag from its checksum and size."""
+    with zipfile.ZipFile(archive_path) as archive:
+        info = archive.getinfo(filename)
+        return archive.read(info), f'"{info.CRC:08x}-{info.file_size:x}"'
+
+
+async def _async_get_archive_paths(hass: HomeAssistant, filenames: list) -> dict:
+    """Return the path of the archive holding each of filenames that the retention policy archived."""
+    index = get_receipt_index(hass)
+    if index is None:
+        return {}
+    archives = await hass.async_add_executor_job(index.archived, filenames)
+    return {filename: os.path.join(index.archive_dir, archive) for filename, archive in archives.items()}
+
+
+class _ResponseWriter:
+    """A write-only file for zipfile that streams to an HTTP response from an executor thread.
+
+    Writes are buffered up to DOWNLOAD_CHUNK_SIZE and each full chunk waits
+    until the event loop has sent it, so a slow client holds back the
+    archive instead of it piling up in memory.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, response: web.StreamResponse) -> None:
+        """Create a writer for a prepared response."""
+        self._loop = loop
+        self._response = response
+        self._buffer = bytearray()
+        self.closed = False
+
+    def write(self, data) -> int:
+        """Buffer data, sending the buffer once it holds a chunk."""
+        self._buffer += data
+        if len(self._buffer) >= DOWNLOAD_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self) -> None:
+        """Send the buffered data and wait until it is written."""
+        if self.closed:
+            raise ConnectionResetError("Receipt archive download was closed")
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            asyncio.run_coroutine_threadsafe(self._response.write(data), self._loop).result()
+
+
+def _write_archive(writer: _ResponseWriter, receipts_dir: str, filenames: list, compression: int, archive_paths: dict) -> int:
+    """Write the files to a zip archive on writer, skipping files removed since they were listed.
+
+    Receipts in archive_paths are copied out of their monthly archive. The
+    output cannot seek, so every member's sizes and checksum follow its
+    data. Returns the number of files written.
+    """
+    count = 0
+    with zipfile.ZipFile(writer, "w", compression=compression) as archive:
+        for filename in filenames:
+            try:
+                if filename in archive_paths:
+                    with zipfile.ZipFile(archive_paths[filename]) as source_archive:
+                        info = source_archive.getinfo(filename)
+                        member = zipfile.ZipInfo(filename, info.date_time)
+                        member.compress_type = compression
+                        with source_archive.open(info) as source, archive.open(member, "w") as target:
+                            shutil.copyfileobj(source, target, DOWNLOAD_CHUNK_SIZE)
+                else:
+                    archive.write(os.path.join(receipts_dir, filename), filename)
+            except (FileNotFoundError, KeyError):
+                continue
+            count += 1
+    writer.flush()
+    return count
+
+
+class ReceiptArchiveView(HomeAssistantView):
+    """Stream a zip archive of the receipts of a job or of a filter, archived ones included.
+
+    Query parameters, all optional but at least one required:
+    job_id, a generation job whose files are archived; start_date and
+    end_date (YYYY-MM-DD), receipts whose billing period overlaps them;
+    floor, receipts holding a meter on that floor, by name or ID; and
+    entity_id, receipts holding any of the given meters, repeated or comma
+    separated. store=true stores the members as they are instead of
+    compressing them again, which PDFs, already compressed, barely need.
+    """
+
+    url = URL_ARCHIVE
+    name = f"api:{DOMAIN}:receipts_archive"
+    requires_auth = True
+
+    async def get(self, request: web.Request) -> web.StreamResponse:
+        """Stream the archive."""
+        hass = request.app[KEY_HASS]
+        filenames = await _async_get_archive_filenames(hass, request.query)
+        if not filenames:
+            raise web.HTTPNotFound(text="No receipts match")
+        compression = zipfile.ZIP_STORED if request.query.get("store", "").lower() in ("1", "true", "yes") else zipfile.ZIP_DEFLATED
+        archive_paths = await _async_get_archive_paths(hass, filenames)
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "application/zip",
+            "Content-Disposition": 'attachment; filename="receipts.zip"',
+            "Cache-Control": "no-store",
+        })
+        await response.prepare(request)
+        writer = _ResponseWriter(hass.loop, response)
+        try:
+            count = await hass.async_add_executor_job(
+                _write_archive, writer, get_receipts_dir(hass), filenames, compression, archive_paths
+            )
+        except ConnectionResetError:
+            # The status is already sent, so the client only sees the archive end early
+            _LOGGER.debug("Receipt archive download ended by the client")
+            return response
+        except Exception as e:
+            _LOGGER.error(f"Error streaming receipt archive: {e}")
+            return response
+        finally:
+            writer.closed = True
+        _LOGGER.debug(f"Streamed {count} receipts in an archive")
+        await response.write_eof()
+        return response
+
+
+async def _async_get_archive_filenames(hass: HomeAssistant, query) -> list:
+    """Return the sorted filenames an archive request selects.
+
+    Raises HTTPBadRequest without any filter and HTTPNotFound for an unknown job.
+    """
+    job_id = query.get("job_id")
+    start_date = query.get("start_date")
+    end_date = query.get("end_date")
+    floor = query.get("floor")
+    entity_ids = {
+        entity_id.strip()
+        for value in query.getall("entity_id", [])
+        for entity_id in value.split(",")
+        if entity_id.strip()
+    }
+    if not (job_id or start_date or end_date or floor or entity_ids):
+        raise web.HTTPBadRequest(text="Select receipts by job_id, start_date, end_date, floor or entity_id")
+
+    job_files = None
+    if job_id:
+        queue = get_job_queue(hass)
+        job = queue.async_get(job_id) if queue is not None else None
+        if job is None or not job.result:
+            raise web.HTTPNotFound(text=f"No finished job {job_id}")
+        job_files = {file_info["filename"] for file_info in job.result["generated_files"]}
+        if job.result.get("ledger"):
+            job_files.add(job.result["ledger"])
+
+    meters = entity_ids or None
+    if job_files is not None and not (start_date or end_date or floor or meters):
+        # Every file of the job, including its ledger, which is not indexed like its receipts
+        return sorted(filename for filename in job_files if _get_receipt_path(hass, filename))
+
+    index = get_receipt_index(hass)
+    if index is None:
+        raise web.HTTPNotFound(text="Sensor PDF Generator is not set up")
+    files = await hass.async_add_executor_job(index.files, start_date, end_date)
+
+    if floor:
+        floor_entry = fr.async_get(hass).async_get_floor(floor)
+        floor_name = floor_entry.name if floor_entry else floor
+        floor_meters = {
+            entity_id
+            for file_entity_ids in files.values()
+            for entity_id in file_entity_ids
+            if get_meter_group(hass, entity_id, BUNDLE_GROUP_FLOOR) == floor_name
+        }
+        meters = floor_meters if meters is None else meters & floor_meters
+
+    filenames = set(files)
+    if meters is not None:
+        filenames = {filename for filename in filenames if files[filename] & meters}
+    if job_files is not None:
+        filenames &= job_files
+    return sorted(filename for filename in filenames if _get_receipt_path(hass, filename))
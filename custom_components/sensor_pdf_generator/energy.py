@@ -0,0 +1,557 @@
+"""Recorder lookups for energy meter readings."""
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from functools import partial
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
+from homeassistant.util import dt as dt_util
+
+from .const import DEFAULT_LOOKUP_HORIZON_DAYS, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# How far back to look for the newest hourly statistics row before a boundary.
+# Total increasing sensors get a row every hour, so a few hours is plenty and
+# keeps the lookup to a handful of indexed rows per meter.
+STATISTICS_LOOKBACK = timedelta(hours=3)
+
+# Throttled reads wait while the recorder has more than this many tasks queued,
+# checking again after a delay that doubles up to RECORDER_BACKOFF_MAX seconds
+RECORDER_BACKLOG_THRESHOLD = 100
+RECORDER_BACKOFF_MIN = 1.0
+RECORDER_BACKOFF_MAX = 60.0
+
+# Like the recorder's own statistics, a meter reading that drops below this
+# share of the previous one is a reset or a replaced meter, and smaller dips
+# are jitter that is ignored
+RESET_RATIO = 0.9
+
+# Raw states are streamed for consumption one window at a time, so memory
+# stays bounded by the window rather than the period
+CONSUMPTION_WINDOW = timedelta(days=1)
+
+# Recorder timestamps are kept to the microsecond
+STATE_PRECISION = timedelta(microseconds=1)
+
+# A state lookup that finds no number right before a boundary looks back in
+# windows growing from LOOKUP_INITIAL_WINDOW, as far as the lookup horizon
+LOOKUP_INITIAL_WINDOW = timedelta(days=1)
+LOOKUP_WINDOW_GROWTH = 4
+DATA_LOOKUP_HORIZON = "lookup_horizon_days"
+
+def get_hass_timezone(hass) -> tzinfo:
+    """Return the configured time zone as a zoneinfo zone.
+
+    Home Assistant loads this zone when its configuration is read, so looking
+    it up again comes from dt_util's cache and never touches the disk.
+    """
+    return dt_util.get_time_zone(hass.config.time_zone) or dt_util.get_default_time_zone()
+
+def get_period_end(end_date: datetime) -> datetime:
+    """Return when a billing period whose last day is end_date ends, midnight at the end of that day.
+
+    Periods are given by their first and last day and both are billed in
+    full, so consecutive periods meet at midnight on the first day of the
+    next one.
+    """
+    return end_date + timedelta(days=1)
+
+def _localize(hass, when: datetime) -> datetime:
+    """Return 'when' as an aware datetime, treating naive values as local time."""
+    tz = get_hass_timezone(hass)
+    return when.astimezone(tz) if when.tzinfo else when.replace(tzinfo=tz)
+
+def _get_significant_states(*args, **kwargs) -> dict:
+    """Read raw states from the recorder, importing its history module on first use.
+
+    This runs in the recorder's executor, so the import is kept off both the
+    event loop and the integration's load.
+    """
+    from homeassistant.components.recorder.history import get_significant_states
+    return get_significant_states(*args, **kwargs)
+
+class RecorderThrottle:
+    """Spread recorder reads out for bulk runs.
+
+    Reads are let through at most max_per_second times a second, and not at
+    all while the recorder is busy writing its queue, e.g. during the
+    nightly purge.
+    """
+
+    def __init__(self, hass, max_per_second: float) -> None:
+        """Create a throttle allowing max_per_second reads."""
+        self._hass = hass
+        self._interval = 1 / max_per_second
+        self._next = 0.0
+
+    async def async_wait(self) -> None:
+        """Wait until the next recorder read may run."""
+        backoff = RECORDER_BACKOFF_MIN
+        while get_instance(self._hass).backlog > RECORDER_BACKLOG_THRESHOLD:
+            _LOGGER.debug(f"Recorder backlog is {get_instance(self._hass).backlog}, waiting {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RECORDER_BACKOFF_MAX)
+
+        # Reserve the slot before sleeping so concurrent readers queue up behind it
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self._interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+async def _async_get_last_state_values(hass, entity_ids: list, start: datetime, when: datetime, include_start_time_state: bool) -> dict:
+    """Return the newest numeric state value at or before 'when' for each entity.
+
+    Only states newer than 'start' are read unless include_start_time_state is
+    set, in which case the recorder also returns the newest state before it.
+    States that are not numbers, such as unavailable, are passed over.
+    """
+    values = dict.fromkeys(entity_ids)
+    if not entity_ids:
+        return values
+
+    # The one second past 'when' only picks up states written exactly at 'when'
+    states = await get_instance(hass).async_add_executor_job(
+        partial(
+            _get_significant_states,
+            hass,
+            start,
+            when + timedelta(seconds=1),
+            entity_ids,
+            include_start_time_state=include_start_time_state,
+            significant_changes_only=False,
+            no_attributes=True,
+        )
+    )
+
+    # Recorder states are in UTC, so converting 'when' once avoids any per-row conversion
+    when = when.astimezone(timezone.utc)
+    for entity_id in entity_ids:
+        # Newest first, so only the states after the value found are looked at
+        for state in reversed(states.get(entity_id, [])):
+            if state.last_updated > when:
+                continue
+            try:
+                value = float(state.state)
+            except ValueError:
+                continue
+            if math.isfinite(value):
+                values[entity_id] = value
+                _LOGGER.debug(f"Found energy value {value} for {entity_id} at {state.last_updated}")
+                break
+
+    return values
+
+def get_lookup_horizon(hass) -> timedelta:
+    """Return how far back a state lookup may go, as set in the integration's options."""
+    return timedelta(days=hass.data.get(DOMAIN, {}).get(DATA_LOOKUP_HORIZON, DEFAULT_LOOKUP_HORIZON_DAYS))
+
+async def _async_get_values_before(hass, entity_ids: list, when: datetime) -> dict:
+    """Return the newest numeric state value at or before 'when', looking back up to the lookup horizon.
+
+    The recorder is first asked for just the newest state before 'when' of
+    each entity. Entities without one, or whose newest state is not a
+    number, are then looked up in windows further back, each
+    LOOKUP_WINDOW_GROWTH times as long as the one before, until a value is
+    found or the horizon is reached. Chatty meters are resolved by the first
+    query and idle ones cost a few more, without reading days of states.
+    """
+    values = await _async_get_last_state_values(hass, entity_ids, when, when, True)
+    oldest = when - get_lookup_horizon(hass)
+    window = LOOKUP_INITIAL_WINDOW
+    window_end = when
+    missing = [entity_id for entity_id, value in values.items() if value is None]
+    while missing and window_end > oldest:
+        window_start = max(when - window, oldest)
+        _LOGGER.debug(f"No numeric state for {missing} at {when}, looking back to {window_start}")
+        found = await _async_get_last_state_values(hass, missing, window_start, window_end, False)
+        values.update({entity_id: value for entity_id, value in found.items() if value is not None})
+        missing = [entity_id for entity_id in missing if values[entity_id] is None]
+        window_end = window_start
+        window *= LOOKUP_WINDOW_GROWTH
+    return values
+
+async def _async_get_hourly_statistics(hass, entity_ids: list, hour: datetime) -> dict:
+    """Return the newest hourly statistics row ending at or before 'hour' for each entity.
+
+    Entities without long-term statistics, or whose rows carry no 'state'
+    (measurement sensors), are left out of the result.
+    """
+    rows = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        hour - STATISTICS_LOOKBACK,
+        hour,
+        set(entity_ids),
+        "hour",
+        None,
+        {"state", "sum"},
+    )
+
+    result = {}
+    for entity_id, entity_rows in rows.items():
+        if entity_rows and entity_rows[-1].get("state") is not None:
+            result[entity_id] = entity_rows[-1]
+    return result
+
+async def get_readings_at_times(hass, entity_ids, when: datetime) -> dict:
+    """Return each meter's reading at the given datetime.
+
+    A reading is a dict with the meter 'state' and, when it came from long-term
+    statistics, the cumulative 'sum' the recorder tracks across meter resets.
+    Meters without a usable value map to None.
+
+    Long-term statistics are the fast path: the newest hourly row before the
+    boundary gives the reading at the top of the hour, and raw states are only
+    read for the partial hour between that and 'when'. Meters without
+    statistics fall back to a raw state lookup, which looks further back, up
+    to the lookup horizon, for meters with no recent numeric state.
+    """
+    when = _localize(hass, when)
+
+    # Preserve order but drop duplicates so the IN clauses stay small
+    entity_ids = list(dict.fromkeys(entity_ids))
+    readings = dict.fromkeys(entity_ids)
+    if not entity_ids:
+        return readings
+
+    hour = when.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    statistics = await _async_get_hourly_statistics(hass, entity_ids, hour)
+
+    for entity_id, row in statistics.items():
+        readings[entity_id] = {"state": row["state"], "sum": row.get("sum")}
+
+    # Raw states are only needed for the partial hour at the period edge
+    if statistics and when > hour:
+        partial_values = await _async_get_last_state_values(hass, list(statistics), hour, when, False)
+        for entity_id, value in partial_values.items():
+            if value is None:
+                continue
+            reading = readings[entity_id]
+            if reading["sum"] is not None:
+                reading["sum"] += ConsumptionCounter.get_step(reading["state"], value)[0]
+            reading["state"] = value
+
+    missing = [entity_id for entity_id in entity_ids if entity_id not in statistics]
+    if missing:
+        _LOGGER.debug(f"No long-term statistics for {missing}, falling back to raw states")
+        values = await _async_get_values_before(hass, missing, when)
+        for entity_id, value in values.items():
+            if value is None:
+                _LOGGER.warning(f"No valid state found for {entity_id} at {when}")
+                continue
+            readings[entity_id] = {"state": value, "sum": None}
+
+    return readings
+
+async def _async_stream_states(hass, entity_ids: list, start: datetime, end: datetime):
+    """Yield the raw states of the entities from start to end, one CONSUMPTION_WINDOW at a time.
+
+    Each window is a dict of entity_id to its states in time order, and the
+    first also holds each entity's state before start, so the states of a
+    long span are never all loaded at once.
+    """
+    # The recorder leaves out states written exactly at either end of a query, so
+    # each window reaches just past its end and the first starts just before start
+    window_start = start - STATE_PRECISION
+    while True:
+        window_end = min(window_start + CONSUMPTION_WINDOW, end)
+        yield await get_instance(hass).async_add_executor_job(
+            partial(
+                _get_significant_states,
+                hass,
+                window_start,
+                window_end + STATE_PRECISION,
+                entity_ids,
+                include_start_time_state=window_start < start,
+                significant_changes_only=False,
+                no_attributes=True,
+            )
+        )
+        if window_end == end:
+            break
+        window_start = window_end
+
+async def _async_get_state_values_at(hass, entity_ids: list, whens: list) -> dict:
+    """Return {when: {entity_id: value}} for sorted aware datetimes from one pass over raw states."""
+    values = {when: dict.fromkeys(entity_ids) for when in whens}
+    last_values = dict.fromkeys(entity_ids)
+    indexes = dict.fromkeys(entity_ids, 0)
+
+    # Recorder states are in UTC, so the boundaries are converted once
+    whens_utc = [when.astimezone(timezone.utc) for when in whens]
+    async for states in _async_stream_states(hass, entity_ids, whens[0], whens[-1]):
+        for entity_id, entity_states in states.items():
+            if entity_id not in indexes:
+                continue
+            index = indexes[entity_id]
+            last_value = last_values[entity_id]
+            for state in entity_states:
+                # Both lists are in time order, so each state is looked at once
+                while index < len(whens) and state.last_updated > whens_utc[index]:
+                    values[whens[index]][entity_id] = last_value
+                    index += 1
+                try:
+                    value = float(state.state)
+                except ValueError:
+                    continue
+                if math.isfinite(value):
+                    last_value = value
+            indexes[entity_id] = index
+            last_values[entity_id] = last_value
+
+    # The boundaries after each entity's last state hold its last value
+    for entity_id, index in indexes.items():
+        for when in whens[index:]:
+            values[when][entity_id] = last_values[entity_id]
+    return values
+
+async def get_readings_at_boundaries(hass, entity_ids, boundaries: list) -> dict:
+    """Return each meter's reading at every boundary, as {boundary: {entity_id: reading}}.
+
+    Boundaries at local midnight are all read in one pass over the daily
+    long-term statistics: the row of the day before a boundary holds the
+    state and sum at the end of its last hour, which is the reading at the
+    boundary. Meters without daily statistics are read in one pass over raw
+    states instead, and any other gaps fall back to get_readings_at_times,
+    which looks further back for meters without a recent state.
+    """
+    tz = get_hass_timezone(hass)
+    entity_ids = list(dict.fromkeys(entity_ids))
+    boundaries = list(dict.fromkeys(boundaries))
+    readings = {when: dict.fromkeys(entity_ids) for when in boundaries}
+    if not entity_ids or not boundaries:
+        return readings
+
+    local = {when: _localize(hass, when) for when in boundaries}
+    # The start of the day before each midnight boundary, in time order
+    days = sorted(
+        (datetime.combine(local_when.date() - timedelta(days=1), datetime.min.time(), tzinfo=tz), when)
+        for when, local_when in local.items()
+        if local_when.time() == datetime.min.time()
+    )
+
+    with_statistics = set()
+    if days:
+        rows = await get_instance(hass).async_add_executor_job(
+            statistics_during_period,
+            hass,
+            days[0][0],
+            max(local.values()),
+            set(entity_ids),
+            "day",
+            None,
+            {"state", "sum"},
+        )
+        day_starts = [day.timestamp() for day, _ in days]
+        for entity_id, entity_rows in rows.items():
+            with_statistics.add(entity_id)
+            index = 0
+            for row in entity_rows:
+                start = row["start"]
+                if isinstance(start, datetime):
+                    start = start.timestamp()
+                while index < len(days) and day_starts[index] < start:
+                    index += 1
+                if index == len(days):
+                    break
+                if day_starts[index] == start and row.get("state") is not None:
+                    readings[days[index][1]][entity_id] = {"state": row["state"], "sum": row.get("sum")}
+
+    without_statistics = [entity_id for entity_id in entity_ids if entity_id not in with_statistics]
+    if without_statistics:
+        _LOGGER.debug(f"No daily statistics for {without_statistics}, reading raw states")
+        whens = sorted(local.values())
+        values = await _async_get_state_values_at(hass, without_statistics, whens)
+        for when, local_when in local.items():
+            for entity_id, value in values[local_when].items():
+                if value is not None:
+                    readings[when][entity_id] = {"state": value, "sum": None}
+
+    for when in boundaries:
+        missing = [entity_id for entity_id in entity_ids if readings[when][entity_id] is None]
+        if missing:
+            readings[when].update(await get_readings_at_times(hass, missing, when))
+    return readings
+
+class ConsumptionCounter:
+    """Consumption of a cumulative meter, fed its values in time order in constant memory.
+
+    Rises are consumption. A drop below RESET_RATIO of the previous value is
+    a reset or a replaced meter, which counts up from zero again, so its new
+    value is consumption too. Smaller dips are ignored. Values that are not
+    numbers, such as unavailable or unknown, are skipped, and the next number
+    continues from the last one before the gap.
+    """
+
+    __slots__ = ("last", "total")
+
+    def __init__(self) -> None:
+        """Start counting from the first value added."""
+        self.last = None
+        self.total = 0.0
+
+    @staticmethod
+    def get_step(last: float, value: float) -> tuple:
+        """Return the consumption from last to value and the value to continue from."""
+        if value >= last:
+            return value - last, value
+        if value < last * RESET_RATIO:
+            return value, value
+        return 0.0, last
+
+    def add(self, value) -> None:
+        """Count one state value."""
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return
+        if not math.isfinite(value):
+            return
+        if self.last is None:
+            self.last = value
+            return
+        step, self.last = self.get_step(self.last, value)
+        self.total += step
+
+async def get_consumption(hass, entity_ids, start: datetime, end: datetime) -> dict:
+    """Return each meter's consumption from start to end from its raw states, or None without states.
+
+    The states are streamed in time order one CONSUMPTION_WINDOW at a time
+    through a ConsumptionCounter per meter, so resets, replaced meters and
+    unavailable gaps inside the period are counted correctly.
+    """
+    return (await get_period_consumption(hass, entity_ids, [(start, end)]))[(start, end)]
+
+async def get_period_consumption(hass, entity_ids, periods: list) -> dict:
+    """Return each meter's consumption in every (start, end) period, as {(start, end): {entity_id: consumption}}.
+
+    The states from the earliest start to the latest end are streamed once
+    through a ConsumptionCounter per meter, whose running total is noted at
+    every period boundary, so many periods cost one pass. A meter without a
+    state by the end of a period has None for it.
+    """
+    entity_ids = list(dict.fromkeys(entity_ids))
+    if not entity_ids or not periods:
+        return {period: {} for period in periods}
+
+    local = {when: _localize(hass, when) for period in periods for when in period}
+    whens = sorted(set(local.values()))
+    whens_utc = [when.astimezone(timezone.utc) for when in whens]
+    counters = {entity_id: ConsumptionCounter() for entity_id in entity_ids}
+    indexes = dict.fromkeys(entity_ids, 0)
+    # (total, has a value) of each meter at each boundary
+    totals = {when: {} for when in whens}
+
+    async for states in _async_stream_states(hass, entity_ids, whens[0], whens[-1]):
+        for entity_id, entity_states in states.items():
+            counter = counters.get(entity_id)
+            if counter is None:
+                continue
+            index = indexes[entity_id]
+            for state in entity_states:
+                while index < len(whens) and state.last_updated > whens_utc[index]:
+                    totals[whens[index]][entity_id] = (counter.total, counter.last is not None)
+                    index += 1
+                counter.add(state.state)
+            indexes[entity_id] = index
+
+    for entity_id, index in indexes.items():
+        counter = counters[entity_id]
+        for when in whens[index:]:
+            totals[when][entity_id] = (counter.total, counter.last is not None)
+
+    consumption = {}
+    for start, end in periods:
+        start_totals = totals[local[start]]
+        end_totals = totals[local[end]]
+        consumption[(start, end)] = {
+            entity_id: end_totals[entity_id][0] - start_totals[entity_id][0] if end_totals[entity_id][1] else None
+            for entity_id in entity_ids
+        }
+    return consumption
+
+async def get_hourly_consumption(hass, entity_ids, start: datetime, end: datetime) -> dict:
+    """Return each meter's consumption per hour from start to end, from its hourly long-term statistics.
+
+    The result maps each meter to {hour start timestamp: consumption}. Meters
+    without hourly statistics in the period are left out.
+    """
+    rows = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        _localize(hass, start),
+        _localize(hass, end),
+        set(entity_ids),
+        "hour",
+        None,
+        {"change"},
+    )
+
+    consumption = {}
+    for entity_id, entity_rows in rows.items():
+        hours = {}
+        for row in entity_rows:
+            if row.get("change") is None:
+                continue
+            start_ts = row["start"]
+            if isinstance(start_ts, datetime):
+                start_ts = start_ts.timestamp()
+            hours[start_ts] = row["change"]
+        if hours:
+            consumption[entity_id] = hours
+    return consumption
+
+def needs_consumption(start_reading: dict, end_reading: dict) -> bool:
+    """Return True if the consumption between two readings must be read from raw states.
+
+    Readings from long-term statistics carry the recorder's cumulative sum,
+    which already accounts for resets. Without it on both ends, the states in
+    between have to be streamed.
+    """
+    return (
+        start_reading is not None and end_reading is not None
+        and (start_reading["sum"] is None or end_reading["sum"] is None)
+    )
+
+async def async_calculate_energy_used(hass, entity_id: str, start_reading: dict, end_reading: dict, start: datetime, end: datetime) -> float:
+    """Return the energy consumed between two readings of one meter, streaming its states when needed."""
+    if needs_consumption(start_reading, end_reading):
+        consumption = (await get_consumption(hass, [entity_id], start, end))[entity_id]
+        if consumption is not None:
+            return consumption
+    return calculate_energy_used(start_reading, end_reading)
+
+def calculate_energy_used(start_reading: dict, end_reading: dict) -> float:
+    """Return the energy consumed between two readings.
+
+    When both readings come from long-term statistics the difference of their
+    cumulative sums is used, which stays correct across meter resets.
+    Otherwise the difference of the states can only be clamped at 0 across
+    a reset, so callers stream the states in between with get_consumption
+    first.
+    """
+    if start_reading["sum"] is not None and end_reading["sum"] is not None:
+        energy_used = end_reading["sum"] - start_reading["sum"]
+    else:
+        energy_used = end_reading["state"] - start_reading["state"]
+    if energy_used < 0:
+        energy_used = 0  # Handle meter resets
+    return energy_used
+
+async def get_energy_at_times(hass, entity_ids, when: datetime) -> dict:
+    """Return each sensor's value (as float, or None) at the given datetime."""
+    readings = await get_readings_at_times(hass, entity_ids, when)
+    return {
+        entity_id: reading["state"] if reading else None
+        for entity_id, reading in readings.items()
+    }
+
+async def get_energy_at_time(hass, entity_id: str, when: datetime):
+    """Return the sensor's value (as float) at the given datetime."""
+    values = await get_energy_at_times(hass, [entity_id], when)
+    return values[entity_id]
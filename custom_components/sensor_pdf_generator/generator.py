@@ -0,0 +1,619 @@
+"""Multi-meter receipt generation for the Sensor PDF Generator integration."""
+import asyncio
+import hashlib
+import json
+import logging
+from contextlib import nullcontext
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import area_registry as ar
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers import floor_registry as fr
+
+from .const import (
+    DOMAIN,
+    BUNDLE_GROUP_AREA,
+    BUNDLE_GROUP_FLOOR,
+    BUNDLE_GROUP_NONE,
+    BUNDLE_UNGROUPED,
+    DEFAULT_FETCH_BATCH_SIZE,
+    DEFAULT_FETCH_CONCURRENCY,
+    DEFAULT_RENDER_CONCURRENCY,
+    DEFAULT_RENDER_WORKERS,
+    RENDER_BACKEND_THREAD,
+    TEMPLATE_VERSION,
+)
+from .energy import (
+    RecorderThrottle,
+    calculate_energy_used,
+    get_consumption,
+    get_hass_timezone,
+    get_hourly_consumption,
+    get_period_consumption,
+    get_period_end,
+    needs_consumption,
+)
+from .metrics import (
+    COUNTER_CACHE_HITS,
+    COUNTER_CACHE_MISSES,
+    COUNTER_FAILURES,
+    STAGE_BILL,
+    STAGE_QUERY,
+    STAGE_RESOLVE,
+    async_increment,
+    async_timed,
+)
+from .receipt_index import async_find_cached_receipt, async_index_receipt, async_lock_receipt_file
+from .render_backend import async_render_bundle, async_render_receipt
+from .snapshots import async_get_readings, async_get_readings_at_boundaries
+from .tariff import compute_bills, get_hours, get_tariffs
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_INFLIGHT_READINGS = "inflight_readings"
+DATA_INFLIGHT_RENDERS = "inflight_renders"
+
+async def async_generate_receipts(hass: HomeAssistant, entity_ids: list, filename_prefix: str, start_date: datetime, end_date: datetime, options: dict, progress_callback=None, ledger=None) -> dict:
+    """Generate one receipt per entity, overlapping recorder fetches with rendering.
+
+    Meters are fetched in batches of fetch_batch_size, at most
+    fetch_concurrency at a time and throttled to max_queries_per_second if
+    set, skipping those with readings in options["readings"] and the
+    streamed or hourly consumption of those in options["consumption"] and
+    options["hourly_consumption"]. Each batch is billed as it resolves and its receipts rendered at most
+    render_concurrency at a time, or as pages of one document with the
+    bundle option. Unchanged receipts are reused unless force is set, and
+    work in flight for another request is shared.
+
+    progress_callback(entity_id, result) is called as each meter finishes.
+    Each resolved receipt is added to ledger if given, and with
+    options["ledger_only"] only to it. Returns a dict of entity_id to the
+    generated file info, or None on failure.
+    """
+    fetch_batch_size = options.get("fetch_batch_size", DEFAULT_FETCH_BATCH_SIZE)
+    fetch_semaphore = asyncio.Semaphore(options.get("fetch_concurrency", DEFAULT_FETCH_CONCURRENCY))
+    render_semaphore = asyncio.Semaphore(options.get("render_concurrency", DEFAULT_RENDER_CONCURRENCY))
+    ledger_only = ledger is not None and options.get("ledger_only", False)
+    bundle = options.get("bundle", False) and not ledger_only
+    max_queries_per_second = options.get("max_queries_per_second")
+    throttle = RecorderThrottle(hass, max_queries_per_second) if max_queries_per_second else None
+    prefetched = options.get("readings", {})
+    prefetched_consumption = options.get("consumption", {})
+    hourly_consumption = options.get("hourly_consumption")
+    period_end = get_period_end(end_date)
+    results = {}
+    receipts = {}
+
+    def finish(entity_id, result):
+        results[entity_id] = result
+        if result is None:
+            async_increment(hass, COUNTER_FAILURES)
+        if progress_callback is not None:
+            progress_callback(entity_id, result)
+
+    async def render(entity_id, receipt):
+        try:
+            if ledger is not None and receipt is not None:
+                await ledger.async_add(receipt, start_date, end_date)
+            if ledger_only:
+                finish(entity_id, receipt and {
+                    'filename': ledger.filename,
+                    'entity_id': entity_id,
+                    'entity_name': receipt['entity_name'],
+                })
+                return
+            if bundle:
+                # Bundled meters finish together once the bundle is written
+                receipts[entity_id] = receipt
+                return
+            if receipt is None:
+                finish(entity_id, None)
+                return
+            async with render_semaphore:
+                result = await _async_single_flight(
+                    hass,
+                    receipt['cache_key'],
+                    lambda: _async_generate_receipt(hass, receipt, filename_prefix, start_date, end_date, options),
+                )
+            finish(entity_id, result)
+        except Exception as e:
+            _LOGGER.error(f"Error generating PDF for {entity_id}: {e}")
+            finish(entity_id, None)
+
+    async def process_batch(batch):
+        with async_timed(hass, STAGE_RESOLVE):
+            readings, consumption = await resolve_batch(batch)
+
+        batch_receipts = {}
+        for entity_id in batch:
+            if entity_id not in readings:
+                finish(entity_id, None)
+                continue
+            try:
+                batch_receipts[entity_id] = _get_meter_receipt(
+                    hass, entity_id, *readings[entity_id], start_date, end_date, consumption.get(entity_id)
+                )
+            except Exception as e:
+                _LOGGER.error(f"Error generating PDF for {entity_id}: {e}")
+                finish(entity_id, None)
+
+        try:
+            await async_bill_receipts(
+                hass,
+                [receipt for receipt in batch_receipts.values() if receipt],
+                start_date,
+                end_date,
+                fetch_semaphore,
+                throttle,
+                hourly_consumption,
+            )
+        except Exception as e:
+            _LOGGER.error(f"Error billing {list(batch_receipts)}: {e}")
+            for entity_id in batch_receipts:
+                finish(entity_id, None)
+            return
+        for receipt in batch_receipts.values():
+            if receipt:
+                # A cached file is only reused under the same name and from the same template
+                receipt['cache_key'] = _get_cache_key(
+                    receipt['cache_key'], filename_prefix, options.get("compiled_template", False)
+                )
+        await asyncio.gather(*(render(entity_id, receipt) for entity_id, receipt in batch_receipts.items()))
+
+    async def resolve_batch(batch):
+        known = {entity_id: prefetched[entity_id] for entity_id in batch if entity_id in prefetched}
+        fetching, shared = _claim_readings(
+            hass, [entity_id for entity_id in batch if entity_id not in known], start_date, end_date
+        )
+        readings = {}
+        try:
+            if fetching:
+                async with fetch_semaphore:
+                    try:
+                        # Resolve the start and end readings of the whole batch in one recorder pass
+                        # each, unless they were snapshotted at a billing period boundary
+                        with async_timed(hass, STAGE_QUERY):
+                            start_readings = await async_get_readings(hass, fetching, start_date, throttle)
+                            end_readings = await async_get_readings(hass, fetching, period_end, throttle)
+                        readings = {
+                            entity_id: (start_readings.get(entity_id), end_readings.get(entity_id))
+                            for entity_id in fetching
+                        }
+                    except Exception as e:
+                        _LOGGER.error(f"Error fetching energy readings for {fetching}: {e}")
+        finally:
+            _release_readings(hass, fetching, start_date, end_date, readings)
+
+        for entity_id, future in shared.items():
+            shared_readings = await asyncio.shield(future)
+            if shared_readings is not None:
+                readings[entity_id] = shared_readings
+        readings.update(known)
+
+        # Without long-term statistics the states in between are streamed, so resets are counted
+        consumption = {
+            entity_id: prefetched_consumption[entity_id] for entity_id in readings if entity_id in prefetched_consumption
+        }
+        streaming = [
+            entity_id for entity_id, period_readings in readings.items()
+            if needs_consumption(*period_readings) and entity_id not in consumption
+        ]
+        if streaming:
+            async with fetch_semaphore:
+                try:
+                    if throttle is not None:
+                        await throttle.async_wait()
+                    with async_timed(hass, STAGE_QUERY):
+                        consumption.update(await get_consumption(hass, streaming, start_date, period_end))
+                except Exception as e:
+                    _LOGGER.error(f"Error streaming energy states for {streaming}: {e}")
+        return readings, consumption
+
+    unique_ids = list(dict.fromkeys(entity_ids))
+    await asyncio.gather(*(
+        process_batch(unique_ids[i:i + fetch_batch_size])
+        for i in range(0, len(unique_ids), fetch_batch_size)
+    ))
+
+    if bundle:
+        # Keep the requested meter order, ignoring meters whose fetch or lookup failed
+        bundle_receipts = [receipts[entity_id] for entity_id in unique_ids if receipts.get(entity_id)]
+        bundle_results = {}
+        if bundle_receipts:
+            try:
+                bundle_results = await _async_generate_bundle(
+                    hass, bundle_receipts, filename_prefix, start_date, end_date, options
+                )
+            except Exception as e:
+                _LOGGER.error(f"Error generating PDF bundle: {e}")
+        for entity_id in unique_ids:
+            if entity_id not in results:
+                finish(entity_id, bundle_results.get(entity_id))
+    return results
+
+async def async_generate_period_receipts(hass: HomeAssistant, entity_ids: list, filename_prefix: str, periods: list, options: dict, progress_callback=None, ledger=None) -> list:
+    """Generate the receipts of every meter for several periods.
+
+    The readings at all period boundaries are resolved first, with one
+    recorder pass per batch of fetch_batch_size meters covering every
+    boundary. The states of meters without long-term statistics are then
+    streamed once across all periods and split between them, and the
+    hourly statistics of meters on time-of-use tariffs read once, before
+    the periods are rendered one after another with
+    async_generate_receipts. periods is a list of (start_date, end_date).
+    progress_callback, if given, is called with the entity_id and its result
+    as each meter of each period finishes, and the rows of every period are
+    added to ledger, if given. Returns a list of (start_date,
+    end_date, results) with the results of async_generate_receipts.
+    """
+    fetch_batch_size = options.get("fetch_batch_size", DEFAULT_FETCH_BATCH_SIZE)
+    fetch_semaphore = asyncio.Semaphore(options.get("fetch_concurrency", DEFAULT_FETCH_CONCURRENCY))
+    max_queries_per_second = options.get("max_queries_per_second")
+    throttle = RecorderThrottle(hass, max_queries_per_second) if max_queries_per_second else None
+    # Each period runs from midnight on its first day to midnight after its last
+    boundaries = list(dict.fromkeys(
+        when for start_date, end_date in periods for when in (start_date, get_period_end(end_date))
+    ))
+    period_ends = [(start_date, get_period_end(end_date)) for start_date, end_date in periods]
+    unique_ids = list(dict.fromkeys(entity_ids))
+    readings = {when: {} for when in boundaries}
+    consumption = {period: {} for period in period_ends}
+    plan = get_tariffs(hass)
+    hourly_ids = [entity_id for entity_id in unique_ids if _get_meter_tariff(hass, plan, entity_id).needs_hourly]
+    hourly_consumption = {}
+
+    async def fetch_batch(batch):
+        async with fetch_semaphore:
+            try:
+                with async_timed(hass, STAGE_QUERY):
+                    batch_readings = await async_get_readings_at_boundaries(hass, batch, boundaries, throttle)
+            except Exception as e:
+                # The periods fetch these meters one at a time instead
+                _LOGGER.error(f"Error fetching energy readings for {batch}: {e}")
+                return
+        for when, when_readings in batch_readings.items():
+            readings[when].update(when_readings)
+
+        streaming = [
+            entity_id for entity_id in batch
+            if any(needs_consumption(batch_readings[start][entity_id], batch_readings[end][entity_id]) for start, end in period_ends)
+        ]
+        hourly_batch = [entity_id for entity_id in batch if entity_id in hourly_ids]
+        if not streaming and not hourly_batch:
+            return
+        async with fetch_semaphore:
+            try:
+                with async_timed(hass, STAGE_QUERY):
+                    if streaming:
+                        if throttle is not None:
+                            await throttle.async_wait()
+                        for period, period_consumption in (await get_period_consumption(hass, streaming, period_ends)).items():
+                            consumption[period].update(period_consumption)
+                    if hourly_batch:
+                        if throttle is not None:
+                            await throttle.async_wait()
+                        batch_hourly = await get_hourly_consumption(hass, hourly_batch, min(boundaries), max(boundaries))
+                        # Meters without hourly statistics are known to have none, rather than left to each period
+                        hourly_consumption.update({entity_id: batch_hourly.get(entity_id, {}) for entity_id in hourly_batch})
+            except Exception as e:
+                # Each period reads what is missing on its own instead
+                _LOGGER.error(f"Error streaming energy states for {batch}: {e}")
+
+    await asyncio.gather(*(
+        fetch_batch(unique_ids[i:i + fetch_batch_size])
+        for i in range(0, len(unique_ids), fetch_batch_size)
+    ))
+
+    period_results = []
+    for (start_date, end_date), period in zip(periods, period_ends):
+        start_readings = readings[start_date]
+        end_readings = readings[period[1]]
+        period_readings = {
+            entity_id: (start_readings[entity_id], end_readings[entity_id])
+            for entity_id in unique_ids
+            if entity_id in start_readings and entity_id in end_readings
+        }
+        results = await async_generate_receipts(
+            hass,
+            unique_ids,
+            filename_prefix,
+            start_date,
+            end_date,
+            {
+                **options,
+                "readings": period_readings,
+                "consumption": consumption[period],
+                "hourly_consumption": hourly_consumption,
+            },
+            progress_callback,
+            ledger,
+        )
+        period_results.append((start_date, end_date, results))
+    return period_results
+
+async def async_bill_receipts(hass: HomeAssistant, receipts: list, start_date: datetime, end_date: datetime, fetch_semaphore: asyncio.Semaphore = None, throttle: RecorderThrottle = None, hourly_consumption: dict = None) -> None:
+    """Bill the receipts of a batch of meters at their tariffs, setting their bill and amount.
+
+    The cache key of receipts that have one is completed with the bill.
+    The hourly consumption of the meters on time-of-use tariffs is taken
+    from hourly_consumption, which may cover a longer span, or else read in
+    one recorder pass for the whole batch.
+    """
+    if not receipts:
+        return
+    plan = get_tariffs(hass)
+    tariffs = [_get_meter_tariff(hass, plan, receipt['entity_id']) for receipt in receipts]
+
+    hourly = {}
+    hours = []
+    hourly_meters = [index for index, tariff in enumerate(tariffs) if tariff.needs_hourly]
+    if hourly_meters:
+        tz = get_hass_timezone(hass)
+        start = start_date.astimezone(tz) if start_date.tzinfo else start_date.replace(tzinfo=tz)
+        period_end = get_period_end(end_date)
+        end = period_end.astimezone(tz) if period_end.tzinfo else period_end.replace(tzinfo=tz)
+        hours = get_hours(start, end)
+        hourly_consumption = hourly_consumption or {}
+        consumption = {
+            receipts[index]['entity_id']: hourly_consumption[receipts[index]['entity_id']]
+            for index in hourly_meters
+            if receipts[index]['entity_id'] in hourly_consumption
+        }
+        missing = [receipts[index]['entity_id'] for index in hourly_meters if receipts[index]['entity_id'] not in consumption]
+        if missing:
+            async with fetch_semaphore or nullcontext():
+                if throttle is not None:
+                    await throttle.async_wait()
+                with async_timed(hass, STAGE_QUERY):
+                    consumption.update(await get_hourly_consumption(hass, missing, start, end))
+        hourly = {
+            index: consumption[receipts[index]['entity_id']]
+            for index in hourly_meters
+            if receipts[index]['entity_id'] in consumption
+        }
+
+    with async_timed(hass, STAGE_BILL):
+        bills = await hass.async_add_executor_job(
+            compute_bills, tariffs, [receipt['energy_used'] for receipt in receipts], hourly, hours
+        )
+    for receipt, bill in zip(receipts, bills):
+        receipt['bill'] = bill
+        receipt['amount'] = bill['total_cost']
+        if receipt.get('cache_key'):
+            # Only the report ID and generation time differ between receipts with the same key
+            receipt['cache_key'] = _get_cache_key(receipt['cache_key'], bill)
+
+def _get_meter_tariff(hass: HomeAssistant, plan, entity_id: str):
+    """Return the tariff of the plan a meter is billed at."""
+    area = floor = None
+    if plan.uses_groups:
+        area = get_meter_group(hass, entity_id, BUNDLE_GROUP_AREA)
+        floor = get_meter_group(hass, entity_id, BUNDLE_GROUP_FLOOR)
+    return plan.get_tariff(entity_id, area, floor)
+
+def _claim_readings(hass: HomeAssistant, entity_ids: list, start_date: datetime, end_date: datetime) -> tuple:
+    """Split meters into those this request fetches and those another request is already fetching.
+
+    Returns the list of meters to fetch, now marked as in flight, and a dict
+    of the other meters to the future their readings will be set on.
+    """
+    inflight = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_INFLIGHT_READINGS, {})
+    fetching = []
+    shared = {}
+    for entity_id in entity_ids:
+        key = (entity_id, start_date, end_date)
+        if key in inflight:
+            shared[entity_id] = inflight[key]
+        else:
+            inflight[key] = hass.loop.create_future()
+            fetching.append(entity_id)
+    return fetching, shared
+
+def _release_readings(hass: HomeAssistant, entity_ids: list, start_date: datetime, end_date: datetime, readings: dict) -> None:
+    """Hand the readings of claimed meters to the requests waiting for them, None if the fetch failed."""
+    inflight = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_INFLIGHT_READINGS, {})
+    for entity_id in entity_ids:
+        future = inflight.pop((entity_id, start_date, end_date), None)
+        if future is not None and not future.done():
+            future.set_result(readings.get(entity_id))
+
+async def _async_single_flight(hass: HomeAssistant, key: str, create_job):
+    """Run the job for key, or await the one already running for it, and return its result.
+
+    The job runs as its own task, so a caller that is cancelled does not
+    cancel it for the others.
+    """
+    inflight = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_INFLIGHT_RENDERS, {})
+    task = inflight.get(key)
+    if task is None:
+        task = hass.async_create_task(create_job())
+        inflight[key] = task
+
+        def _job_done(_):
+            if inflight.get(key) is task:
+                del inflight[key]
+
+        task.add_done_callback(_job_done)
+    return await asyncio.shield(task)
+
+def _get_cache_key(*parts) -> str:
+    """Return a digest of everything that decides the content of a receipt file."""
+    payload = json.dumps([TEMPLATE_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _get_meter_receipt(hass: HomeAssistant, entity_id: str, start_reading, end_reading, start_date: datetime, end_date: datetime, consumption: float = None):
+    """Return the values printed on the receipt of one entity from its period readings.
+
+    consumption, when streamed from the states of the period, is used as the
+    energy used instead of the difference of the readings. The receipt is
+    billed by async_bill_receipts, which completes its cache key with the
+    bill, and async_generate_receipts with the file name and template.
+    """
+    # Get the current state of the entity
+    entity_state = hass.states.get(entity_id)
+    if entity_state is None:
+        _LOGGER.warning(f"Entity '{entity_id}' not found, skipping.")
+        return None
+
+    start_energy = start_reading["state"] if start_reading else None
+    end_energy = end_reading["state"] if end_reading else None
+
+    if start_reading is None or end_reading is None:
+        _LOGGER.warning(f"Could not get energy values for {entity_id}. Start: {start_energy}, End: {end_energy}")
+        # Fallback to current total energy if we can't get historical data
+        total_energy = float(entity_state.state)
+        energy_used = total_energy * 0.1  # Fallback calculation
+    else:
+        total_energy = end_energy
+        energy_used = consumption if consumption is not None else calculate_energy_used(start_reading, end_reading)
+
+    # Get entity name for the report
+    entity_name = entity_state.attributes.get('friendly_name', entity_id)
+
+    _LOGGER.info(f"Energy calculation for {entity_id} - Start: {start_energy}, End: {end_energy}, Used: {energy_used}")
+    return {
+        'entity_id': entity_id,
+        'entity_name': entity_name,
+        'total_energy': total_energy,
+        'energy_used': energy_used,
+        'estimated': start_reading is None or end_reading is None,
+        'cache_key': _get_cache_key(
+            "receipt", entity_id, entity_name, start_date, end_date, start_reading, end_reading, total_energy, energy_used
+        ),
+    }
+
+async def _async_generate_receipt(hass: HomeAssistant, receipt: dict, filename_prefix: str, start_date: datetime, end_date: datetime, options: dict):
+    """Render the receipt of one entity to its own file."""
+    entity_name = receipt['entity_name']
+
+    # Clean entity name for filename
+    clean_name = "".join(c for c in entity_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    clean_name = clean_name.replace(' ', '_')
+    filename = f"{filename_prefix}_{clean_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf"
+
+    if not options.get("force", False):
+        cached_filename = await async_find_cached_receipt(hass, receipt['cache_key'])
+        if cached_filename:
+            async_increment(hass, COUNTER_CACHE_HITS)
+            _LOGGER.debug(f"Reusing unchanged receipt {cached_filename} for {receipt['entity_id']}")
+            return {
+                'filename': cached_filename,
+                'entity_id': receipt['entity_id'],
+                'entity_name': entity_name,
+                'cached': True
+            }
+
+    async_increment(hass, COUNTER_CACHE_MISSES)
+    # Locked until indexed, so the retention policy never archives the file it replaces meanwhile
+    async with async_lock_receipt_file(hass, filename):
+        path = await async_render_receipt(
+            hass,
+            options.get("render_backend", RENDER_BACKEND_THREAD),
+            options.get("render_workers", DEFAULT_RENDER_WORKERS),
+            receipt['total_energy'],
+            receipt['energy_used'],
+            filename,
+            hass.config.config_dir,
+            start_date,
+            end_date,
+            entity_name,  # Pass entity name for the report
+            options.get("compiled_template", False),
+            receipt['bill'],
+        )
+        await async_index_receipt(hass, path, [receipt], start_date, end_date)
+
+    return {
+        'filename': filename,
+        'entity_id': receipt['entity_id'],
+        'entity_name': entity_name
+    }
+
+async def _async_generate_bundle(hass: HomeAssistant, receipts: list, filename_prefix: str, start_date: datetime, end_date: datetime, options: dict) -> dict:
+    """Render the receipts of all entities as the pages of one file."""
+    group_by = options.get("bundle_group_by", BUNDLE_GROUP_NONE)
+    if group_by != BUNDLE_GROUP_NONE:
+        for receipt in receipts:
+            receipt['group'] = get_meter_group(hass, receipt['entity_id'], group_by) or BUNDLE_UNGROUPED
+        # Stable sort, so meters keep their requested order within a group
+        receipts.sort(key=lambda receipt: (receipt['group'] == BUNDLE_UNGROUPED, receipt['group']))
+
+    filename = f"{filename_prefix}_bundle_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf"
+
+    # A bundle is unchanged if it holds the same receipts in the same order and groups
+    cache_key = _get_cache_key(
+        "bundle", [(receipt['cache_key'], receipt.get('group')) for receipt in receipts]
+    )
+    return await _async_single_flight(
+        hass,
+        cache_key,
+        lambda: _async_generate_bundle_file(hass, receipts, filename, cache_key, start_date, end_date, options),
+    )
+
+async def _async_generate_bundle_file(hass: HomeAssistant, receipts: list, filename: str, cache_key: str, start_date: datetime, end_date: datetime, options: dict) -> dict:
+    """Render a bundle unless an identical one exists, and return its file info per entity."""
+    cached_filename = None
+    if not options.get("force", False):
+        cached_filename = await async_find_cached_receipt(hass, cache_key)
+    if cached_filename:
+        async_increment(hass, COUNTER_CACHE_HITS)
+        _LOGGER.debug(f"Reusing unchanged bundle {cached_filename}")
+        return _get_bundle_results(receipts, cached_filename, cached=True)
+
+    async_increment(hass, COUNTER_CACHE_MISSES)
+
+    async with async_lock_receipt_file(hass, filename):
+        path = await async_render_bundle(
+            hass,
+            options.get("render_backend", RENDER_BACKEND_THREAD),
+            options.get("render_workers", DEFAULT_RENDER_WORKERS),
+            receipts,
+            filename,
+            hass.config.config_dir,
+            start_date,
+            end_date,
+            options.get("compiled_template", False)
+        )
+
+        _LOGGER.info(f"Generated bundle {filename} with {len(receipts)} receipts")
+        results = _get_bundle_results(receipts, filename)
+        await async_index_receipt(hass, path, receipts, start_date, end_date, cache_key)
+    return results
+
+def _get_bundle_results(receipts: list, filename: str, cached: bool = False) -> dict:
+    """Return the generated file info of every entity in a bundle, numbering its pages."""
+    results = {}
+    for page, receipt in enumerate(receipts, start=1):
+        receipt['page'] = page
+        results[receipt['entity_id']] = {
+            'filename': filename,
+            'entity_id': receipt['entity_id'],
+            'entity_name': receipt['entity_name'],
+            'page': page,
+        }
+        if cached:
+            results[receipt['entity_id']]['cached'] = True
+    return results
+
+def get_meter_group(hass: HomeAssistant, entity_id: str, group_by: str):
+    """Return the area or floor name of a meter, or None if it has none."""
+    entity_entry = er.async_get(hass).async_get(entity_id)
+    if entity_entry is None:
+        return None
+
+    # An entity's own area overrides the area of its device
+    area_id = entity_entry.area_id
+    if area_id is None and entity_entry.device_id:
+        device_entry = dr.async_get(hass).async_get(entity_entry.device_id)
+        area_id = device_entry.area_id if device_entry else None
+    area = ar.async_get(hass).async_get_area(area_id) if area_id else None
+    if area is None:
+        return None
+
+    if group_by == BUNDLE_GROUP_AREA:
+        return area.name
+    if group_by == BUNDLE_GROUP_FLOOR and area.floor_id:
+        floor = fr.async_get(hass).async_get_floor(area.floor_id)
+        return floor.name if floor else None
+    return None
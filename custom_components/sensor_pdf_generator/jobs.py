@@ -0,0 +1,269 @@
+"""Background queue for receipt generation jobs."""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    EVENT_JOB_PROGRESS,
+    JOB_CANCELLED,
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_PRIORITIES,
+    JOB_PROGRESS_INTERVAL,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    MAX_FINISHED_JOBS,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_JOB_QUEUE = "job_queue"
+
+
+class ReceiptJob:
+    """One queued generate request and its progress."""
+
+    def __init__(self, entity_ids: list, priority: str, data: dict, total: int = None) -> None:
+        """Create a queued job for the given meters and service data.
+
+        total is the number of receipts the job makes, one per meter unless given.
+        """
+        self.id = uuid.uuid4().hex
+        self.entity_ids = list(dict.fromkeys(entity_ids))
+        self.total = total or len(self.entity_ids)
+        self.priority = priority
+        self.data = data
+        self.status = JOB_QUEUED
+        self.created = dt_util.utcnow()
+        self.started = None
+        self.finished = None
+        self.done = 0
+        self.failed = 0
+        self.result = None
+        self.error = None
+        self.task = None
+        self._last_progress = 0.0
+
+    @property
+    def is_finished(self) -> bool:
+        """Return True once the job has completed, failed or been cancelled."""
+        return self.status in (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+    def as_progress(self) -> dict:
+        """Return the compact progress update sent to websocket subscribers."""
+        progress = {
+            "job_id": self.id,
+            "status": self.status,
+            "done": self.done,
+            "failed": self.failed,
+            "total": self.total,
+        }
+        if self.is_finished:
+            if self.result:
+                progress["files"] = list(dict.fromkeys(
+                    file_info["filename"] for file_info in self.result["generated_files"]
+                ))
+                progress["failed_entities"] = self.result["failed_entities"]
+            if self.error:
+                progress["error"] = self.error
+        return progress
+
+    def as_dict(self) -> dict:
+        """Return the job's status as returned by the status service."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "created": self.created.isoformat(),
+            "started": self.started.isoformat() if self.started else None,
+            "finished": self.finished.isoformat() if self.finished else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class ReceiptJobQueue:
+    """Run generation jobs in the background, one at a time per priority.
+
+    Each job already renders its meters concurrently, so jobs of the same
+    priority run one after another. Interactive jobs have their own worker
+    and start right away even while a scheduled bulk run is going, sharing
+    the render pool with it and joining its renders of the same receipts.
+    """
+
+    def __init__(self, hass: HomeAssistant, run_job) -> None:
+        """Create the queue. run_job(job) is awaited to run each job and returns its result."""
+        self._hass = hass
+        self._run_job = run_job
+        self._jobs = {}
+        self._pending = {priority: deque() for priority in JOB_PRIORITIES}
+        self._workers = {}
+        self._listeners = []
+
+    def async_submit(self, entity_ids: list, priority: str, data: dict, total: int = None) -> ReceiptJob:
+        """Queue a job and return it immediately."""
+        job = ReceiptJob(entity_ids, priority, data, total)
+        self._jobs[job.id] = job
+        self._pending[priority].append(job)
+        if priority not in self._workers:
+            worker = self._hass.async_create_background_task(
+                self._async_work(priority), f"{DOMAIN} {priority} job queue"
+            )
+            # Tasks start eagerly, and may already have run every job
+            if not worker.done():
+                self._workers[priority] = worker
+        _LOGGER.debug(f"Queued job {job.id} for {len(job.entity_ids)} meters with {priority} priority")
+        return job
+
+    def async_get(self, job_id: str):
+        """Return a job by ID, or None if it is unknown or was forgotten."""
+        return self._jobs.get(job_id)
+
+    def async_jobs(self) -> list:
+        """Return all known jobs, oldest first."""
+        return list(self._jobs.values())
+
+    def async_add_listener(self, listener):
+        """Call listener(job) on every progress update, returning a function that removes it."""
+        self._listeners.append(listener)
+
+        def remove_listener():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    async def async_wait(self, job: ReceiptJob) -> None:
+        """Wait until a job has finished."""
+        if job.is_finished:
+            return
+        finished = self._hass.loop.create_future()
+
+        def job_updated(updated_job):
+            if updated_job is job and job.is_finished and not finished.done():
+                finished.set_result(None)
+
+        remove_listener = self.async_add_listener(job_updated)
+        try:
+            await finished
+        finally:
+            remove_listener()
+
+    def async_cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it had already finished."""
+        job = self._jobs.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        if job.status == JOB_QUEUED:
+            # The worker skips it when it comes up
+            self._async_finish(job, JOB_CANCELLED)
+        else:
+            job.task.cancel()
+        return True
+
+    def async_progress(self, job: ReceiptJob, entity_id: str, result) -> None:
+        """Count one finished receipt, firing a progress event at most every JOB_PROGRESS_INTERVAL."""
+        job.done += 1
+        if result is None:
+            job.failed += 1
+
+        now = time.monotonic()
+        if job.done < job.total and now - job._last_progress < JOB_PROGRESS_INTERVAL:
+            return
+        job._last_progress = now
+        self._async_fire_progress(job)
+
+    def _async_fire_progress(self, job: ReceiptJob) -> None:
+        """Fire a progress event for a job and pass it to the listeners."""
+        for listener in list(self._listeners):
+            listener(job)
+        self._hass.bus.async_fire(EVENT_JOB_PROGRESS, {
+            "job_id": job.id,
+            "status": job.status,
+            "done": job.done,
+            "failed": job.failed,
+            "total": job.total,
+        })
+
+    def _async_finish(self, job: ReceiptJob, status: str) -> None:
+        """Mark a job as finished and forget the oldest finished jobs."""
+        job.status = status
+        job.finished = dt_util.utcnow()
+        self._async_fire_progress(job)
+
+        finished = [old_job for old_job in self._jobs.values() if old_job.is_finished]
+        for old_job in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[old_job.id]
+
+    async def _async_work(self, priority: str) -> None:
+        """Run queued jobs of a priority until there are none left."""
+        pending = self._pending[priority]
+        try:
+            while pending:
+                job = pending.popleft()
+                if job.status != JOB_QUEUED:
+                    continue
+
+                job.status = JOB_RUNNING
+                job.started = dt_util.utcnow()
+                self._async_fire_progress(job)
+                job.task = self._hass.async_create_task(self._run_job(job))
+                try:
+                    job.result = await job.task
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        # The queue itself is shutting down
+                        self._async_finish(job, JOB_CANCELLED)
+                        raise
+                    _LOGGER.info(f"Job {job.id} was cancelled")
+                    self._async_finish(job, JOB_CANCELLED)
+                except Exception as e:
+                    _LOGGER.error(f"Job {job.id} failed: {e}")
+                    job.error = str(e)
+                    self._async_finish(job, JOB_FAILED)
+                else:
+                    self._async_finish(job, JOB_COMPLETED)
+        finally:
+            self._workers.pop(priority, None)
+
+    async def async_shutdown(self) -> None:
+        """Cancel every queued and running job."""
+        for job in self._jobs.values():
+            if job.status == JOB_QUEUED:
+                self._async_finish(job, JOB_CANCELLED)
+        for pending in self._pending.values():
+            pending.clear()
+        for worker in list(self._workers.values()):
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+
+
+def async_setup_job_queue(hass: HomeAssistant, run_job) -> ReceiptJobQueue:
+    """Create the shared job queue."""
+    queue = ReceiptJobQueue(hass, run_job)
+    hass.data.setdefault(DOMAIN, {})[DATA_JOB_QUEUE] = queue
+    return queue
+
+
+def get_job_queue(hass: HomeAssistant):
+    """Return the shared job queue, or None if it is not set up."""
+    return hass.data.get(DOMAIN, {}).get(DATA_JOB_QUEUE)
+
+
+async def async_cancel_jobs(hass: HomeAssistant) -> None:
+    """Cancel all jobs of the shared job queue, which keeps its listeners for the next setup."""
+    queue = get_job_queue(hass)
+    if queue is not None:
+        await queue.async_shutdown()
@@ -0,0 +1,153 @@
+"""Billing ledgers: the values of every receipt streamed to a CSV or JSONL file."""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant
+
+from .const import LEDGER_FLUSH_ROWS, LEDGER_FORMAT_CSV
+from .receipt_index import get_receipts_dir
+
+_LOGGER = logging.getLogger(__name__)
+
+LEDGER_COLUMNS = (
+    "period_start",
+    "period_end",
+    "entity_id",
+    "entity_name",
+    "total_energy",
+    "energy_used",
+    "tariff",
+    "fixed_charge",
+    "energy_rate",
+    "energy_charge",
+    "total_cost",
+    "estimated",
+)
+
+
+def get_ledger_filename(filename_prefix: str, start_date: datetime, end_date: datetime, ledger_format: str) -> str:
+    """Return the filename of the ledger of the periods from start_date to end_date."""
+    return f"{filename_prefix}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.{ledger_format}"
+
+
+def _get_row(receipt: dict, start_date: datetime, end_date: datetime) -> dict:
+    """Return the ledger row of a billed receipt, with the values printed on it."""
+    bill = receipt["bill"]
+    return {
+        "period_start": start_date.strftime("%Y-%m-%d"),
+        "period_end": end_date.strftime("%Y-%m-%d"),
+        "entity_id": receipt["entity_id"],
+        "entity_name": receipt["entity_name"],
+        "total_energy": receipt["total_energy"],
+        "energy_used": receipt["energy_used"],
+        "tariff": bill["tariff"],
+        "fixed_charge": bill["fixed_charge"],
+        "energy_rate": bill["energy_rate"],
+        "energy_charge": bill["energy_charge"],
+        "total_cost": bill["total_cost"],
+        "estimated": receipt.get("estimated", False),
+    }
+
+
+def _format_rows(rows: list, ledger_format: str) -> str:
+    """Return rows as lines of CSV or JSON."""
+    if ledger_format == LEDGER_FORMAT_CSV:
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, LEDGER_COLUMNS).writerows(rows)
+        return buffer.getvalue()
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+class LedgerWriter:
+    """Append ledger rows to a file as receipts are resolved, holding at most LEDGER_FLUSH_ROWS in memory.
+
+    Rows are written to a temporary file next to the ledger, which replaces
+    the ledger once closed, so a partial ledger is never served.
+    """
+
+    def __init__(self, hass: HomeAssistant, filename: str, ledger_format: str) -> None:
+        """Create a writer for the ledger filename in the receipts folder."""
+        self._hass = hass
+        self.filename = filename
+        self.rows = 0
+        self._format = ledger_format
+        self._path = os.path.join(get_receipts_dir(hass), filename)
+        self._temp_path = os.path.join(get_receipts_dir(hass), f".{filename}.{uuid.uuid4().hex}.tmp")
+        self._file = None
+        self._pending = []
+        self._lock = asyncio.Lock()
+
+    def _open(self) -> None:
+        """Create the temporary file, starting a CSV ledger with its header."""
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        self._file = open(self._temp_path, "w", encoding="utf-8", newline="")
+        if self._format == LEDGER_FORMAT_CSV:
+            csv.DictWriter(self._file, LEDGER_COLUMNS).writeheader()
+
+    def _write(self, rows: list) -> None:
+        """Append rows to the temporary file."""
+        self._file.write(_format_rows(rows, self._format))
+        self._file.flush()
+
+    def _close(self) -> None:
+        """Close the temporary file and move it into place."""
+        self._file.close()
+        os.replace(self._temp_path, self._path)
+
+    def _abort(self) -> None:
+        """Close and remove the temporary file."""
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    async def async_open(self) -> None:
+        """Start the ledger."""
+        await self._hass.async_add_executor_job(self._open)
+
+    async def async_add(self, receipt: dict, start_date: datetime, end_date: datetime) -> None:
+        """Add the row of a receipt, writing the pending rows out once there are enough of them."""
+        self._pending.append(_get_row(receipt, start_date, end_date))
+        self.rows += 1
+        if len(self._pending) >= LEDGER_FLUSH_ROWS:
+            await self._async_flush()
+
+    async def _async_flush(self) -> None:
+        """Write out the pending rows, one flush at a time so rows keep their order."""
+        rows, self._pending = self._pending, []
+        if rows:
+            async with self._lock:
+                await self._hass.async_add_executor_job(self._write, rows)
+
+    async def async_close(self) -> str:
+        """Write the remaining rows and publish the ledger, returning its path."""
+        await self._async_flush()
+        async with self._lock:
+            await self._hass.async_add_executor_job(self._close)
+        _LOGGER.info(f"Wrote {self.rows} rows to ledger {self.filename}")
+        return self._path
+
+    async def async_abort(self) -> None:
+        """Drop the ledger, leaving any earlier ledger of the same name in place."""
+        async with self._lock:
+            await self._hass.async_add_executor_job(self._abort)
+
+
+@asynccontextmanager
+async def async_open_ledger(hass: HomeAssistant, filename: str, ledger_format: str):
+    """Yield a started LedgerWriter, published when the block ends and dropped if it raises."""
+    ledger = LedgerWriter(hass, filename, ledger_format)
+    await ledger.async_open()
+    try:
+        yield ledger
+    except BaseException:
+        await ledger.async_abort()
+        raise
+    await ledger.async_close()
@@ -0,0 +1,171 @@
+"""Index of the breakers shown in the receipt panel."""
+import logging
+
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import area_registry as ar
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers import floor_registry as fr
+
+from .const import (
+    DOMAIN,
+    METER_MANUFACTURER,
+    METER_MODEL_ID,
+    METER_REQUIRED_SENSOR_TYPES,
+    METER_SENSOR_TYPES,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_METER_INDEX = "meter_index"
+
+
+def _get_meter_name(entity_id: str):
+    """Return the breaker name of one of its sensors, e.g. shop_1 for sensor.shop_1_total_energy."""
+    lower = entity_id.lower()
+    if not lower.startswith("sensor."):
+        return None
+    for sensor_type in METER_SENSOR_TYPES:
+        if lower.endswith(f"_{sensor_type}"):
+            return entity_id[len("sensor."):-len(f"_{sensor_type}")]
+    return None
+
+
+class MeterIndex:
+    """Breakers and their sensors, kept up to date from registry update events.
+
+    A breaker is a group of sensor entities named sensor.<name>_<type> on a
+    Tuya meter device of the supported model, with at least its current and
+    total energy sensors. Entity and device registry events refresh only the
+    breakers they touch. Area and floor names are resolved when the index is
+    read, and the result is cached until any registry changes.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Create an empty index."""
+        self._hass = hass
+        self._meters = {}
+        self._payload = None
+
+    @callback
+    def async_setup(self) -> list:
+        """Build the index and return the listeners to remove on unload."""
+        entity_registry = er.async_get(self._hass)
+        names = {
+            _get_meter_name(entity_id) for entity_id in entity_registry.entities
+        }
+        names.discard(None)
+        for name in names:
+            self._async_refresh(name)
+        _LOGGER.debug(f"Indexed {len(self._meters)} meters")
+
+        return [
+            self._hass.bus.async_listen(er.EVENT_ENTITY_REGISTRY_UPDATED, self._async_entity_updated),
+            self._hass.bus.async_listen(dr.EVENT_DEVICE_REGISTRY_UPDATED, self._async_device_updated),
+            self._hass.bus.async_listen(ar.EVENT_AREA_REGISTRY_UPDATED, self._async_invalidate),
+            self._hass.bus.async_listen(fr.EVENT_FLOOR_REGISTRY_UPDATED, self._async_invalidate),
+        ]
+
+    @callback
+    def _async_refresh(self, name: str) -> None:
+        """Re-read one breaker from the registries, adding or dropping it as needed."""
+        self._payload = None
+        entity_registry = er.async_get(self._hass)
+        entries = {}
+        for sensor_type in METER_SENSOR_TYPES:
+            entry = entity_registry.async_get(f"sensor.{name}_{sensor_type}")
+            if entry is not None and entry.device_id and not entry.disabled_by:
+                entries[sensor_type] = entry
+
+        if not all(sensor_type in entries for sensor_type in METER_REQUIRED_SENSOR_TYPES):
+            self._meters.pop(name, None)
+            return
+
+        energy_entry = entries["total_energy"]
+        device = dr.async_get(self._hass).async_get(energy_entry.device_id)
+        if device is None or device.manufacturer != METER_MANUFACTURER or device.model_id != METER_MODEL_ID:
+            self._meters.pop(name, None)
+            return
+
+        self._meters[name] = {
+            "device_id": device.id,
+            # An entity's own area overrides the area of its device
+            "area_id": energy_entry.area_id or device.area_id,
+            "sensors": {sensor_type: entry.entity_id for sensor_type, entry in entries.items()},
+        }
+
+    @callback
+    def _async_entity_updated(self, event: Event) -> None:
+        """Refresh the breakers of a created, removed, renamed or changed entity."""
+        for entity_id in (event.data.get("entity_id"), event.data.get("old_entity_id")):
+            name = _get_meter_name(entity_id) if entity_id else None
+            if name is not None:
+                self._async_refresh(name)
+
+    @callback
+    def _async_device_updated(self, event: Event) -> None:
+        """Refresh the breakers of a device whose model, area or entities changed."""
+        device_id = event.data["device_id"]
+        names = {name for name, meter in self._meters.items() if meter["device_id"] == device_id}
+        for entry in er.async_entries_for_device(er.async_get(self._hass), device_id):
+            names.add(_get_meter_name(entry.entity_id))
+        names.discard(None)
+        for name in names:
+            self._async_refresh(name)
+
+    @callback
+    def _async_invalidate(self, event: Event) -> None:
+        """Drop the cached result after an area or floor changed."""
+        self._payload = None
+
+    @callback
+    def async_energy_entity_ids(self) -> list:
+        """Return the total energy sensor of every breaker."""
+        return sorted(meter["sensors"]["total_energy"] for meter in self._meters.values())
+
+    @callback
+    def async_as_dict(self) -> dict:
+        """Return the breakers with their area and floor names, and all floor names."""
+        if self._payload is None:
+            area_registry = ar.async_get(self._hass)
+            floor_registry = fr.async_get(self._hass)
+            meters = []
+            for name, meter in sorted(self._meters.items()):
+                area = area_registry.async_get_area(meter["area_id"]) if meter["area_id"] else None
+                floor = floor_registry.async_get_floor(area.floor_id) if area and area.floor_id else None
+                meters.append({
+                    "name": name,
+                    "sensors": meter["sensors"],
+                    "area": area.name if area else None,
+                    "floor": floor.name if floor else None,
+                })
+            self._payload = {
+                "meters": meters,
+                "floors": sorted(floor.name for floor in floor_registry.async_list_floors()),
+            }
+
+        # Friendly names follow the states, which change without registry events
+        meters = []
+        for meter in self._payload["meters"]:
+            friendly_name = None
+            for entity_id in sorted(meter["sensors"].values(), key=lambda entity_id: not entity_id.endswith("_total_energy")):
+                state = self._hass.states.get(entity_id)
+                friendly_name = state.attributes.get("friendly_name") if state else None
+                if friendly_name:
+                    break
+            meters.append({**meter, "friendly_name": friendly_name})
+        return {"meters": meters, "floors": self._payload["floors"]}
+
+
+@callback
+def async_setup_meter_index(hass: HomeAssistant) -> list:
+    """Create the shared meter index and return the listeners to remove on unload."""
+    index = MeterIndex(hass)
+    hass.data.setdefault(DOMAIN, {})[DATA_METER_INDEX] = index
+    return index.async_setup()
+
+
+@callback
+def get_meter_index(hass: HomeAssistant):
+    """Return the shared meter index, or None if it is not set up."""
+    return hass.data.get(DOMAIN, {}).get(DATA_METER_INDEX)
@@ -0,0 +1,157 @@
+"""Rolling timings and counters of receipt generation, published by the diagnostic sensors."""
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import DOMAIN, METRICS_UPDATE_INTERVAL, METRICS_WINDOW
+
+DATA_METRICS = "metrics"
+
+# Stages of a generation run, timed separately
+STAGE_QUERY = "query"      # Waiting on recorder reads
+STAGE_RESOLVE = "resolve"  # Resolving a batch's readings and consumption, snapshots, shared fetches and throttling included
+STAGE_SHAPE = "shape"      # Formatting one document's texts, Arabic reshaping and bidi ordering included
+STAGE_BILL = "bill"        # Computing the bills of a batch's meters from their tariffs
+STAGE_RENDER = "render"    # Laying out one document
+STAGE_WRITE = "write"      # Serializing one document and writing it to disk
+STAGES = (STAGE_QUERY, STAGE_RESOLVE, STAGE_SHAPE, STAGE_BILL, STAGE_RENDER, STAGE_WRITE)
+
+COUNTER_CACHE_HITS = "cache_hits"
+COUNTER_CACHE_MISSES = "cache_misses"
+COUNTER_FAILURES = "failures"
+COUNTER_BYTES_WRITTEN = "bytes_written"
+COUNTERS = (COUNTER_CACHE_HITS, COUNTER_CACHE_MISSES, COUNTER_FAILURES, COUNTER_BYTES_WRITTEN)
+
+
+def _percentile(values, percent: float):
+    """Return the nearest-rank percentile of values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class GenerationMetrics:
+    """Timings of the last METRICS_WINDOW samples of each stage, and counters since startup.
+
+    Everything is recorded from the event loop. Listeners are called at most
+    every METRICS_UPDATE_INTERVAL seconds while values change, so a run over
+    hundreds of meters does not write a sensor state per meter.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Create empty metrics."""
+        self._hass = hass
+        self._samples = {stage: deque(maxlen=METRICS_WINDOW) for stage in STAGES}
+        self._counts = dict.fromkeys(STAGES, 0)
+        self._totals = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._listeners = []
+        self._unsub_update = None
+
+    @callback
+    def async_record(self, stage: str, seconds: float) -> None:
+        """Add one timing sample of a stage."""
+        self._samples[stage].append(seconds)
+        self._counts[stage] += 1
+        self._totals[stage] += seconds
+        self._async_schedule_update()
+
+    @callback
+    def async_increment(self, counter: str, amount: int = 1) -> None:
+        """Add to a counter."""
+        self.counters[counter] += amount
+        self._async_schedule_update()
+
+    @callback
+    def async_stage(self, stage: str) -> dict:
+        """Return the rolling p50 and p95 of a stage, in seconds, with its sample count and total time."""
+        samples = self._samples[stage]
+        return {
+            "p50": _percentile(samples, 50),
+            "p95": _percentile(samples, 95),
+            "samples": len(samples),
+            "count": self._counts[stage],
+            "total": self._totals[stage],
+        }
+
+    @callback
+    def async_add_listener(self, listener):
+        """Call listener() when the metrics have changed, returning a function that removes it."""
+        self._listeners.append(listener)
+
+        def remove_listener():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def _async_schedule_update(self) -> None:
+        """Tell the listeners about the new values once the update interval has passed."""
+        if self._unsub_update is None:
+            self._unsub_update = async_call_later(self._hass, METRICS_UPDATE_INTERVAL, self._async_update)
+
+    @callback
+    def _async_update(self, _now) -> None:
+        self._unsub_update = None
+        for listener in list(self._listeners):
+            listener()
+
+    @callback
+    def async_shutdown(self) -> None:
+        """Cancel a pending listener update."""
+        if self._unsub_update is not None:
+            self._unsub_update()
+            self._unsub_update = None
+
+
+@callback
+def async_setup_metrics(hass: HomeAssistant) -> GenerationMetrics:
+    """Create the shared metrics."""
+    metrics = GenerationMetrics(hass)
+    hass.data.setdefault(DOMAIN, {})[DATA_METRICS] = metrics
+    return metrics
+
+
+def get_metrics(hass: HomeAssistant):
+    """Return the shared metrics, or None if they are not set up."""
+    return hass.data.get(DOMAIN, {}).get(DATA_METRICS)
+
+
+@callback
+def async_shutdown_metrics(hass: HomeAssistant) -> None:
+    """Drop the shared metrics."""
+    metrics = hass.data.get(DOMAIN, {}).pop(DATA_METRICS, None)
+    if metrics is not None:
+        metrics.async_shutdown()
+
+
+@callback
+def async_record(hass: HomeAssistant, stage: str, seconds: float) -> None:
+    """Add a timing sample to the shared metrics, if they are set up."""
+    metrics = get_metrics(hass)
+    if metrics is not None:
+        metrics.async_record(stage, seconds)
+
+
+@callback
+def async_increment(hass: HomeAssistant, counter: str, amount: int = 1) -> None:
+    """Add to a counter of the shared metrics, if they are set up."""
+    metrics = get_metrics(hass)
+    if metrics is not None:
+        metrics.async_increment(counter, amount)
+
+
+@contextmanager
+def async_timed(hass: HomeAssistant, stage: str):
+    """Time the enclosed block, awaits included, as one sample of a stage."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        async_record(hass, stage, time.monotonic() - start)
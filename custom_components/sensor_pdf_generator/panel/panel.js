@@ -9,6 +9,8 @@ class PdfGeneratorPanel extends HTMLElement {
     this._initialized = false;
     this.selectedStreet = "all"; // floor filter
     this.selectedBuilding = "all"; // area filter
+    this.pdfPageSize = 50; // receipts listed per page
+    this.pdfCount = 0; // receipts listed so far
     
     this.shadowRoot.innerHTML = `
       <style>
@@ -761,6 +763,7 @@ class PdfGeneratorPanel extends HTMLElement {
           <h2 class="card-title">Generated Reports</h2>
           <button id="refresh-pdfs" style="margin-bottom: 10px;">Refresh List</button>
           <div id="pdf-list" class="pdf-links"></div>
+          <button id="load-more-pdfs" style="margin-top: 10px; display: none;">Load More</button>
         </div>
       </div>
     `;
@@ -774,6 +777,7 @@ class PdfGeneratorPanel extends HTMLElement {
     this.shadowRoot.getElementById("select-all").addEventListener("click", () => this._selectAll());
     this.shadowRoot.getElementById("clear-selection").addEventListener("click", () => this._clearSelection());
     this.shadowRoot.getElementById("refresh-pdfs").addEventListener("click", () => this._loadPdfFiles());
+    this.shadowRoot.getElementById("load-more-pdfs").addEventListener("click", () => this._loadPdfFiles(true));
     
     // Filter event listeners
     this.shadowRoot.getElementById("building-filter").addEventListener("change", (e) => {
@@ -813,13 +817,10 @@ class PdfGeneratorPanel extends HTMLElement {
     
     // Initialize with today's date
     this._initializeDates();
-    
-    // Listen for PDF generation completion
-    if (this._hass?.connection) {
-      this._hass.connection.subscribeEvents((event) => {
-        this._handlePdfGenerationEvent(event);
-      }, "pdf_generator_complete");
-    }
+  }
+
+  disconnectedCallback() {
+    this._unsubscribeJob();
   }
 
   set hass(hass) {
@@ -829,12 +830,6 @@ class PdfGeneratorPanel extends HTMLElement {
       this._initialize();
       this._initialized = true;
       
-      if (hass.connection) {
-        hass.connection.subscribeEvents((event) => {
-          this._handlePdfGenerationEvent(event);
-        }, "pdf_generator_complete");
-      }
-      
       this._loadPdfFiles();
     }
   }
@@ -935,53 +930,129 @@ class PdfGeneratorPanel extends HTMLElement {
     };
   }
 
-  async _loadPdfFiles() {
+  async _loadPdfFiles(more = false) {
+    // Load the first page again, or with more the page after those listed
+    const offset = more ? this.pdfCount : 0;
     try {
       const response = await this._hass.connection.sendMessagePromise({
-        type: "call_service",
-        domain: "sensor_pdf_generator",
-        service: "list_pdfs",
-        service_data: {},
-        return_response: true
+        type: "sensor_pdf_generator/receipts/list",
+        limit: this.pdfPageSize,
+        offset: offset
       });
       
-      const pdfNames = response.response?.pdf_files || [];
-      this._renderPdfLinks(pdfNames);
+      const pdfNames = (response.receipts || []).map(receipt => receipt.filename);
+      this.pdfCount = offset + pdfNames.length;
+      this._renderPdfLinks(pdfNames, more);
+      this._showLoadMore(this.pdfCount < response.total);
       
     } catch (error) {
       console.error("Error loading PDF files:", error);
-      this._renderPdfLinks([]);
+      if (!more) {
+        this.pdfCount = 0;
+        this._renderPdfLinks([]);
+        this._showLoadMore(false);
+      }
+    }
+  }
+
+  _showLoadMore(show) {
+    const button = this.shadowRoot.getElementById("load-more-pdfs");
+    if (button) {
+      button.style.display = show ? "block" : "none";
+    }
+  }
+
+  async _subscribeJob(jobId) {
+    this._unsubscribeJob();
+    this._jobUnsub = await this._hass.connection.subscribeMessage(
+      (update) => this._handleJobUpdate(update),
+      { type: "sensor_pdf_generator/jobs/subscribe", job_id: jobId }
+    );
+  }
+
+  _unsubscribeJob() {
+    if (this._jobUnsub) {
+      this._jobUnsub();
+      this._jobUnsub = null;
     }
   }
 
-  _handlePdfGenerationEvent(event) {
+  _handleJobUpdate(update) {
     const status = this.shadowRoot.getElementById("status");
-    if (event.data.success) {
+    if (update.status === "queued" || update.status === "running") {
+      status.className = "status-message loading";
+      status.textContent = update.status === "queued"
+        ? "Waiting for another generation to finish..."
+        : `Generating PDFs... ${update.done}/${update.total}`;
+      return;
+    }
+    
+    this._unsubscribeJob();
+    const files = update.files || [];
+    if (update.status === "completed" && files.length > 0) {
       status.className = "status-message success";
-      if (event.data.file_count > 1) {
-        status.textContent = `✅ Generated ${event.data.file_count} PDFs successfully`;
+      if (files.length > 1) {
+        status.textContent = `✅ Generated ${files.length} PDFs successfully`;
       } else {
-        status.textContent = `✅ PDF Generated: ${event.data.filename || 'Receipt'}`;
+        status.textContent = `✅ PDF Generated: ${files[0]}`;
+      }
+      if (update.failed > 0) {
+        status.textContent += ` (${update.failed} failed)`;
+      }
+      if (files.length > 1) {
+        // PDFs are already compressed, so the archive stores them as they are
+        const archiveLink = document.createElement("a");
+        archiveLink.href = "#";
+        archiveLink.textContent = " Download all (.zip)";
+        archiveLink.onclick = (event) => {
+          event.preventDefault();
+          this._openSigned(`/api/sensor_pdf_generator/receipts.zip?job_id=${encodeURIComponent(update.job_id)}&store=1`);
+        };
+        status.appendChild(archiveLink);
       }
-      setTimeout(() => this._loadPdfFiles(), 1000);
+      this._loadPdfFiles();
     } else {
       status.className = "status-message error";
-      status.textContent = `❌ Error: ${event.data.error}`;
+      if (update.status === "cancelled") {
+        status.textContent = "❌ Generation cancelled";
+      } else {
+        status.textContent = `❌ Error: ${update.error || "No PDFs were generated successfully"}`;
+      }
     }
   }
 
-  _renderPdfLinks(pdfNames) {
+  async _openSigned(path) {
+    // Open the window while the click still allows it, then point it at the signed URL
+    const target = window.open("", "_blank");
+    try {
+      const { path: signedPath } = await this._hass.callWS({ type: "auth/sign_path", path });
+      if (target) {
+        target.location = signedPath;
+      } else {
+        window.location.assign(signedPath);
+      }
+    } catch (error) {
+      console.error("Error signing download link:", error);
+      if (target) {
+        target.close();
+      }
+    }
+  }
+
+  _renderPdfLinks(pdfNames, append = false) {
     const container = this.shadowRoot.getElementById("pdf-list");
     if (!container) {
       console.error("PDF list container not found");
       return;
     }
     
-    container.innerHTML = "";
-    
-    if (pdfNames.length === 0) {
-      container.innerHTML = '<div style="text-align: center; color: var(--text-secondary);">No reports generated yet</div>';
-      return;
+    if (!append) {
+      container.innerHTML = "";
+      
+      if (pdfNames.length === 0) {
+        container.innerHTML = '<div style="text-align: center; color: var(--text-secondary);">No reports generated yet</div>';
+        return;
+      }
     }
     
     pdfNames.forEach(filename => {
@@ -992,9 +1063,11 @@ class PdfGeneratorPanel extends HTMLElement {
       wrapper.style.marginBottom = "4px";
       
       const link = document.createElement("a");
-      link.href = `/local/receipts/${filename}`;
-      link.target = "_blank";
-      link.rel = "noopener noreferrer";
+      link.href = `/api/sensor_pdf_generator/receipts/${encodeURIComponent(filename)}`;
+      link.onclick = (event) => {
+        event.preventDefault();
+        this._openSigned(link.getAttribute("href"));
+      };
       link.className = "pdf-link";
       link.style.flex = "1";
       link.style.marginBottom = "0";
@@ -1030,8 +1103,9 @@ class PdfGeneratorPanel extends HTMLElement {
               { filename: filename }
             );
             
-            // Remove from UI immediately
+            // Remove from UI immediately, and from the offset of the next page
             wrapper.remove();
+            this.pdfCount = Math.max(this.pdfCount - 1, 0);
             
             // Show success message
             const statusDiv = document.createElement("div");
@@ -1081,191 +1155,32 @@ class PdfGeneratorPanel extends HTMLElement {
   async _getUsersFromHass() {
     if (!this._hass) return [];
 
-    console.log("=== STARTING USER DISCOVERY ===");
-
-    let deviceRegistry = {};
-    let entityRegistry = {};
-    let areaRegistry = {};
-    let floorRegistry = {};
-    
+    let response;
     try {
-      // Fetch floors
-      const floors = await this._hass.callWS({
-        type: "config/floor_registry/list"
-      });
-      
-      floors.forEach(floor => {
-        floorRegistry[floor.floor_id] = floor.name;
-      });
-      
-      console.log("Floors found:", floorRegistry);
-      
-      // Fetch areas
-      const areas = await this._hass.callWS({
-        type: "config/area_registry/list"
-      });
-      
-      areas.forEach(area => {
-        areaRegistry[area.area_id] = {
-          name: area.name,
-          floor_id: area.floor_id  // Areas are assigned to floors
-        };
-      });
-      
-      console.log("Areas found:", areaRegistry);
-      
-      // Fetch devices
-      const devices = await this._hass.callWS({
-        type: "config/device_registry/list"
-      });
-      
-      devices.forEach(device => {
-        deviceRegistry[device.id] = {
-          id: device.id,
-          name: device.name,
-          name_by_user: device.name_by_user,
-          manufacturer: device.manufacturer,
-          model: device.model,
-          model_id: device.model_id,
-          area_id: device.area_id
-        };
+      // The integration keeps the breakers indexed from the registries
+      response = await this._hass.connection.sendMessagePromise({
+        type: "sensor_pdf_generator/meters/list"
       });
-      
-      // Fetch entities
-      const entities = await this._hass.callWS({
-        type: "config/entity_registry/list"
-      });
-      
-      entities.forEach(entity => {
-        if (entity.device_id) {
-          entityRegistry[entity.entity_id] = {
-            device_id: entity.device_id,
-            area_id: entity.area_id
-          };
-        }
-      });
-      
     } catch (error) {
-      console.error("Failed to fetch registry data:", error);
+      console.error("Failed to fetch meters:", error);
+      this._floors = [];
+      return [];
     }
 
-    const sensorTypes = [
-      "phase_a_current",
-      "phase_a_power", 
-      "phase_a_voltage",
-      "total_energy"
-    ];
-  
-    const breakers = {};
-  
-    Object.keys(this._hass.states).forEach(entityId => {
-      if (!entityId.startsWith("sensor.")) return;
-      
-      const lower = entityId.toLowerCase();
-  
-      sensorTypes.forEach(type => {
-        if (lower.endsWith(`_${type}`)) {
-          const withoutSensor = entityId.substring("sensor.".length);
-          const baseName = withoutSensor.substring(0, withoutSensor.length - (`_${type}`).length);
-          
-          const stateObj = this._hass.states[entityId];
-          const entityInfo = entityRegistry[entityId];
-          const deviceId = entityInfo?.device_id;
-          const deviceInfo = deviceId ? deviceRegistry[deviceId] : null;
-          
-          // Get area from entity or device
-          const areaId = entityInfo?.area_id || deviceInfo?.area_id;
-          const areaInfo = areaId ? areaRegistry[areaId] : null;
-          const areaName = areaInfo?.name || null;
-          
-          // Get floor from area (areas are assigned to floors)
-          const floorId = areaInfo?.floor_id;
-          const floorName = floorId ? floorRegistry[floorId] : null;
-          
-          if (!breakers[baseName]) {
-            breakers[baseName] = {
-              types: new Set(),
-              friendlyName: null,
-              allEntities: {},
-              deviceId: deviceId,
-              deviceInfo: deviceInfo,
-              area: areaName,
-              floor: floorName,
-              areaId: areaId,
-              floorId: floorId
-            };
-          }
-          breakers[baseName].types.add(type);
-          breakers[baseName].allEntities[type] = {
-            entityId: entityId,
-            state: stateObj?.state,
-            attributes: stateObj?.attributes,
-            fullStateObj: stateObj
-          };
-          
-          if (type === "total_energy" || !breakers[baseName].friendlyName) {
-            if (stateObj?.attributes?.friendly_name) {
-              breakers[baseName].friendlyName = stateObj.attributes.friendly_name;
-            }
-          }
-        }
-      });
-    });
-    
-    console.log(`Total breakers found: ${Object.keys(breakers).length}`);
-    
-    const users = Object.entries(breakers).map(([baseName, data]) => {
-      console.log(`\n--- Processing breaker: ${baseName} ---`);
-      
-      if (!data.deviceInfo) {
-        console.log("❌ SKIPPING - No device info");
-        return null;
-      }
-      
-      const isTuyaDevice = data.deviceInfo.manufacturer === "Tuya";
-      const hasCorrectModelId = data.deviceInfo.model_id === "vylye9wwllb1av7a";
-      
-      if (!isTuyaDevice || !hasCorrectModelId) {
-        console.log("❌ SKIPPING - Not a Tuya device with model_id 'vylye9wwllb1av7a'");
-        return null;
-      }
-      
-      if (!data.types.has("phase_a_current") || !data.types.has("total_energy")) {
-        console.log("❌ SKIPPING - Missing required sensors");
-        return null;
-      }
-  
-      const sensors = {};
-      sensorTypes.forEach(type => {
-        if (data.types.has(type)) {
-          sensors[type] = `sensor.${baseName}_${type}`;
-        }
-      });
+    this._floors = response.floors;
+
+    const users = response.meters.map(meter => ({
+      name: meter.name,
+      displayName: meter.friendly_name
+        ? this._sanitizeDisplayName(meter.friendly_name)
+        : meter.name,
+      sensors: meter.sensors,
+      building: meter.area || "Unassigned", // area -> building
+      street: meter.floor || "Unassigned" // floor (from area) -> street
+    }));
+
+    console.log(`Meters found: ${users.length}`);
 
-      const displayName = data.friendlyName 
-        ? this._sanitizeDisplayName(data.friendlyName)
-        : baseName;
-
-      const userObj = {
-        name: baseName,
-        displayName: displayName,
-        sensors,
-        deviceId: data.deviceId,
-        deviceInfo: data.deviceInfo,
-        allEntities: data.allEntities,
-        building: data.area || "Unassigned", // area -> building
-        street: data.floor || "Unassigned", // floor (from area) -> street
-        areaId: data.areaId,
-        floorId: data.floorId
-      };
-      
-      console.log("✅ INCLUDED - Display Name:", displayName, "| Building (Area):", userObj.building, "| Street (Floor):", userObj.street);
-      
-      return userObj;
-    }).filter(u => u !== null);
-    
-    console.log(`\n=== FINAL RESULT: ${users.length} users included ===\n`);
-    
     return users;
   }
 
@@ -1674,18 +1589,16 @@ class PdfGeneratorPanel extends HTMLElement {
     const entityIds = selectedUserObjects.map(user => user.sensors.total_energy);
     
     try {
-      await this.hass.callService(
-        "sensor_pdf_generator",
-        "generate_pdf",
-        {
-          total_energy_entity_ids: entityIds,
-          filename_prefix: "receipt",
-          start_date: dateRange.startString,
-          end_date: dateRange.endString
-        }
-      );
+      const response = await this.hass.connection.sendMessagePromise({
+        type: "sensor_pdf_generator/generate",
+        total_energy_entity_ids: entityIds,
+        filename_prefix: "receipt",
+        start_date: dateRange.startString,
+        end_date: dateRange.endString
+      });
       
-      // Status will be updated by the event handler
+      // Status will be updated as the job reports progress
+      await this._subscribeJob(response.job_id);
     } catch (err) {
       console.error("Service call failed:", err);
       status.className = "status-message error";
@@ -1735,41 +1648,25 @@ class PdfGeneratorPanel extends HTMLElement {
 
   async _populateAllStreets() {
     const streetFilter = this.shadowRoot.getElementById("street-filter");
-    
-    try {
-      // Fetch all floors from Home Assistant
-      const floors = await this._hass.callWS({
-        type: "config/floor_registry/list"
-      });
-      
-      console.log("All floors/streets found:", floors);
-      
-      // Clear and add all floors as streets
-      streetFilter.innerHTML = '<option value="all">All Streets</option>';
-      
-      // Sort floors by name and add them
-      floors
-        .map(floor => floor.name)
-        .sort()
-        .forEach(floorName => {
-          const option = document.createElement("option");
-          option.value = floorName;
-          option.textContent = floorName;
-          streetFilter.appendChild(option);
-        });
-      
-      console.log("Streets populated successfully");
-        
-    } catch (error) {
-      console.error("Failed to fetch floors:", error);
-      
-      // Fallback: just show Unassigned if fetching fails
-      streetFilter.innerHTML = '<option value="all">All Streets</option>';
+    streetFilter.innerHTML = '<option value="all">All Streets</option>';
+
+    // The floors come sorted by name with the meter list
+    const floors = this._floors || [];
+    if (!floors.length) {
+      // Fallback: just show Unassigned if there are no floors
       const option = document.createElement("option");
       option.value = "Unassigned";
       option.textContent = "Unassigned";
       streetFilter.appendChild(option);
+      return;
     }
+
+    floors.forEach(floorName => {
+      const option = document.createElement("option");
+      option.value = floorName;
+      option.textContent = floorName;
+      streetFilter.appendChild(option);
+    });
   }
 
   _applyFilters() {
@@ -0,0 +1,490 @@
+"""Persistent index of the generated receipts."""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, DOWNLOAD_EXTENSIONS, LEGACY_RECEIPTS_DIR, RECEIPTS_DIR, RETENTION_ARCHIVE_DIR
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_RECEIPT_INDEX = "receipt_index"
+RECEIPT_INDEX_FILENAME = f"{DOMAIN}.receipts.db"
+
+# Receipt files are locked while they are written, archived or deleted. Files
+# share a fixed number of locks, so there are never more locks than this
+FILE_LOCK_STRIPES = 64
+# Seconds between attempts of the event loop to take a file lock held by the executor
+FILE_LOCK_POLL_INTERVAL = 0.05
+
+# Receipts written before the index existed only carry their period in the filename
+_FILENAME_PERIOD = re.compile(r"_(\d{8})_(\d{8})\.pdf$", re.IGNORECASE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    filename TEXT NOT NULL,
+    entity_id TEXT NOT NULL DEFAULT '',
+    entity_name TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    total_energy REAL,
+    energy_used REAL,
+    amount REAL,
+    page INTEGER,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    cache_key TEXT,
+    PRIMARY KEY (filename, entity_id)
+);
+CREATE INDEX IF NOT EXISTS receipts_mtime ON receipts (mtime DESC, filename);
+CREATE INDEX IF NOT EXISTS receipts_entity ON receipts (entity_id, mtime DESC);
+CREATE INDEX IF NOT EXISTS receipts_period ON receipts (start_date, end_date);
+"""
+
+# Columns added after the first release of the index, with their definitions
+_ADDED_COLUMNS = {
+    "cache_key": "TEXT",
+    # The monthly archive in the archive folder holding the receipt, NULL while it is a file in the receipts folder
+    "archive": "TEXT",
+}
+
+_INSERT_COLUMNS = (
+    "filename", "entity_id", "entity_name", "start_date", "end_date", "total_energy",
+    "energy_used", "amount", "page", "size", "mtime", "cache_key",
+)
+
+
+class ReceiptIndex:
+    """SQLite index of the receipts in the receipts folder.
+
+    Every receipt file has one row per entity it holds, so a bundle is listed
+    once but can be found by any of its meters. Receipts rolled into a
+    monthly archive by the retention policy stay indexed under their
+    archive. All methods block and must run in the executor.
+
+    The index also holds the locks of the receipt files, so a receipt is
+    never written again while it is moved into an archive or deleted.
+    """
+
+    def __init__(self, db_path: str, receipts_dir: str) -> None:
+        """Create the index. The database is opened by open()."""
+        self.db_path = db_path
+        self.receipts_dir = receipts_dir
+        self.archive_dir = os.path.join(receipts_dir, RETENTION_ARCHIVE_DIR)
+        self._connection = None
+        self._lock = threading.Lock()
+        self._file_locks = [threading.Lock() for _ in range(FILE_LOCK_STRIPES)]
+
+    def get_file_lock(self, filename: str) -> threading.Lock:
+        """Return the lock of a receipt file, held while it is written, archived or deleted."""
+        return self._file_locks[hash(filename) % FILE_LOCK_STRIPES]
+
+    @contextmanager
+    def lock_files(self, filenames: list):
+        """Hold the locks of receipt files or archives, waiting while any of them is written.
+
+        Locks are taken in stripe order, so two callers never wait for each other.
+        """
+        stripes = sorted({hash(filename) % FILE_LOCK_STRIPES for filename in filenames})
+        for stripe in stripes:
+            self._file_locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._file_locks[stripe].release()
+
+    def open(self) -> None:
+        """Open the database, importing the existing receipts when it is new and pruning it otherwise."""
+        is_new = not os.path.exists(self.db_path)
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(receipts)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE receipts ADD COLUMN {column} {definition}")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS receipts_cache_key ON receipts (cache_key)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS receipts_archive ON receipts (archive)")
+        if is_new:
+            self._import_receipts_dir()
+        else:
+            pruned = self.prune()
+            if pruned:
+                _LOGGER.info(f"Dropped {pruned} receipts removed from disk from the index")
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _import_receipts_dir(self) -> None:
+        """Index the receipts already on disk by filename, size and mtime."""
+        if not os.path.isdir(self.receipts_dir):
+            return
+        rows = []
+        with os.scandir(self.receipts_dir) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith('.pdf') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                start_date = end_date = None
+                match = _FILENAME_PERIOD.search(entry.name)
+                if match:
+                    try:
+                        start_date = datetime.strptime(match.group(1), "%Y%m%d").strftime("%Y-%m-%d")
+                        end_date = datetime.strptime(match.group(2), "%Y%m%d").strftime("%Y-%m-%d")
+                    except ValueError:
+                        start_date = end_date = None
+                rows.append((entry.name, start_date, end_date, stat.st_size, stat.st_mtime))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO receipts (filename, start_date, end_date, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        _LOGGER.info(f"Indexed {len(rows)} existing receipts")
+
+    def add(self, path: str, entries: list, start_date: datetime = None, end_date: datetime = None, cache_key: str = None) -> None:
+        """Record a written receipt file and the entities it holds, replacing any previous rows.
+
+        The file is stored under cache_key, or else under the cache_key of
+        each entry.
+        """
+        filename = os.path.basename(path)
+        stat = os.stat(path)
+        period = (
+            start_date.strftime("%Y-%m-%d") if start_date else None,
+            end_date.strftime("%Y-%m-%d") if end_date else None,
+        )
+        rows = [
+            (
+                filename,
+                entry.get('entity_id') or '',
+                entry.get('entity_name'),
+                *period,
+                entry.get('total_energy'),
+                entry.get('energy_used'),
+                entry.get('amount'),
+                entry.get('page'),
+                stat.st_size,
+                stat.st_mtime,
+                cache_key or entry.get('cache_key'),
+            )
+            for entry in entries
+        ]
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM receipts WHERE filename = ?", (filename,))
+            self._connection.executemany(
+                f"INSERT INTO receipts ({', '.join(_INSERT_COLUMNS)}) VALUES ({', '.join('?' * len(_INSERT_COLUMNS))})",
+                rows,
+            )
+
+    def find(self, cache_key: str):
+        """Return the filename of a receipt stored under cache_key that is still on disk, or None.
+
+        Archived receipts are not reused, a new one is rendered in their place.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT filename FROM receipts WHERE cache_key = ? AND archive IS NULL ORDER BY mtime DESC",
+                (cache_key,),
+            ).fetchall()
+        for (filename,) in rows:
+            if os.path.exists(os.path.join(self.receipts_dir, filename)):
+                return filename
+            self.remove(filename)
+        return None
+
+    def remove(self, filename: str) -> None:
+        """Forget a receipt file."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM receipts WHERE filename = ?", (filename,))
+
+    def prune(self) -> int:
+        """Forget the files and archives that were removed from disk behind the index's back, returning how many files."""
+        with self._lock:
+            rows = self._connection.execute("SELECT DISTINCT filename, archive FROM receipts").fetchall()
+        missing = []
+        archives = {}
+        for filename, archive in rows:
+            if archive is None:
+                exists = os.path.exists(os.path.join(self.receipts_dir, filename))
+            else:
+                if archive not in archives:
+                    archives[archive] = os.path.exists(os.path.join(self.archive_dir, archive))
+                exists = archives[archive]
+            if not exists:
+                missing.append((filename,))
+        if missing:
+            with self._lock, self._connection:
+                self._connection.executemany("DELETE FROM receipts WHERE filename = ?", missing)
+        return len(missing)
+
+    def query(
+        self,
+        entity_id: str = None,
+        start_date: str = None,
+        end_date: str = None,
+        limit: int = None,
+        offset: int = 0,
+        include_archived: bool = False,
+    ) -> tuple:
+        """Return one page of receipt files, newest first, and the number of matching files.
+
+        start_date and end_date (YYYY-MM-DD) select receipts whose billing
+        period overlaps them. Archived receipts are only listed with
+        include_archived, together with their archive. Files removed from
+        disk behind the index's back are listed until prune() drops them, so
+        pages never shift while they are read.
+        """
+        conditions = []
+        params = []
+        if not include_archived:
+            conditions.append("archive IS NULL")
+        if entity_id:
+            conditions.append("entity_id = ?")
+            params.append(entity_id)
+        if start_date:
+            conditions.append("end_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("start_date <= ?")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            total = self._connection.execute(
+                f"SELECT COUNT(DISTINCT filename) FROM receipts {where}", params
+            ).fetchone()[0]
+            rows = self._connection.execute(
+                f"""
+                SELECT filename, MAX(mtime), MAX(size), MIN(start_date), MAX(end_date),
+                       COUNT(NULLIF(entity_id, '')), GROUP_CONCAT(NULLIF(entity_id, '')), SUM(amount), MAX(archive)
+                FROM receipts {where}
+                GROUP BY filename
+                ORDER BY MAX(mtime) DESC, filename
+                LIMIT ? OFFSET ?
+                """,
+                [*params, limit if limit is not None else -1, offset],
+            ).fetchall()
+
+        receipts = []
+        for filename, mtime, size, period_start, period_end, entity_count, entity_ids, amount, archive in rows:
+            receipts.append({
+                "filename": filename,
+                "entity_ids": entity_ids.split(",") if entity_ids else [],
+                "entity_count": entity_count,
+                "start_date": period_start,
+                "end_date": period_end,
+                "amount": amount,
+                "size": size,
+                "mtime": mtime,
+                "archive": archive,
+            })
+        return receipts, total
+
+    def files(self, start_date: str = None, end_date: str = None) -> dict:
+        """Return every indexed file whose billing period overlaps start_date and end_date, with the entity IDs it holds.
+
+        Dates are YYYY-MM-DD, and files without a period only match when
+        neither is given.
+        """
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append("end_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("start_date <= ?")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            rows = self._connection.execute(f"SELECT filename, entity_id FROM receipts {where}", params).fetchall()
+        files = {}
+        for filename, entity_id in rows:
+            entity_ids = files.setdefault(filename, set())
+            if entity_id:
+                entity_ids.add(entity_id)
+        return files
+
+    def archived(self, filenames: list) -> dict:
+        """Return the archive of each of filenames that is archived."""
+        archives = {}
+        with self._lock:
+            for filename in filenames:
+                row = self._connection.execute(
+                    "SELECT archive FROM receipts WHERE filename = ? AND archive IS NOT NULL LIMIT 1", (filename,)
+                ).fetchone()
+                if row:
+                    archives[filename] = row[0]
+        return archives
+
+    def expired(self, before: str) -> dict:
+        """Return the receipt files in the receipts folder whose billing period ended before a YYYY-MM-DD date, by month.
+
+        A receipt belongs to the month (YYYY-MM) its period starts in, and a
+        receipt without a period to the month it was written in, in Home
+        Assistant's time zone.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT filename, MIN(start_date), MAX(end_date), MAX(mtime)
+                FROM receipts
+                WHERE archive IS NULL
+                GROUP BY filename
+                HAVING MAX(end_date) < ? OR MAX(end_date) IS NULL
+                ORDER BY filename
+                """,
+                (before,),
+            ).fetchall()
+        months = {}
+        for filename, start_date, end_date, mtime in rows:
+            if start_date is None or end_date is None:
+                written = dt_util.as_local(dt_util.utc_from_timestamp(mtime)).strftime("%Y-%m-%d")
+                start_date = start_date or written
+                if (end_date or written) >= before:
+                    continue
+            months.setdefault(start_date[:7], []).append(filename)
+        return months
+
+    def archive_members(self, archive: str) -> set:
+        """Return the filenames indexed in an archive."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT filename FROM receipts WHERE archive = ?", (archive,)
+            ).fetchall()
+        return {filename for (filename,) in rows}
+
+    def set_archive(self, filenames: list, archive: str) -> None:
+        """Record that receipt files were moved into an archive."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE receipts SET archive = ? WHERE filename = ?", [(archive, filename) for filename in filenames]
+            )
+
+    def remove_archive(self, archive: str) -> int:
+        """Forget every receipt in an archive, returning how many there were."""
+        with self._lock, self._connection:
+            count = self._connection.execute(
+                "SELECT COUNT(DISTINCT filename) FROM receipts WHERE archive = ?", (archive,)
+            ).fetchone()[0]
+            self._connection.execute("DELETE FROM receipts WHERE archive = ?", (archive,))
+        return count
+
+
+def get_receipts_dir(hass: HomeAssistant) -> str:
+    """Return the folder holding the receipts, ledgers and their archives."""
+    return hass.config.path(DOMAIN, RECEIPTS_DIR)
+
+
+def _move_legacy_receipts(legacy_dir: str, receipts_dir: str) -> int:
+    """Move the receipts, ledgers and archives of www/receipts to the receipts folder, returning how many moved.
+
+    Files left behind by interrupted writes are removed, and so are the old
+    folders once empty.
+    """
+    moved = 0
+    for folder, extensions in (("", DOWNLOAD_EXTENSIONS), (RETENTION_ARCHIVE_DIR, (".zip",))):
+        source_dir = os.path.join(legacy_dir, folder)
+        if not os.path.isdir(source_dir):
+            continue
+        with os.scandir(source_dir) as entries:
+            files = [entry.name for entry in entries if entry.is_file()]
+        for name in files:
+            if name.startswith(".") and name.endswith(".tmp"):
+                os.remove(os.path.join(source_dir, name))
+            elif not name.startswith(".") and name.lower().endswith(extensions):
+                os.makedirs(os.path.join(receipts_dir, folder), exist_ok=True)
+                shutil.move(os.path.join(source_dir, name), os.path.join(receipts_dir, folder, name))
+                moved += 1
+    for folder in (RETENTION_ARCHIVE_DIR, ""):
+        try:
+            os.rmdir(os.path.join(legacy_dir, folder))
+        except OSError:
+            pass
+    return moved
+
+
+async def async_open_receipt_index(hass: HomeAssistant) -> ReceiptIndex:
+    """Open the shared receipt index, importing the existing receipts the first time.
+
+    Receipts still in www/receipts, where they were public, are moved to
+    the receipts folder first.
+    """
+    receipts_dir = get_receipts_dir(hass)
+    moved = await hass.async_add_executor_job(
+        _move_legacy_receipts, hass.config.path(*LEGACY_RECEIPTS_DIR), receipts_dir
+    )
+    if moved:
+        _LOGGER.info(f"Moved {moved} receipts and ledgers from www/receipts to {receipts_dir}")
+    index = ReceiptIndex(hass.config.path(".storage", RECEIPT_INDEX_FILENAME), receipts_dir)
+    await hass.async_add_executor_job(index.open)
+    hass.data.setdefault(DOMAIN, {})[DATA_RECEIPT_INDEX] = index
+    return index
+
+
+def get_receipt_index(hass: HomeAssistant):
+    """Return the shared receipt index, or None if it is not open."""
+    return hass.data.get(DOMAIN, {}).get(DATA_RECEIPT_INDEX)
+
+
+@asynccontextmanager
+async def async_lock_receipt_file(hass: HomeAssistant, filename: str):
+    """Hold the lock of a receipt file while it is written, so the retention policy leaves it alone.
+
+    The lock is shared with the executor, so it is polled instead of
+    blocking the event loop.
+    """
+    index = get_receipt_index(hass)
+    if index is None:
+        yield
+        return
+    lock = index.get_file_lock(filename)
+    while not lock.acquire(blocking=False):
+        await asyncio.sleep(FILE_LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+async def async_find_cached_receipt(hass: HomeAssistant, cache_key: str):
+    """Return the filename of an existing receipt generated from the same inputs, or None."""
+    index = get_receipt_index(hass)
+    if index is None:
+        return None
+    return await hass.async_add_executor_job(index.find, cache_key)
+
+
+async def async_index_receipt(hass: HomeAssistant, path: str, entries: list, start_date: datetime = None, end_date: datetime = None, cache_key: str = None) -> None:
+    """Record a written receipt file in the index.
+
+    The file is already on disk, so failing to index it is only logged.
+    """
+    index = get_receipt_index(hass)
+    if index is None:
+        return
+    try:
+        await hass.async_add_executor_job(index.add, path, entries, start_date, end_date, cache_key)
+    except Exception as e:
+        _LOGGER.error(f"Error indexing receipt {path}: {e}")
+
+
+async def async_close_receipt_index(hass: HomeAssistant) -> None:
+    """Close the shared receipt index if it is open."""
+    index = hass.data.get(DOMAIN, {}).pop(DATA_RECEIPT_INDEX, None)
+    if index is not None:
+        await hass.async_add_executor_job(index.close)
@@ -0,0 +1,580 @@
+"""Receipt rendering for the Sensor PDF Generator integration."""
+import copy
+import logging
+import os
+import random
+import string
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from fontTools import subset as ftsubset
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.enums import TextEmphasis
+from fpdf.fonts import SubsetMap, TTFFont
+from fpdf.output import OutputProducer
+from fpdf.syntax import PDFArray
+
+from .billing import get_default_bill
+from .const import DOMAIN, RECEIPTS_DIR
+
+_LOGGER = logging.getLogger(__name__)
+
+FONT_FAMILY = "Amiri"
+FONT_STYLES = ("", "B")
+
+ARABIC_TITLE = "إيصال"
+
+ARABIC_LABELS = [
+    "معرف التقرير",
+    "تاريخ الإصدار",
+    "فترة الفوترة",
+    "مدة الفترة",
+    "إجمالي قراءة الطاقة (ك.و.س)",
+    "الطاقة المستهلكة (ك.و.س)",
+    "رسوم الخدمة الثابتة",
+    "تعرفة كل ك.و.س",
+    "المبلغ الإجمالي المستحق",
+]
+
+# Characters the compiled receipt template can print: ASCII, the Arabic block
+# and the Arabic presentation forms produced by arabic_reshaper
+TEMPLATE_CHARSET_RANGES = [
+    (0x0020, 0x007E),
+    (0x0600, 0x06FF),
+    (0xFE70, 0xFEFF),
+]
+
+# Render contexts keyed by font path, shared by every render in the process
+_RENDER_CONTEXTS = {}
+_RENDER_CONTEXTS_LOCK = threading.Lock()
+
+
+class ReceiptRenderContext:
+    """Parsed Amiri font and pre-shaped static strings reused across receipts.
+
+    fpdf2 subsets a document's fonts in place when it is written out, so each
+    document still needs its own TTFFont. The expensive part of add_font is
+    walking the cmap to build the width and glyph tables, and those are
+    read-only once built, so every document gets a cheap clone that shares
+    them with a prototype parsed once here. This relies on TTFFont internals
+    of the fpdf2 version pinned in manifest.json.
+    """
+
+    def __init__(self, font_path: str, mtime: float) -> None:
+        """Parse the font and shape the static Arabic strings."""
+        self.font_path = font_path
+        self.mtime = mtime
+        with open(font_path, "rb") as font_file:
+            self.font_data = font_file.read()
+        self._prototype = TTFFont(FPDF(), BytesIO(self.font_data), FONT_FAMILY.lower(), "")
+
+        self.arabic_title = get_display(arabic_reshaper.reshape(ARABIC_TITLE))
+        self.arabic_labels = [
+            get_display(arabic_reshaper.reshape(label)) for label in ARABIC_LABELS
+        ]
+
+        self._compiled_font = None
+        self._templates = {}
+        self._templates_lock = threading.Lock()
+
+    def get_template(self, has_meter: bool) -> "ReceiptTemplate":
+        """Return the compiled receipt template, compiling it on first use."""
+        template = self._templates.get(has_meter)
+        if template is not None:
+            return template
+
+        with self._templates_lock:
+            template = self._templates.get(has_meter)
+            if template is None:
+                if self._compiled_font is None:
+                    static_text = self.arabic_title + "".join(self.arabic_labels)
+                    self._compiled_font = CompiledFont(self.font_data, static_text)
+                template = ReceiptTemplate(self, self._compiled_font, has_meter)
+                self._templates[has_meter] = template
+        return template
+
+    def add_fonts(self, pdf: FPDF) -> None:
+        """Register the Amiri font styles on a new document."""
+        for style in FONT_STYLES:
+            fontkey = f"{FONT_FAMILY.lower()}{style}"
+            pdf.fonts[fontkey] = self._clone_font(pdf, fontkey, style)
+
+    def _clone_font(self, pdf: FPDF, fontkey: str, style: str) -> TTFFont:
+        """Return a per-document TTFFont sharing the prototype's parsed tables."""
+        prototype = self._prototype
+        font = TTFFont.__new__(TTFFont)
+        for slot in ("type", "name", "up", "ut", "cw", "scale", "cmap", "glyph_ids"):
+            setattr(font, slot, getattr(prototype, slot))
+        # The descriptor becomes a PDF object of the document it is written to
+        font.desc = copy.copy(prototype.desc)
+        font.i = len(pdf.fonts) + 1
+        font.fontkey = fontkey
+        font.ttffile = self.font_path
+        font.emphasis = TextEmphasis.coerce(style)
+        font.hbfont = None
+        font.missing_glyphs = []
+        # Only the glyph outlines are read from here, when the subset is written
+        font.ttfont = ttLib.TTFont(
+            BytesIO(self.font_data), recalcTimestamp=False, fontNumber=0, lazy=True
+        )
+        identities = "\x00 \r\n"
+        if pdf.str_alias_nb_pages:
+            identities += "0123456789" + pdf.str_alias_nb_pages
+        font.subset = SubsetMap(font, [ord(char) for char in identities])
+        return font
+
+
+class CompiledFont:
+    """Receipt font cut down to a fixed character set, with its PDF objects prebuilt.
+
+    Every document stamped from a template uses the same glyph subset, so the
+    fontTools subsetting and the font, width and CMap objects fpdf2 normally
+    builds on each output are built here once and only copied per document.
+    """
+
+    def __init__(self, font_data: bytes, static_text: str) -> None:
+        """Subset the font to the template character set and build its PDF objects."""
+        full_font = ttLib.TTFont(BytesIO(font_data), recalcTimestamp=False, fontNumber=0, lazy=True)
+        available = full_font.getBestCmap()
+        unicodes = {ord(char) for char in static_text}
+        for first, last in TEMPLATE_CHARSET_RANGES:
+            unicodes.update(range(first, last + 1))
+        # Same options fpdf2 uses when it subsets fonts on output
+        options = ftsubset.Options(notdef_outline=True, recommended_glyphs=True)
+        options.drop_tables += ["FFTM", "GDEF", "GPOS", "GSUB", "MATH", "hdmx", "meta"]
+        subsetter = ftsubset.Subsetter(options)
+        subsetter.populate(unicodes=[unicode for unicode in unicodes if unicode in available])
+        subsetter.subset(full_font)
+        output = BytesIO()
+        full_font.save(output)
+        full_font.close()
+
+        pdf = FPDF()
+        fontkey = FONT_FAMILY.lower()
+        self.prototype = TTFFont(pdf, BytesIO(output.getvalue()), fontkey, "")
+        self.charset = frozenset(self.prototype.cmap)
+
+        # Assign every character its code up front so all documents share one mapping
+        identities = "\x00 \r\n"
+        if pdf.str_alias_nb_pages:
+            identities += "0123456789" + pdf.str_alias_nb_pages
+        self.subset = SubsetMap(self.prototype, [ord(char) for char in identities])
+        for unicode in sorted(self.charset):
+            self.subset.pick(unicode)
+        self.prototype.subset = self.subset
+
+        # Let fpdf2 build the embedded font objects once
+        pdf.fonts[fontkey] = self.prototype
+        self._composite = OutputProducer(pdf)._add_fonts()[self.prototype.i]
+
+    def covers(self, text: str) -> bool:
+        """Return True if every character of the text is in the compiled font."""
+        return all(ord(char) in self.charset for char in text)
+
+    def add_pdf_objs(self, output_producer: OutputProducer):
+        """Add copies of the prebuilt font objects to a document being written."""
+        composite = copy.copy(self._composite)
+        cid_font = copy.copy(self._composite.descendant_fonts[0])
+        descriptor = copy.copy(cid_font.font_descriptor)
+        composite.descendant_fonts = PDFArray([cid_font])
+        composite.to_unicode = copy.copy(composite.to_unicode)
+        cid_font.c_i_d_system_info = copy.copy(cid_font.c_i_d_system_info)
+        cid_font.c_i_d_to_g_i_d_map = copy.copy(cid_font.c_i_d_to_g_i_d_map)
+        cid_font.font_descriptor = descriptor
+        descriptor.font_file2 = copy.copy(descriptor.font_file2)
+        for pdf_obj in (
+            composite,
+            cid_font,
+            composite.to_unicode,
+            cid_font.c_i_d_system_info,
+            descriptor,
+            cid_font.c_i_d_to_g_i_d_map,
+            descriptor.font_file2,
+        ):
+            output_producer._add_pdf_obj(pdf_obj, "fonts")
+        return composite
+
+
+class _TemplateFont(TTFFont):
+    """Per-document handle on a compiled font, written out from its prebuilt objects."""
+
+    __slots__ = ("compiled",)
+
+
+class TemplateOutputProducer(OutputProducer):
+    """Output producer embedding compiled fonts instead of subsetting them."""
+
+    def _add_fonts(self):
+        fonts = self.fpdf.fonts
+        self.fpdf.fonts = {
+            fontkey: font for fontkey, font in fonts.items()
+            if not isinstance(font, _TemplateFont)
+        }
+        try:
+            font_objs_per_index = super()._add_fonts()
+        finally:
+            self.fpdf.fonts = fonts
+
+        # Both styles come from the same file, so they share one embedded font
+        embedded = {}
+        for font in fonts.values():
+            if isinstance(font, _TemplateFont):
+                if id(font.compiled) not in embedded:
+                    embedded[id(font.compiled)] = font.compiled.add_pdf_objs(self)
+                font_objs_per_index[font.i] = embedded[id(font.compiled)]
+        return font_objs_per_index
+
+
+class ReceiptTemplate:
+    """Receipt layout compiled once, leaving only the per-meter values to fill.
+
+    The fixed part of the page is drawn once and kept as raw content stream
+    operations, along with the position and font of every value cell.
+    Filling a receipt appends those operations to a new page and draws only
+    the value cells, using the compiled font.
+    """
+
+    def __init__(self, context: ReceiptRenderContext, compiled_font: CompiledFont, has_meter: bool) -> None:
+        """Draw the fixed layout and record where the values go."""
+        self.compiled_font = compiled_font
+        self.slots = []
+
+        pdf = FPDF()
+        pdf.add_page()
+        self.add_fonts(pdf)
+        start = len(pdf.pages[pdf.page].contents)
+
+        def record_slot(slot, w, h, **kwargs):
+            self.slots.append(
+                (slot, pdf.get_x(), pdf.get_y(), w, h, pdf.font_style, pdf.font_size_pt, kwargs.get("align", ""))
+            )
+            pdf.cell(w, h, "", **kwargs)
+
+        _draw_receipt(pdf, context, has_meter, record_slot)
+        self.static_content = bytes(pdf.pages[pdf.page].contents[start:])
+
+    def add_fonts(self, pdf: FPDF) -> None:
+        """Register the compiled font styles on a new document."""
+        prototype = self.compiled_font.prototype
+        for style in FONT_STYLES:
+            font = _TemplateFont.__new__(_TemplateFont)
+            for slot in ("type", "name", "desc", "up", "ut", "cw", "scale", "cmap", "glyph_ids", "subset", "ttffile"):
+                setattr(font, slot, getattr(prototype, slot))
+            font.i = len(pdf.fonts) + 1
+            font.fontkey = f"{FONT_FAMILY.lower()}{style}"
+            font.emphasis = TextEmphasis.coerce(style)
+            font.hbfont = None
+            font.ttfont = None
+            font.missing_glyphs = []
+            font.compiled = self.compiled_font
+            pdf.fonts[font.fontkey] = font
+
+    def covers(self, texts: dict) -> bool:
+        """Return True if every value can be printed with the compiled font."""
+        return all(self.compiled_font.covers(text) for text in texts.values())
+
+    def fill(self, texts: dict):
+        """Return a document with the values stamped in, or None if the font lacks a character."""
+        if not self.covers(texts):
+            return None
+
+        pdf = FPDF()
+        pdf.add_page()
+        self.add_fonts(pdf)
+        self.stamp(pdf, texts)
+        return pdf
+
+    def stamp(self, pdf: FPDF, texts: dict) -> None:
+        """Draw the layout with the values stamped in on the current page of a document using the compiled font."""
+        pdf._out(self.static_content)
+        # The fixed operations leave their own font selected, so the first value cell must set it again
+        pdf.font_family = ""
+        for slot, x, y, w, h, style, size, align in self.slots:
+            pdf.set_font(FONT_FAMILY, style, size)
+            pdf.set_xy(x, y)
+            pdf.cell(w, h, texts[slot], align=align)
+
+
+def get_render_context(config_dir: str) -> ReceiptRenderContext:
+    """Return the shared render context, rebuilding it when the font file changes."""
+    font_path = os.path.join(config_dir, "tts", "Amiri-Regular.ttf")
+    try:
+        mtime = os.stat(font_path).st_mtime
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Amiri-Regular.ttf not found in {os.path.join(config_dir, 'tts')}. "
+            "Please download Amiri-Regular.ttf from https://www.amirifont.org/ and place it in the tts folder inside your Home Assistant config directory."
+        ) from None
+
+    context = _RENDER_CONTEXTS.get(font_path)
+    if context is not None and context.mtime == mtime:
+        return context
+
+    with _RENDER_CONTEXTS_LOCK:
+        # Another render thread may have rebuilt it while we waited
+        context = _RENDER_CONTEXTS.get(font_path)
+        if context is None or context.mtime != mtime:
+            _LOGGER.debug(f"Loading receipt font from {font_path}")
+            context = ReceiptRenderContext(font_path, mtime)
+            _RENDER_CONTEXTS[font_path] = context
+    return context
+
+
+def _receipt_texts(total_energy: float, energy_used: float, start_date: datetime = None, end_date: datetime = None, entity_name: str = None, bill: dict = None) -> dict:
+    """Return the per-meter strings of a receipt, keyed by their layout slot.
+
+    The charges are printed from bill, by default the standard tariff's bill.
+    """
+    random_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+
+    # Use provided date range or default to last month
+    if start_date and end_date:
+        date_range = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+        period_days = (end_date - start_date).days + 1
+    else:
+        today = datetime.today()
+        first_day_last_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        last_day_last_month = first_day_last_month.replace(day=30)
+        date_range = f"{first_day_last_month.strftime('%Y-%m-%d')} to {last_day_last_month.strftime('%Y-%m-%d')}"
+        period_days = (last_day_last_month - first_day_last_month).days + 1
+
+    if bill is None:
+        bill = get_default_bill(energy_used)
+
+    english_values = [
+        random_id,
+        datetime.now().strftime("%Y-%m-%d %H:%M"),
+        date_range,
+        f"{period_days} days",
+        f"{total_energy:.2f}",
+        f"{energy_used:.2f}",
+        f"{bill['fixed_charge']:,}",
+        f"{bill['energy_rate']:,}",
+        f"{bill['total_cost']:,}",
+    ]
+    arabic_values = [
+        arabic_reshaper.reshape(str(val)) for val in english_values
+    ]
+
+    texts = {}
+    for index, (value, arabic_value) in enumerate(zip(english_values, arabic_values)):
+        texts[f"value_{index}"] = value
+        texts[f"arabic_value_{index}"] = get_display(arabic_value)
+
+    if entity_name:
+        # If the entity name contains Arabic characters, reshape + bidi it so Arabic glyphs render correctly
+        def _contains_arabic(s: str) -> bool:
+            if not s:
+                return False
+            for ch in s:
+                # Arabic blocks: \u0600-\u06FF, \u0750-\u077F, \u08A0-\u08FF, \uFB50-\uFDFF, \uFE70-\uFEFF
+                if ("\u0600" <= ch <= "\u06FF") or ("\u0750" <= ch <= "\u077F") or ("\u08A0" <= ch <= "\u08FF") or ("\uFB50" <= ch <= "\uFDFF") or ("\uFE70" <= ch <= "\uFEFF"):
+                    return True
+            return False
+
+        display_name = entity_name
+        if _contains_arabic(entity_name):
+            display_name = get_display(arabic_reshaper.reshape(entity_name))
+
+        texts["meter"] = f"Meter: {display_name}"
+        texts["arabic_meter"] = get_display(arabic_reshaper.reshape(f"العداد: {entity_name}"))
+
+    return texts
+
+
+def _draw_receipt(pdf: FPDF, context: ReceiptRenderContext, has_meter: bool, value_cell) -> None:
+    """Draw the receipt layout on the current page.
+
+    Cells whose text changes from meter to meter are drawn through
+    value_cell(slot, w, h, **kwargs) instead of pdf.cell, so the same layout
+    serves both direct rendering and template compilation.
+    """
+    margin = 10
+    page_width = pdf.w - 2 * margin
+    page_height = pdf.h - 2 * margin
+    pdf.set_draw_color(0, 0, 0)
+    pdf.rect(margin, margin, page_width, page_height)
+
+    # English section
+    pdf.set_xy(margin, margin + 5)
+    pdf.set_font("Amiri", "B", 18)
+    pdf.cell(page_width, 12, "ELECTRICITY RECEIPT", align="C", ln=1)
+
+    # Add entity name if provided
+    if has_meter:
+        pdf.set_font("Amiri", size=14)
+        value_cell("meter", page_width, 8, align="C", ln=1)
+
+    pdf.set_font("Amiri", size=13)
+    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
+
+    english_labels = [
+        "Report ID:",
+        "Generation Date:",
+        "Billing Period:",
+        "Period Duration:",
+        "Total Energy Reading (kWh):",
+        "Energy Consumed (kWh):",
+        "Fixed Service Charge:",
+        "Rate per kWh:",
+        "Total Amount Due:",
+    ]
+
+    for index, label in enumerate(english_labels):
+        pdf.set_x(margin + 5)
+        pdf.cell(page_width * 0.5, 10, label, border=0)
+        value_cell(f"value_{index}", page_width * 0.5, 10, border=0, ln=1)
+
+    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
+    pdf.ln(5)
+
+    # Arabic section (right-to-left, left margin)
+    pdf.set_font("Amiri", "B", 18)
+    pdf.cell(page_width, 12, context.arabic_title, align="C", ln=1)
+
+    # Add entity name in Arabic if provided
+    if has_meter:
+        pdf.set_font("Amiri", size=14)
+        value_cell("arabic_meter", page_width, 8, align="C", ln=1)
+
+    pdf.set_font("Amiri", size=13)
+    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
+
+    # Set X to left margin for visibility
+    for index, bidi_label in enumerate(context.arabic_labels):
+        pdf.set_x(margin)
+        value_cell(f"arabic_value_{index}", page_width * 0.5, 10, border=0, align="R")
+        pdf.cell(page_width * 0.5, 10, bidi_label, border=0, align="R", ln=1)
+
+    pdf.cell(page_width, 7, "-" * (int(page_width // 7)), align="C", ln=1)
+
+
+def generate_pdf_report(total_energy: float, energy_used: float, filename: str, config_dir: str, start_date: datetime = None, end_date: datetime = None, entity_name: str = None, compiled_template: bool = False, bill: dict = None, timings: dict = None) -> str:
+    """Generate a PDF report with English section at the top and Arabic section below using Amiri-Regular.ttf for Arabic.
+
+    The charges are printed from bill, as computed by the tariff engine, or
+    from the standard tariff without one.
+
+    With compiled_template the receipt is stamped onto the precompiled layout
+    instead, unless one of its values uses a character outside the template's
+    font, in which case it is rendered normally. Returns the written file path,
+    and sets the shaping and write times and file size in timings if given.
+    """
+    start = time.monotonic()
+    texts = _receipt_texts(total_energy, energy_used, start_date, end_date, entity_name, bill)
+    if timings is not None:
+        timings["shape"] = time.monotonic() - start
+
+    # Amiri-Regular.ttf from the tts folder is parsed once and shared between renders
+    context = get_render_context(config_dir)
+
+    pdf = None
+    output_producer_class = OutputProducer
+    if compiled_template:
+        pdf = context.get_template(bool(entity_name)).fill(texts)
+        if pdf is None:
+            _LOGGER.debug(f"Receipt for {entity_name} uses characters outside the compiled template, rendering it directly")
+        else:
+            output_producer_class = TemplateOutputProducer
+
+    if pdf is None:
+        pdf = FPDF()
+        pdf.add_page()
+        context.add_fonts(pdf)
+        _draw_receipt(
+            pdf,
+            context,
+            bool(entity_name),
+            lambda slot, w, h, **kwargs: pdf.cell(w, h, texts[slot], **kwargs),
+        )
+
+    return _write_pdf(pdf, filename, config_dir, output_producer_class, timings)
+
+
+def generate_pdf_bundle(receipts: list, filename: str, config_dir: str, start_date: datetime = None, end_date: datetime = None, compiled_template: bool = False, timings: dict = None) -> str:
+    """Generate one document holding a receipt page for every meter.
+
+    receipts is a list of dicts with total_energy, energy_used and entity_name,
+    plus an optional bill and group. The font is embedded once and subset across all
+    pages, and each new group starts a bookmark in the document outline.
+    With compiled_template every page is stamped onto the precompiled layout,
+    unless a value uses a character outside its font, in which case the whole
+    bundle is rendered normally. The shaping and write times and file size
+    are set in timings if given.
+    """
+    start = time.monotonic()
+    pages = [
+        (receipt, _receipt_texts(
+            receipt["total_energy"], receipt["energy_used"], start_date, end_date, receipt.get("entity_name"), receipt.get("bill")
+        ))
+        for receipt in receipts
+    ]
+    if timings is not None:
+        timings["shape"] = time.monotonic() - start
+
+    context = get_render_context(config_dir)
+
+    pdf = FPDF()
+    output_producer_class = OutputProducer
+    if compiled_template:
+        templates = [context.get_template(bool(receipt.get("entity_name"))) for receipt, _ in pages]
+        if all(template.covers(texts) for template, (_, texts) in zip(templates, pages)):
+            output_producer_class = TemplateOutputProducer
+        else:
+            _LOGGER.debug(f"Bundle {filename} uses characters outside the compiled template, rendering it directly")
+
+    if output_producer_class is TemplateOutputProducer:
+        # Both templates share the compiled font, so it is registered once
+        templates[0].add_fonts(pdf)
+    else:
+        context.add_fonts(pdf)
+
+    group = None
+    for index, (receipt, texts) in enumerate(pages):
+        pdf.add_page()
+        if receipt.get("group") and receipt["group"] != group:
+            group = receipt["group"]
+            pdf.start_section(group)
+
+        if output_producer_class is TemplateOutputProducer:
+            templates[index].stamp(pdf, texts)
+        else:
+            _draw_receipt(
+                pdf,
+                context,
+                bool(receipt.get("entity_name")),
+                lambda slot, w, h, **kwargs: pdf.cell(w, h, texts[slot], **kwargs),
+            )
+
+    return _write_pdf(pdf, filename, config_dir, output_producer_class, timings)
+
+
+def _write_pdf(pdf: FPDF, filename: str, config_dir: str, output_producer_class=OutputProducer, timings: dict = None) -> str:
+    """Write a document to the receipts folder and return its path.
+
+    Serializing the document, font subsetting included, counts as writing it.
+    """
+    start = time.monotonic()
+    # Receipts are kept in /config/sensor_pdf_generator/receipts/, outside www
+    receipts_dir = os.path.join(config_dir, DOMAIN, RECEIPTS_DIR)
+    os.makedirs(receipts_dir, exist_ok=True)
+    pdf_output_path = os.path.join(receipts_dir, filename)
+    # Write next to the target and rename it into place, so readers never see a partial file
+    temp_path = os.path.join(receipts_dir, f".{filename}.{uuid.uuid4().hex}.tmp")
+    try:
+        pdf.output(temp_path, output_producer_class=output_producer_class)
+        os.replace(temp_path, pdf_output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if timings is not None:
+        timings["write"] = time.monotonic() - start
+        timings["bytes"] = os.path.getsize(pdf_output_path)
+    return pdf_output_path
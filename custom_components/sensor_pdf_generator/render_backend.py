@@ -0,0 +1,165 @@
+"""Rendering backends for receipt generation."""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from concurrent.futures.process import BrokenProcessPool
+
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, RENDER_BACKEND_PROCESS
+from .metrics import COUNTER_BYTES_WRITTEN, STAGE_RENDER, STAGE_SHAPE, STAGE_WRITE, async_increment, async_record
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_RENDER_POOL = "render_pool"
+
+
+# The rendering stack (fpdf, fontTools, arabic_reshaper and bidi) is only
+# imported by the functions below, which run in the executor or a worker, so
+# loading the integration does not pay for it and the event loop never does
+
+
+def _render_receipt(*args) -> tuple:
+    """Render one receipt, importing the rendering stack on first use.
+
+    Returns the written file path and the render's timings.
+    """
+    from .render import generate_pdf_report
+    return _timed_render(generate_pdf_report, *args)
+
+
+def _render_bundle(*args) -> tuple:
+    """Render a receipt bundle, importing the rendering stack on first use.
+
+    Returns the written file path and the render's timings.
+    """
+    from .render import generate_pdf_bundle
+    return _timed_render(generate_pdf_bundle, *args)
+
+
+def _timed_render(target, *args) -> tuple:
+    """Run a render function, returning its file path and its shaping, layout and write times and file size."""
+    timings = {}
+    start = time.monotonic()
+    path = target(*args, timings=timings)
+    timings["render"] = time.monotonic() - start - timings["shape"] - timings["write"]
+    return path, timings
+
+
+def _warm_worker(config_dir: str) -> None:
+    """Import the rendering stack, load the font and compile the templates ahead of the first render."""
+    try:
+        from .render import get_render_context
+        context = get_render_context(config_dir)
+        context.get_template(True)
+        context.get_template(False)
+    except Exception as e:
+        # The first render in this worker will raise the same error to the caller
+        _LOGGER.warning(f"Could not warm receipt render context: {e}")
+
+
+class ProcessRenderPool:
+    """Small dedicated process pool rendering receipts outside Home Assistant's GIL.
+
+    Workers are started with the spawn method, since forking a running Home
+    Assistant process is unsafe, and each one loads its own render context on
+    start so the first receipt it renders does not pay for font parsing.
+    """
+
+    def __init__(self, config_dir: str, workers: int) -> None:
+        """Create the pool. Worker processes are started on first use."""
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+            initargs=(config_dir,),
+        )
+
+    async def async_render(self, target, *args) -> str:
+        """Run a render function in a worker and return the written file path."""
+        return await asyncio.wrap_future(self._executor.submit(target, *args))
+
+    def shutdown(self, cancel_futures: bool = True) -> None:
+        """Stop the worker processes, dropping renders that have not started unless cancel_futures is False."""
+        self._executor.shutdown(wait=True, cancel_futures=cancel_futures)
+
+
+async def async_render_receipt(hass: HomeAssistant, backend: str, workers: int, *args) -> str:
+    """Render one receipt with the requested backend and return the written file path."""
+    return _async_record_render(hass, await _async_render(hass, backend, workers, _render_receipt, *args))
+
+
+async def async_render_bundle(hass: HomeAssistant, backend: str, workers: int, *args) -> str:
+    """Render a multi-page receipt bundle with the requested backend and return the written file path."""
+    return _async_record_render(hass, await _async_render(hass, backend, workers, _render_bundle, *args))
+
+
+def _async_record_render(hass: HomeAssistant, rendered: tuple) -> str:
+    """Add a render's timings and file size to the metrics and return its file path."""
+    path, timings = rendered
+    async_record(hass, STAGE_SHAPE, timings["shape"])
+    async_record(hass, STAGE_RENDER, timings["render"])
+    async_record(hass, STAGE_WRITE, timings["write"])
+    async_increment(hass, COUNTER_BYTES_WRITTEN, timings["bytes"])
+    return path
+
+
+async def _async_render(hass: HomeAssistant, backend: str, workers: int, target, *args) -> tuple:
+    """Run a render function with the requested backend and return its result.
+
+    The process backend falls back to rendering in Home Assistant's executor
+    when the pool cannot be started or a worker dies.
+    """
+    if backend == RENDER_BACKEND_PROCESS:
+        pool = _async_get_render_pool(hass, workers)
+        if pool is not None:
+            try:
+                return await pool.async_render(target, *args)
+            except BrokenProcessPool as e:
+                _LOGGER.error(f"Receipt render pool failed, falling back to in-process rendering: {e}")
+                await async_shutdown_render_pool(hass)
+
+    return await hass.async_add_executor_job(target, *args)
+
+
+def _async_get_render_pool(hass: HomeAssistant, workers: int):
+    """Return the shared render pool, recreating it when the worker count changes."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    pool = domain_data.get(DATA_RENDER_POOL)
+    if pool is False:
+        # The platform cannot run a process pool, keep rendering in process
+        return None
+    if pool is not None and pool.workers == workers:
+        return pool
+
+    if pool is not None:
+        # Jobs of both priorities render at once, so the renders another job
+        # already queued on the old pool finish there before it stops
+        hass.async_add_executor_job(partial(pool.shutdown, cancel_futures=False))
+
+    try:
+        pool = ProcessRenderPool(hass.config.config_dir, workers)
+    except (OSError, NotImplementedError) as e:
+        _LOGGER.error(f"Could not start receipt render pool, rendering in process instead: {e}")
+        domain_data[DATA_RENDER_POOL] = False
+        return None
+    domain_data[DATA_RENDER_POOL] = pool
+    return pool
+
+
+async def async_shutdown_render_pool(hass: HomeAssistant) -> None:
+    """Stop the shared render pool if one is running."""
+    pool = hass.data.get(DOMAIN, {}).pop(DATA_RENDER_POOL, None)
+    if pool:
+        await hass.async_add_executor_job(pool.shutdown)
+
+
+async def async_prewarm_render(hass: HomeAssistant) -> None:
+    """Load the rendering stack in the executor so the first receipt does not wait for it."""
+    start = time.monotonic()
+    await hass.async_add_executor_job(_warm_worker, hass.config.config_dir)
+    _LOGGER.debug(f"Pre-warmed the receipt renderer in {time.monotonic() - start:.2f}s")
@@ -0,0 +1,245 @@
+"""Retention of the receipts in the receipts folder.
+
+Receipts of the last hot months stay files in the receipts folder. Older ones
+are rolled into one zip archive per month in its archive folder, which stays
+indexed so archived receipts can still be listed and downloaded, and
+receipts older than the deletion horizon are removed. The policy runs as a
+bulk job of the generation queue. Interactive jobs still run alongside it,
+so receipts are only moved or deleted while holding their file locks,
+which generations hold while writing and indexing a receipt.
+"""
+import logging
+import os
+import re
+import shutil
+import uuid
+import zipfile
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_change
+from homeassistant.helpers.start import async_at_started
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    CONF_RETENTION_DELETE_MONTHS,
+    CONF_RETENTION_HOT_MONTHS,
+    DEFAULT_RETENTION_DELETE_MONTHS,
+    DEFAULT_RETENTION_HOT_MONTHS,
+    DOMAIN,
+    JOB_PRIORITY_BULK,
+    RETENTION_ARCHIVE_PREFIX,
+    RETENTION_HOUR,
+)
+from .jobs import get_job_queue
+from .receipt_index import ReceiptIndex, get_receipt_index
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_RETENTION = "retention"
+
+_ARCHIVE_FILENAME = re.compile(rf"^{RETENTION_ARCHIVE_PREFIX}_(\d{{4}}-\d{{2}})\.zip$")
+
+
+def get_archive_filename(month: str) -> str:
+    """Return the filename of the archive of a month (YYYY-MM)."""
+    return f"{RETENTION_ARCHIVE_PREFIX}_{month}.zip"
+
+
+def _get_month_start(now: datetime, months: int) -> str:
+    """Return the first day (YYYY-MM-DD) of the month 'months' before the month of now."""
+    month_index = now.year * 12 + now.month - 1 - months
+    return f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01"
+
+
+def _remove_file(path: str) -> None:
+    """Remove a file that may already be gone."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _rewrite_archive(index: ReceiptIndex, archive: str, keep: set, filenames: list = ()) -> list:
+    """Write an archive again with its members in keep and the receipt files filenames, returning the files added.
+
+    Receipts are stored uncompressed: their content streams already are, so
+    members are copied rather than compressed again. The new archive
+    replaces the old one only once complete, and an archive left without
+    members is removed.
+    """
+    path = os.path.join(index.archive_dir, archive)
+    temp_path = os.path.join(index.archive_dir, f".{archive}.{uuid.uuid4().hex}.tmp")
+    moved = []
+    kept = 0
+    os.makedirs(index.archive_dir, exist_ok=True)
+    try:
+        with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_STORED) as new_archive:
+            if keep and os.path.exists(path):
+                with zipfile.ZipFile(path) as old_archive:
+                    for info in old_archive.infolist():
+                        if info.filename in keep:
+                            member = zipfile.ZipInfo(info.filename, info.date_time)
+                            member.compress_type = zipfile.ZIP_STORED
+                            with old_archive.open(info) as source, new_archive.open(member, "w") as target:
+                                shutil.copyfileobj(source, target)
+                            kept += 1
+            for filename in filenames:
+                try:
+                    new_archive.write(os.path.join(index.receipts_dir, filename), filename)
+                except FileNotFoundError:
+                    continue
+                moved.append(filename)
+        if moved or kept:
+            os.replace(temp_path, path)
+        else:
+            _remove_file(path)
+    finally:
+        _remove_file(temp_path)
+    return moved
+
+
+def _compact_archive(index: ReceiptIndex, month: str, filenames: list) -> list:
+    """Move receipt files into the archive of their month, returning the filenames moved.
+
+    The archive is written again with the members it already holds, minus
+    those deleted or generated again since. The index is updated before the
+    files are removed, so a restart in between leaves receipts listed from
+    the archive. The files and the archive stay locked throughout, so no
+    file is generated again between being archived and removed, and no
+    member is deleted from the archive meanwhile.
+    """
+    archive = get_archive_filename(month)
+    with index.lock_files([*filenames, archive]):
+        moved = _rewrite_archive(index, archive, index.archive_members(archive) - set(filenames), filenames)
+        index.set_archive(moved, archive)
+        for filename in filenames:
+            if filename in moved:
+                _remove_file(os.path.join(index.receipts_dir, filename))
+            else:
+                # Removed from disk behind the index's back
+                index.remove(filename)
+    return moved
+
+
+def delete_receipt(index: ReceiptIndex, filename: str) -> bool:
+    """Delete a receipt file, or remove it from the archive holding it, returning False if there was neither.
+
+    Blocks, and must run in the executor.
+    """
+    path = os.path.join(index.receipts_dir, filename)
+    while True:
+        archive = index.archived([filename]).get(filename)
+        with index.lock_files([filename, archive] if archive else [filename]):
+            if index.archived([filename]).get(filename) != archive:
+                # Archived before its lock was taken, lock its archive too
+                continue
+            found = os.path.exists(path)
+            _remove_file(path)
+            index.remove(filename)
+            if archive is not None:
+                _rewrite_archive(index, archive, index.archive_members(archive))
+            return found or archive is not None
+
+
+def apply_retention(index: ReceiptIndex, hot_before: str, delete_before: str = None) -> dict:
+    """Archive the receipts whose period ended before hot_before and delete those before delete_before.
+
+    Dates are YYYY-MM-DD month starts. Receipts removed from disk behind
+    the index's back are dropped from it first. Blocks, and must run in the
+    executor.
+    """
+    deleted = 0
+    archives = []
+    index.prune()
+
+    if os.path.isdir(index.archive_dir):
+        for name in os.listdir(index.archive_dir):
+            path = os.path.join(index.archive_dir, name)
+            if name.startswith(".") and name.endswith(".tmp"):
+                # Left behind by a compaction that was interrupted
+                _remove_file(path)
+                continue
+            match = _ARCHIVE_FILENAME.match(name)
+            if delete_before and match and f"{match.group(1)}-01" < delete_before:
+                with index.lock_files([name]):
+                    deleted += index.remove_archive(name)
+                    _remove_file(path)
+
+    if delete_before:
+        for filenames in index.expired(delete_before).values():
+            with index.lock_files(filenames):
+                for filename in filenames:
+                    _remove_file(os.path.join(index.receipts_dir, filename))
+                    index.remove(filename)
+                    deleted += 1
+
+    archived = 0
+    for month, filenames in sorted(index.expired(hot_before).items()):
+        moved = _compact_archive(index, month, filenames)
+        if moved:
+            archived += len(moved)
+            archives.append(get_archive_filename(month))
+
+    return {"archived": archived, "deleted": deleted, "archives": archives}
+
+
+@callback
+def async_submit_retention(hass: HomeAssistant, hot_months: int, delete_months: int = 0):
+    """Queue a bulk job applying the retention policy and return it."""
+    return get_job_queue(hass).async_submit(
+        [], JOB_PRIORITY_BULK, {"retention": {"hot_months": hot_months, "delete_months": delete_months}}, 1
+    )
+
+
+async def async_run_retention_job(hass: HomeAssistant, job) -> dict:
+    """Apply the retention policy of a queued job and return what it archived and deleted."""
+    index = get_receipt_index(hass)
+    if index is None:
+        raise RuntimeError("The receipt index is not open")
+    policy = job.data["retention"]
+    now = dt_util.now()
+    hot_before = _get_month_start(now, policy["hot_months"])
+    delete_before = _get_month_start(now, policy["delete_months"]) if policy["delete_months"] else None
+
+    result = await hass.async_add_executor_job(apply_retention, index, hot_before, delete_before)
+    get_job_queue(hass).async_progress(job, None, result)
+    _LOGGER.info(
+        f"Archived {result['archived']} receipts ended before {hot_before} and deleted {result['deleted']}"
+        + (f" ended before {delete_before}" if delete_before else "")
+    )
+    return {"generated_files": [], "failed_entities": [], **result}
+
+
+class ReceiptRetention:
+    """Apply the configured retention policy daily and once Home Assistant has started."""
+
+    def __init__(self, hass: HomeAssistant, options: dict) -> None:
+        """Create the policy from the integration's options."""
+        self._hass = hass
+        self._hot_months = options.get(CONF_RETENTION_HOT_MONTHS, DEFAULT_RETENTION_HOT_MONTHS)
+        self._delete_months = options.get(CONF_RETENTION_DELETE_MONTHS, DEFAULT_RETENTION_DELETE_MONTHS)
+        self._job = None
+
+    @callback
+    def async_setup(self) -> list:
+        """Check daily and once Home Assistant has started, returning the listeners to remove."""
+        return [
+            async_track_time_change(self._hass, self._async_run, hour=RETENTION_HOUR, minute=0, second=0),
+            async_at_started(self._hass, self._async_run),
+        ]
+
+    @callback
+    def _async_run(self, _=None) -> None:
+        """Queue the policy unless it is already queued or running."""
+        if self._job is not None and not self._job.is_finished:
+            return
+        self._job = async_submit_retention(self._hass, self._hot_months, self._delete_months)
+
+
+@callback
+def async_setup_retention(hass: HomeAssistant, options: dict) -> list:
+    """Start the shared retention policy, returning the listeners to remove on unload."""
+    retention = ReceiptRetention(hass, options)
+    hass.data.setdefault(DOMAIN, {})[DATA_RETENTION] = retention
+    return retention.async_setup()
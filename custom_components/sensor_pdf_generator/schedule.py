@@ -0,0 +1,152 @@
+"""Automatic generation of the receipts of each finished billing period."""
+import calendar
+import logging
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_change
+from homeassistant.helpers.start import async_at_started
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    CONF_MAX_QUERIES_PER_SECOND,
+    CONF_SCHEDULE_ENTITY_IDS,
+    CONF_SCHEDULE_HOUR,
+    DEFAULT_MAX_QUERIES_PER_SECOND,
+    DEFAULT_SCHEDULE_HOUR,
+    DOMAIN,
+    JOB_COMPLETED,
+    JOB_PRIORITY_BULK,
+    SCHEDULE_FILENAME_PREFIX,
+    SCHEDULE_JOB_SIZE,
+)
+from .jobs import get_job_queue
+from .meter_index import get_meter_index
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_SCHEDULE = "schedule"
+SCHEDULE_STORAGE_KEY = f"{DOMAIN}.schedule"
+SCHEDULE_STORAGE_VERSION = 1
+
+
+def _get_previous_period(now: datetime) -> tuple:
+    """Return the first and last day and the key of the month before 'now'.
+
+    Like every period, it is billed up to midnight after its last day, so
+    consecutive scheduled months meet at midnight on the 1st.
+    """
+    year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+    last_day = calendar.monthrange(year, month)[1]
+    return datetime(year, month, 1), datetime(year, month, last_day), f"{year:04d}-{month:02d}"
+
+
+class ReceiptSchedule:
+    """Generate last month's receipts for the configured meters once it has ended.
+
+    The run is queued as bulk jobs of SCHEDULE_JOB_SIZE meters whose recorder
+    reads are throttled, and the meters still to do are saved after each
+    job, so a run stopped by a restart carries on where it left off.
+    """
+
+    def __init__(self, hass: HomeAssistant, options: dict) -> None:
+        """Create the schedule from the integration's options."""
+        self._hass = hass
+        self._entity_ids = options.get(CONF_SCHEDULE_ENTITY_IDS) or []
+        self._hour = options.get(CONF_SCHEDULE_HOUR, DEFAULT_SCHEDULE_HOUR)
+        self._max_queries_per_second = options.get(CONF_MAX_QUERIES_PER_SECOND, DEFAULT_MAX_QUERIES_PER_SECOND)
+        self._store = Store(hass, SCHEDULE_STORAGE_VERSION, SCHEDULE_STORAGE_KEY)
+        self._state = {"last_period": None, "run": None}
+        self._task = None
+
+    async def async_load(self) -> None:
+        """Read the schedule's progress.
+
+        The first time the schedule is enabled it starts with the period in
+        progress rather than generating the receipts of the one just ended.
+        """
+        data = await self._store.async_load()
+        if data:
+            self._state = data
+            return
+        self._state["last_period"] = _get_previous_period(dt_util.now())[2]
+        await self._store.async_save(self._state)
+
+    @callback
+    def async_setup(self) -> list:
+        """Check for a due run daily and once Home Assistant has started, returning the listeners to remove."""
+        return [
+            async_track_time_change(self._hass, self._async_check_due, hour=self._hour, minute=0, second=0),
+            async_at_started(self._hass, self._async_check_due),
+            self._async_cancel,
+        ]
+
+    @callback
+    def _async_cancel(self) -> None:
+        """Stop a running run, which resumes the next time the schedule is set up."""
+        if self._task is not None:
+            self._task.cancel()
+
+    @callback
+    def _async_check_due(self, _=None) -> None:
+        """Start last month's run if it has not been done, or resume an unfinished run."""
+        if self._task is not None:
+            return
+        if self._state["run"] is None:
+            now = dt_util.now()
+            start_date, end_date, period = _get_previous_period(now)
+            if period == self._state["last_period"] or (now.day == 1 and now.hour < self._hour):
+                return
+            entity_ids = self._entity_ids
+            if not entity_ids:
+                index = get_meter_index(self._hass)
+                entity_ids = index.async_energy_entity_ids() if index is not None else []
+            self._state["run"] = {
+                "period": period,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "pending": list(entity_ids),
+                "failed": [],
+            }
+        self._task = self._hass.async_create_background_task(self._async_run(), f"{DOMAIN} schedule")
+        self._task.add_done_callback(lambda _: setattr(self, "_task", None))
+
+    async def _async_run(self) -> None:
+        """Queue the pending meters one job at a time, saving progress after each job."""
+        run = self._state["run"]
+        await self._store.async_save(self._state)
+        queue = get_job_queue(self._hass)
+        data = {
+            "start_date": datetime.fromisoformat(run["start_date"]),
+            "end_date": datetime.fromisoformat(run["end_date"]),
+            "filename_prefix": SCHEDULE_FILENAME_PREFIX,
+            "max_queries_per_second": self._max_queries_per_second,
+        }
+        _LOGGER.info(f"Generating the receipts of {run['period']} for {len(run['pending'])} meters")
+
+        while run["pending"]:
+            entity_ids = run["pending"][:SCHEDULE_JOB_SIZE]
+            job = queue.async_submit(entity_ids, JOB_PRIORITY_BULK, data)
+            await queue.async_wait(job)
+            if job.status != JOB_COMPLETED:
+                # Tried again at the next daily check or restart
+                _LOGGER.warning(f"Scheduled receipts of {run['period']} stopped with {len(run['pending'])} meters to go: job {job.id} {job.status}")
+                return
+            run["failed"].extend(job.result["failed_entities"])
+            del run["pending"][:len(entity_ids)]
+            await self._store.async_save(self._state)
+
+        if run["failed"]:
+            _LOGGER.warning(f"Scheduled receipts of {run['period']} failed for {run['failed']}")
+        _LOGGER.info(f"Generated the scheduled receipts of {run['period']}")
+        self._state = {"last_period": run["period"], "run": None}
+        await self._store.async_save(self._state)
+
+
+async def async_setup_schedule(hass: HomeAssistant, options: dict) -> list:
+    """Load and start the shared schedule, returning the listeners to remove on unload."""
+    schedule = ReceiptSchedule(hass, options)
+    await schedule.async_load()
+    hass.data.setdefault(DOMAIN, {})[DATA_SCHEDULE] = schedule
+    return schedule.async_setup()
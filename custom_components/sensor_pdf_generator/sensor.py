@@ -0,0 +1,112 @@
+"""Diagnostic sensors publishing the timings and counters of receipt generation."""
+from homeassistant.components.sensor import SensorDeviceClass, SensorEntity, SensorStateClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfInformation, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import DOMAIN
+from .metrics import (
+    COUNTER_BYTES_WRITTEN,
+    COUNTER_CACHE_HITS,
+    COUNTER_CACHE_MISSES,
+    COUNTER_FAILURES,
+    STAGES,
+    GenerationMetrics,
+    get_metrics,
+)
+
+PERCENTILES = ("p50", "p95")
+
+COUNTER_NAMES = {
+    COUNTER_CACHE_HITS: "Cache hits",
+    COUNTER_CACHE_MISSES: "Cache misses",
+    COUNTER_FAILURES: "Failures",
+    COUNTER_BYTES_WRITTEN: "Bytes written",
+}
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback) -> None:
+    """Add a p50 and p95 sensor per generation stage, and a sensor per counter."""
+    metrics = get_metrics(hass)
+    entities = [
+        StageTimingSensor(entry, metrics, stage, percentile)
+        for stage in STAGES
+        for percentile in PERCENTILES
+    ]
+    entities.extend(CounterSensor(entry, metrics, counter) for counter in COUNTER_NAMES)
+    async_add_entities(entities)
+
+
+class GenerationMetricsSensor(SensorEntity):
+    """A diagnostic sensor updated whenever the generation metrics change."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, entry: ConfigEntry, metrics: GenerationMetrics, key: str) -> None:
+        """Create the sensor, grouped with the others under the integration's service device."""
+        self._metrics = metrics
+        self._attr_unique_id = f"{entry.entry_id}_{key}"
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, entry.entry_id)},
+            name="Sensor PDF Generator",
+            entry_type=DeviceEntryType.SERVICE,
+        )
+
+    async def async_added_to_hass(self) -> None:
+        """Follow the metrics while the sensor exists."""
+        self.async_on_remove(self._metrics.async_add_listener(self.async_write_ha_state))
+
+
+class StageTimingSensor(GenerationMetricsSensor):
+    """A rolling percentile of the time one generation stage takes."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_suggested_display_precision = 3
+
+    def __init__(self, entry: ConfigEntry, metrics: GenerationMetrics, stage: str, percentile: str) -> None:
+        """Create the sensor of one percentile of a stage."""
+        super().__init__(entry, metrics, f"{stage}_{percentile}")
+        self._stage = stage
+        self._percentile = percentile
+        self._attr_name = f"{stage.capitalize()} {percentile}"
+
+    @property
+    def native_value(self):
+        """Return the percentile over the last samples, or None before the stage has run."""
+        return self._metrics.async_stage(self._stage)[self._percentile]
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        """Return how many samples the percentile covers, and the stage's count and total time since startup."""
+        stage = self._metrics.async_stage(self._stage)
+        return {
+            "samples": stage["samples"],
+            "count": stage["count"],
+            "total_seconds": round(stage["total"], 3),
+        }
+
+
+class CounterSensor(GenerationMetricsSensor):
+    """A generation counter, counted since Home Assistant started."""
+
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, entry: ConfigEntry, metrics: GenerationMetrics, counter: str) -> None:
+        """Create the sensor of one counter."""
+        super().__init__(entry, metrics, counter)
+        self._counter = counter
+        self._attr_name = COUNTER_NAMES[counter]
+        if counter == COUNTER_BYTES_WRITTEN:
+            self._attr_device_class = SensorDeviceClass.DATA_SIZE
+            self._attr_native_unit_of_measurement = UnitOfInformation.BYTES
+
+    @property
+    def native_value(self) -> int:
+        """Return the current count."""
+        return self._metrics.counters[self._counter]
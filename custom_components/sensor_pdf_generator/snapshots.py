@@ -0,0 +1,353 @@
+"""Meter readings snapshotted at billing period boundaries."""
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time, async_track_time_change
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .const import DEFAULT_FETCH_BATCH_SIZE, DEFAULT_MAX_QUERIES_PER_SECOND, DOMAIN
+from .energy import RecorderThrottle, get_lookup_horizon, get_readings_at_boundaries, get_readings_at_times
+from .meter_index import get_meter_index
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_SNAPSHOTS = "snapshots"
+SNAPSHOT_STORAGE_KEY = f"{DOMAIN}.snapshots"
+SNAPSHOT_STORAGE_VERSION = 1
+SNAPSHOT_SAVE_DELAY = 30
+
+# Boundaries are snapshotted once the recorder has compiled the statistics
+# of the hour that ends on them, so the snapshot is a single statistics read
+SNAPSHOT_DELAY = timedelta(minutes=15)
+
+# Gaps are filled from history every night, for boundaries this many months back
+SNAPSHOT_BACKFILL_MONTHS = 12
+SNAPSHOT_BACKFILL_TIME = {"hour": 3, "minute": 30, "second": 0}
+
+# A reading missing at a boundary is looked for again by the backfill for this
+# long after it was first missed, in case the recorder catches up, and at any
+# time once the lookup horizon grows past the one it was missed with
+SNAPSHOT_MISS_RETRY = timedelta(days=7)
+
+
+def _get_month_boundary(year: int, month: int) -> datetime:
+    """Return the naive local boundary at the start of a month.
+
+    A month's standard billing period runs from midnight on its 1st to
+    midnight on the next month's 1st, so every month only has this one.
+    """
+    return datetime(year, month, 1)
+
+
+def _to_utc(when: datetime) -> datetime:
+    """Return 'when' in UTC, treating naive datetimes as local time."""
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=dt_util.get_default_time_zone())
+    return when.astimezone(timezone.utc)
+
+
+def _get_months(year: int, month: int, count: int) -> list:
+    """Return the count months up to and including the given one, oldest first."""
+    index = year * 12 + month - 1
+    return [
+        (year, month + 1)
+        for year, month in (divmod(index - offset, 12) for offset in range(count - 1, -1, -1))
+    ]
+
+
+class ReadingSnapshots:
+    """Meter readings at period boundaries, kept in a small persistent store.
+
+    Readings are stored per boundary, as the UTC ISO time, and per entity
+    with the same state and sum get_readings_at_times returns. A meter with
+    no reading at a boundary is stored as a miss, with when it was first
+    missed and the lookup horizon it was missed with. A miss stands, so
+    requests take it as no reading, until the lookup horizon grows past that
+    one, and the nightly backfill looks for it again for SNAPSHOT_MISS_RETRY.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Create the snapshots. They are read from disk by async_load()."""
+        self._hass = hass
+        self._store = Store(hass, SNAPSHOT_STORAGE_VERSION, SNAPSHOT_STORAGE_KEY)
+        self._snapshots = {}
+        self._misses = {}
+        self._task = None
+        self._unsub_boundary = None
+
+    async def async_load(self) -> None:
+        """Read the stored snapshots."""
+        data = await self._store.async_load()
+        if data:
+            self._snapshots = data.get("snapshots", {})
+            self._misses = data.get("misses", {})
+        # Misses used to be stored as None readings, looked for again at once
+        missed_at = dt_util.utcnow().isoformat()
+        for boundary, snapshot in self._snapshots.items():
+            for entity_id in [entity_id for entity_id, reading in snapshot.items() if reading is None]:
+                del snapshot[entity_id]
+                self._misses.setdefault(boundary, {})[entity_id] = {"missed_at": missed_at, "horizon_days": 0}
+        _LOGGER.debug(f"Loaded snapshots for {len(self._snapshots)} boundaries")
+
+    @callback
+    def _data_to_save(self) -> dict:
+        """Return the data written to the store."""
+        return {"snapshots": self._snapshots, "misses": self._misses}
+
+    async def async_save(self) -> None:
+        """Write the snapshots now instead of after the save delay."""
+        await self._store.async_save(self._data_to_save())
+
+    @callback
+    def _async_standing_misses(self, boundary: str) -> dict:
+        """Return the misses at a boundary that were missed with the current lookup horizon or a longer one."""
+        horizon_days = get_lookup_horizon(self._hass).days
+        return {
+            entity_id: miss
+            for entity_id, miss in self._misses.get(boundary, {}).items()
+            if miss["horizon_days"] >= horizon_days
+        }
+
+    @callback
+    def async_get(self, entity_ids: list, when: datetime) -> dict:
+        """Return the stored readings at 'when' of those entities snapshotted there, None for standing misses."""
+        boundary = _to_utc(when).isoformat()
+        snapshot = self._snapshots.get(boundary, {})
+        misses = self._async_standing_misses(boundary)
+        return {
+            entity_id: snapshot.get(entity_id)
+            for entity_id in entity_ids
+            if entity_id in snapshot or entity_id in misses
+        }
+
+    @callback
+    def async_missing(self, entity_ids: list, when: datetime) -> list:
+        """Return the entities with neither a reading nor a standing miss at 'when'."""
+        snapshotted = self.async_get(entity_ids, when)
+        return [entity_id for entity_id in entity_ids if entity_id not in snapshotted]
+
+    @callback
+    def _async_backfill_missing(self, entity_ids: list, when: datetime) -> list:
+        """Return the entities the backfill reads at 'when': those missing and those missed recently."""
+        boundary = _to_utc(when).isoformat()
+        snapshot = self._snapshots.get(boundary, {})
+        standing = self._async_standing_misses(boundary)
+        retry_after = dt_util.utcnow() - SNAPSHOT_MISS_RETRY
+        return [
+            entity_id for entity_id in entity_ids
+            if entity_id not in snapshot and (
+                entity_id not in standing or dt_util.parse_datetime(standing[entity_id]["missed_at"]) > retry_after
+            )
+        ]
+
+    @callback
+    def async_add(self, when: datetime, readings: dict) -> None:
+        """Store readings taken at 'when', if it is a boundary that has already passed.
+
+        None readings are stored as misses, keeping when they were first missed.
+        """
+        when = _to_utc(when)
+        if when + SNAPSHOT_DELAY > dt_util.utcnow():
+            # Readings at a boundary still ahead could change
+            return
+        local = dt_util.as_local(when).replace(tzinfo=None)
+        if local != _get_month_boundary(local.year, local.month):
+            return
+        boundary = when.isoformat()
+        snapshot = self._snapshots.setdefault(boundary, {})
+        now = dt_util.utcnow().isoformat()
+        horizon_days = get_lookup_horizon(self._hass).days
+        for entity_id, reading in readings.items():
+            if reading is not None:
+                snapshot[entity_id] = reading
+                self._misses.get(boundary, {}).pop(entity_id, None)
+            elif entity_id not in snapshot:
+                misses = self._misses.setdefault(boundary, {})
+                missed_at = misses.get(entity_id, {}).get("missed_at", now)
+                misses[entity_id] = {"missed_at": missed_at, "horizon_days": horizon_days}
+        self._store.async_delay_save(self._data_to_save, SNAPSHOT_SAVE_DELAY)
+
+    async def _async_snapshot(self, when: datetime, entity_ids: list) -> int:
+        """Fetch and store the readings of entities at a boundary, one batch at a time."""
+        # Leave room in the recorder for everything else
+        throttle = RecorderThrottle(self._hass, DEFAULT_MAX_QUERIES_PER_SECOND)
+        stored = 0
+        for i in range(0, len(entity_ids), DEFAULT_FETCH_BATCH_SIZE):
+            await throttle.async_wait()
+            readings = await get_readings_at_times(self._hass, entity_ids[i:i + DEFAULT_FETCH_BATCH_SIZE], when)
+            self.async_add(when, readings)
+            stored += sum(1 for reading in readings.values() if reading is not None)
+        return stored
+
+    def _tracked_entity_ids(self) -> list:
+        """Return the total energy sensors of every indexed meter."""
+        index = get_meter_index(self._hass)
+        return index.async_energy_entity_ids() if index is not None else []
+
+    @callback
+    def async_setup(self) -> list:
+        """Schedule the boundary snapshots and the nightly backfill, returning the listeners to remove."""
+        self._async_schedule_boundary()
+        return [
+            async_track_time_change(self._hass, self._async_start_backfill, **SNAPSHOT_BACKFILL_TIME),
+            self._async_cancel_boundary,
+        ]
+
+    @callback
+    def _async_schedule_boundary(self) -> None:
+        """Schedule the snapshot of the next boundary."""
+        now = dt_util.now()
+        # This month and the next one hold the next boundary
+        next_year, next_month = divmod(now.year * 12 + now.month, 12)
+        for year, month in ((now.year, now.month), (next_year, next_month + 1)):
+            boundary = _get_month_boundary(year, month)
+            run_at = _to_utc(boundary) + SNAPSHOT_DELAY
+            if run_at > dt_util.utcnow():
+                self._unsub_boundary = async_track_point_in_utc_time(
+                    self._hass, partial(self._async_boundary_reached, boundary), run_at
+                )
+                return
+
+    @callback
+    def _async_cancel_boundary(self) -> None:
+        """Cancel the scheduled boundary snapshot and any running snapshot task."""
+        if self._unsub_boundary is not None:
+            self._unsub_boundary()
+            self._unsub_boundary = None
+        if self._task is not None:
+            self._task.cancel()
+
+    @callback
+    def _async_boundary_reached(self, boundary: datetime, now: datetime) -> None:
+        """Snapshot every tracked meter at the boundary that just passed."""
+        self._unsub_boundary = None
+        self._async_start(self._async_snapshot_boundary(boundary))
+        self._async_schedule_boundary()
+
+    @callback
+    def _async_start_backfill(self, now: datetime) -> None:
+        """Start filling gaps from history during the quiet night hours."""
+        self._async_start(self._async_backfill())
+
+    @callback
+    def _async_start(self, coro) -> None:
+        """Run a snapshot task unless one is already running."""
+        if self._task is not None:
+            coro.close()
+            return
+        self._task = self._hass.async_create_background_task(coro, f"{DOMAIN} snapshots")
+        self._task.add_done_callback(lambda _: setattr(self, "_task", None))
+
+    async def _async_snapshot_boundary(self, boundary: datetime) -> None:
+        """Snapshot every tracked meter at one boundary."""
+        entity_ids = self._tracked_entity_ids()
+        try:
+            stored = await self._async_snapshot(boundary, entity_ids)
+        except Exception as e:
+            _LOGGER.error(f"Error snapshotting meter readings at {boundary}: {e}")
+            return
+        _LOGGER.info(f"Snapshotted {stored} of {len(entity_ids)} meters at {boundary}")
+
+    async def _async_backfill(self) -> None:
+        """Fetch the readings missing at past boundaries from history."""
+        entity_ids = self._tracked_entity_ids()
+        if not entity_ids:
+            return
+        now = dt_util.now()
+        for year, month in _get_months(now.year, now.month, SNAPSHOT_BACKFILL_MONTHS):
+            boundary = _get_month_boundary(year, month)
+            if _to_utc(boundary) + SNAPSHOT_DELAY > dt_util.utcnow():
+                break
+            missing = self._async_backfill_missing(entity_ids, boundary)
+            if not missing:
+                continue
+            try:
+                stored = await self._async_snapshot(boundary, missing)
+            except Exception as e:
+                _LOGGER.error(f"Error backfilling meter readings at {boundary}: {e}")
+                return
+            _LOGGER.debug(f"Backfilled {stored} of {len(missing)} meters at {boundary}")
+
+
+async def async_setup_snapshots(hass: HomeAssistant) -> list:
+    """Load the shared snapshots and schedule them, returning the listeners to remove on unload."""
+    snapshots = ReadingSnapshots(hass)
+    await snapshots.async_load()
+    hass.data.setdefault(DOMAIN, {})[DATA_SNAPSHOTS] = snapshots
+    return snapshots.async_setup()
+
+
+def get_snapshots(hass: HomeAssistant):
+    """Return the shared snapshots, or None if they are not set up."""
+    return hass.data.get(DOMAIN, {}).get(DATA_SNAPSHOTS)
+
+
+async def async_shutdown_snapshots(hass: HomeAssistant) -> None:
+    """Write any pending snapshots and drop the shared snapshots."""
+    snapshots = hass.data.get(DOMAIN, {}).pop(DATA_SNAPSHOTS, None)
+    if snapshots is not None:
+        await snapshots.async_save()
+
+
+async def async_get_readings(hass: HomeAssistant, entity_ids: list, when: datetime, throttle=None) -> dict:
+    """Return each meter's reading at 'when', from the snapshots where possible.
+
+    Only meters without a snapshot are read from the recorder, after waiting
+    for the throttle if one is given, and readings read at a boundary are
+    kept as its snapshot. Meters with a standing miss there have none.
+    """
+    snapshots = get_snapshots(hass)
+    if snapshots is None:
+        if throttle is not None:
+            await throttle.async_wait()
+        return await get_readings_at_times(hass, entity_ids, when)
+
+    entity_ids = list(dict.fromkeys(entity_ids))
+    readings = dict.fromkeys(entity_ids)
+    snapshotted = snapshots.async_get(entity_ids, when)
+    readings.update(snapshotted)
+    missing = [entity_id for entity_id in entity_ids if entity_id not in snapshotted]
+    if missing:
+        if throttle is not None:
+            await throttle.async_wait()
+        fetched = await get_readings_at_times(hass, missing, when)
+        readings.update(fetched)
+        snapshots.async_add(when, fetched)
+    return readings
+
+
+async def async_get_readings_at_boundaries(hass: HomeAssistant, entity_ids: list, boundaries: list, throttle=None) -> dict:
+    """Return each meter's reading at every boundary, from the snapshots where possible.
+
+    Meters missing a snapshot at any boundary are read from the recorder in
+    one pass over all boundaries, after waiting for the throttle if one is
+    given, and readings read at a boundary are kept as its snapshot. Meters
+    with a standing miss at a boundary have none there.
+    """
+    entity_ids = list(dict.fromkeys(entity_ids))
+    readings = {when: dict.fromkeys(entity_ids) for when in boundaries}
+    snapshotted = {when: {} for when in boundaries}
+    snapshots = get_snapshots(hass)
+    if snapshots is not None:
+        for when in boundaries:
+            snapshotted[when] = snapshots.async_get(entity_ids, when)
+            readings[when].update(snapshotted[when])
+
+    missing = [
+        entity_id for entity_id in entity_ids
+        if any(entity_id not in snapshotted[when] for when in boundaries)
+    ]
+    if missing:
+        if throttle is not None:
+            await throttle.async_wait()
+        fetched = await get_readings_at_boundaries(hass, missing, boundaries)
+        for when, fetched_readings in fetched.items():
+            for entity_id, reading in fetched_readings.items():
+                if entity_id not in snapshotted[when]:
+                    readings[when][entity_id] = reading
+            if snapshots is not None:
+                snapshots.async_add(when, fetched_readings)
+    return readings
@@ -0,0 +1,250 @@
+"""Tariffs billing the energy of a whole batch of meters at once.
+
+A tariff has a fixed charge and prices energy in one of three ways: a flat
+rate, tiers over the energy used in the period, or time-of-use windows over
+the meters' hourly consumption from the recorder's long-term statistics.
+Tariffs are assigned to meters by entity, area or floor. The bills of every
+meter on a tariff are computed together as array operations, apart from
+rendering, and the receipts and ledgers both print them.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import config_validation as cv
+import voluptuous as vol
+
+from .billing import DEFAULT_ENERGY_RATE, DEFAULT_FIXED_CHARGE, DEFAULT_TARIFF_NAME, get_bill
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_TARIFFS = "tariffs"
+
+_AMOUNT = vol.All(vol.Any(int, float), vol.Range(min=0))
+_HOUR = vol.All(vol.Coerce(int), vol.Range(min=0, max=24))
+
+
+def _validate_tiers(tiers: list) -> list:
+    """Check that tier bounds rise and that the last tier, and only it, is unbounded."""
+    bounds = [tier.get("up_to") for tier in tiers]
+    if None in bounds[:-1] or bounds[-1] is not None:
+        raise vol.Invalid("every tier but the last needs up_to, and the last one none")
+    if any(lower >= upper for lower, upper in zip(bounds[:-2], bounds[1:-1])):
+        raise vol.Invalid("tier up_to bounds must rise")
+    return tiers
+
+
+def _validate_unique_names(tariffs: list) -> list:
+    """Check that no two tariffs share a name."""
+    names = [tariff["name"] for tariff in tariffs]
+    if len(set(names)) != len(names):
+        raise vol.Invalid("tariff names must be unique")
+    return tariffs
+
+
+TARIFF_SCHEMA = vol.Schema({
+    vol.Required("name"): cv.string,
+    vol.Optional("fixed_charge", default=DEFAULT_FIXED_CHARGE): _AMOUNT,
+    # The flat rate per kWh, and the rate of hours outside every time-of-use window
+    vol.Optional("rate", default=DEFAULT_ENERGY_RATE): _AMOUNT,
+    # Blocks of the energy used in the period, each up_to kWh priced at its own rate
+    vol.Exclusive("tiers", "pricing"): vol.All([vol.Schema({
+        vol.Optional("up_to"): _AMOUNT,
+        vol.Required("rate"): _AMOUNT,
+    })], vol.Length(min=1), _validate_tiers),
+    # Local hours from start_hour up to end_hour, wrapping past midnight, on the given weekdays (0 is Monday)
+    vol.Exclusive("time_of_use", "pricing"): vol.All([vol.Schema({
+        vol.Required("start_hour"): _HOUR,
+        vol.Required("end_hour"): _HOUR,
+        vol.Required("rate"): _AMOUNT,
+        vol.Optional("weekdays"): [vol.All(vol.Coerce(int), vol.Range(min=0, max=6))],
+    })], vol.Length(min=1)),
+    # The meters billed on this tariff, by entity, area or floor name; every other meter without any
+    vol.Optional("entity_ids", default=[]): cv.entity_ids,
+    vol.Optional("areas", default=[]): [cv.string],
+    vol.Optional("floors", default=[]): [cv.string],
+})
+
+TARIFFS_SCHEMA = vol.All([TARIFF_SCHEMA], _validate_unique_names)
+
+
+class Tariff:
+    """One validated tariff, pricing the energy of many meters at once."""
+
+    def __init__(self, config: dict) -> None:
+        """Create the tariff from a config validated by TARIFF_SCHEMA."""
+        self.name = config["name"]
+        self.fixed_charge = config.get("fixed_charge", DEFAULT_FIXED_CHARGE)
+        self.rate = config.get("rate", DEFAULT_ENERGY_RATE)
+        self.tiers = [(tier.get("up_to", float("inf")), tier["rate"]) for tier in config.get("tiers", [])]
+        self.time_of_use = config.get("time_of_use", [])
+        self.entity_ids = set(config.get("entity_ids", []))
+        self.areas = set(config.get("areas", []))
+        self.floors = set(config.get("floors", []))
+
+    @property
+    def is_flat(self) -> bool:
+        """Return True if every kWh costs the same."""
+        return not self.tiers and not self.time_of_use
+
+    @property
+    def needs_hourly(self) -> bool:
+        """Return True if the tariff prices hourly consumption."""
+        return bool(self.time_of_use)
+
+    @property
+    def is_default(self) -> bool:
+        """Return True if the tariff bills the meters no other tariff is assigned to."""
+        return not self.entity_ids and not self.areas and not self.floors
+
+    def get_hourly_rates(self, hours: list):
+        """Return the rate of each of the local hour starts in hours as an array."""
+        import numpy as np
+
+        rates = np.full(len(hours), float(self.rate))
+        for index, hour in enumerate(hours):
+            for window in self.time_of_use:
+                if "weekdays" in window and hour.weekday() not in window["weekdays"]:
+                    continue
+                start_hour, end_hour = window["start_hour"], window["end_hour"]
+                if start_hour <= end_hour:
+                    inside = start_hour <= hour.hour < end_hour
+                else:
+                    inside = hour.hour >= start_hour or hour.hour < end_hour
+                if inside:
+                    rates[index] = window["rate"]
+                    break
+        return rates
+
+    def get_energy_charges(self, energy_used, hourly=None, hours: list = None):
+        """Return the energy charges of an array of the meters' energy used.
+
+        Time-of-use tariffs price each meter's energy used at the average
+        rate of its hourly consumption, an array of one row per meter and one
+        column per hour of hours, with NaN for hours without statistics.
+        Meters without any hourly consumption pay the tariff's rate.
+        """
+        import numpy as np
+
+        if self.tiers:
+            uppers = np.array([upper for upper, _ in self.tiers])
+            lowers = np.concatenate(([0.0], uppers[:-1]))
+            # The kWh of every meter falling in every tier, one row per meter
+            blocks = np.clip(energy_used[:, None] - lowers, 0, uppers - lowers)
+            return blocks @ np.array([rate for _, rate in self.tiers], dtype=float)
+
+        if self.time_of_use and hourly is not None and hours:
+            hourly = np.clip(hourly, 0, None)
+            totals = np.nansum(hourly, axis=1)
+            priced = np.nansum(hourly * self.get_hourly_rates(hours), axis=1)
+            average_rates = np.divide(
+                priced, totals, out=np.full(len(totals), float(self.rate)), where=totals > 0
+            )
+            return energy_used * average_rates
+
+        return energy_used * self.rate
+
+
+DEFAULT_TARIFF = Tariff({"name": DEFAULT_TARIFF_NAME})
+
+
+class TariffPlan:
+    """The configured tariffs and the meters each one bills."""
+
+    def __init__(self, configs: list) -> None:
+        """Create the plan from tariff configs validated by TARIFFS_SCHEMA."""
+        self.tariffs = [Tariff(config) for config in configs]
+        self.default = next((tariff for tariff in self.tariffs if tariff.is_default), DEFAULT_TARIFF)
+
+    @property
+    def uses_groups(self) -> bool:
+        """Return True if any tariff is assigned by area or floor."""
+        return any(tariff.areas or tariff.floors for tariff in self.tariffs)
+
+    @property
+    def needs_hourly(self) -> bool:
+        """Return True if any tariff prices hourly consumption."""
+        return any(tariff.needs_hourly for tariff in self.tariffs)
+
+    def get_tariff(self, entity_id: str, area: str = None, floor: str = None) -> Tariff:
+        """Return the tariff of a meter: assigned by entity first, then area, then floor, else the default."""
+        for matches in (
+            lambda tariff: entity_id in tariff.entity_ids,
+            lambda tariff: area is not None and area in tariff.areas,
+            lambda tariff: floor is not None and floor in tariff.floors,
+        ):
+            for tariff in self.tariffs:
+                if matches(tariff):
+                    return tariff
+        return self.default
+
+
+def get_hours(start: datetime, end: datetime) -> list:
+    """Return the starts of the hours from aware start to end, in start's time zone."""
+    # Statistics hours start on the hour in UTC, and stepping in UTC keeps every hour across daylight saving changes
+    first = start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    count = int((end - first).total_seconds() // 3600)
+    return [(first + timedelta(hours=index)).astimezone(start.tzinfo) for index in range(count)]
+
+
+def compute_bills(tariffs: list, energy_used: list, hourly: dict = None, hours: list = None) -> list:
+    """Return the bill of every meter, billing the meters of each tariff in one array operation.
+
+    tariffs and energy_used hold the tariff and energy used of each meter.
+    hourly maps the index of a meter on a time-of-use tariff to its
+    consumption per hour start timestamp, for the hours in hours.
+    """
+    import numpy as np
+
+    hourly = hourly or {}
+    hours = hours or []
+    first_hour = hours[0].timestamp() if hours else None
+    energy = np.asarray(energy_used, dtype=float)
+    bills = [None] * len(tariffs)
+
+    meters = {}
+    for index, tariff in enumerate(tariffs):
+        meters.setdefault(id(tariff), (tariff, []))[1].append(index)
+
+    for tariff, indexes in meters.values():
+        matrix = None
+        if tariff.needs_hourly and hours:
+            matrix = np.full((len(indexes), len(hours)), np.nan)
+            for row, index in enumerate(indexes):
+                meter_hourly = hourly.get(index)
+                if not meter_hourly:
+                    continue
+                # Hours are consecutive, so an hour's column follows from its timestamp
+                columns = (np.fromiter(meter_hourly.keys(), float, len(meter_hourly)) - first_hour) // 3600
+                changes = np.fromiter(meter_hourly.values(), float, len(meter_hourly))
+                inside = (columns >= 0) & (columns < len(hours))
+                matrix[row, columns[inside].astype(int)] = changes[inside]
+        charges = tariff.get_energy_charges(energy[indexes], matrix, hours).tolist()
+        for index, charge in zip(indexes, charges):
+            bills[index] = get_bill(
+                tariff.name,
+                tariff.fixed_charge,
+                energy_used[index],
+                charge,
+                tariff.rate if tariff.is_flat else None,
+            )
+    return bills
+
+
+def async_setup_tariffs(hass: HomeAssistant, configs: list) -> TariffPlan:
+    """Load the configured tariffs, billing every meter at the standard tariff if they are invalid."""
+    try:
+        configs = TARIFFS_SCHEMA(configs or [])
+    except vol.Invalid as e:
+        _LOGGER.error(f"Invalid tariffs, billing every meter at the standard tariff: {e}")
+        configs = []
+    plan = TariffPlan(configs)
+    hass.data.setdefault(DOMAIN, {})[DATA_TARIFFS] = plan
+    return plan
+
+
+def get_tariffs(hass: HomeAssistant) -> TariffPlan:
+    """Return the tariff plan, or one billing every meter at the standard tariff before setup."""
+    plan = hass.data.get(DOMAIN, {}).get(DATA_TARIFFS)
+    return plan if plan is not None else TariffPlan([])
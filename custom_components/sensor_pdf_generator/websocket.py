@@ -0,0 +1,148 @@
+"""Websocket commands used by the receipt panel."""
+import logging
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+import homeassistant.helpers.config_validation as cv
+import voluptuous as vol
+
+from .const import DOMAIN
+from .jobs import get_job_queue
+from .meter_index import get_meter_index
+from .receipt_index import get_receipt_index
+
+_LOGGER = logging.getLogger(__name__)
+
+WS_TYPE_LIST_RECEIPTS = f"{DOMAIN}/receipts/list"
+WS_TYPE_GENERATE = f"{DOMAIN}/generate"
+WS_TYPE_SUBSCRIBE_JOBS = f"{DOMAIN}/jobs/subscribe"
+WS_TYPE_CANCEL_JOB = f"{DOMAIN}/jobs/cancel"
+WS_TYPE_LIST_METERS = f"{DOMAIN}/meters/list"
+
+
+@callback
+def async_register_websocket_commands(hass: HomeAssistant, generate_schema: vol.Schema, async_submit_generate) -> None:
+    """Register the panel's websocket commands.
+
+    The generate command accepts the same fields as the generate_pdf service
+    and queues its job through async_submit_generate(data), which returns
+    the job or raises ValueError for invalid dates.
+    """
+    websocket_api.async_register_command(hass, websocket_list_receipts)
+    websocket_api.async_register_command(hass, websocket_subscribe_jobs)
+    websocket_api.async_register_command(hass, websocket_cancel_job)
+    websocket_api.async_register_command(hass, websocket_list_meters)
+
+    @websocket_api.async_response
+    async def websocket_generate(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict) -> None:
+        """Queue a generate job and return its ID."""
+        if get_job_queue(hass) is None or get_receipt_index(hass) is None:
+            connection.send_error(msg["id"], websocket_api.ERR_NOT_FOUND, "Sensor PDF Generator is not set up")
+            return
+        data = {key: value for key, value in msg.items() if key not in ("id", "type")}
+        try:
+            job = await async_submit_generate(data)
+        except ValueError as e:
+            connection.send_error(msg["id"], websocket_api.ERR_INVALID_FORMAT, f"Invalid date: {e}")
+            return
+        connection.send_result(msg["id"], {"job_id": job.id})
+
+    websocket_api.async_register_command(
+        hass,
+        WS_TYPE_GENERATE,
+        websocket_generate,
+        websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend({
+            vol.Required("type"): WS_TYPE_GENERATE,
+            **generate_schema.schema,
+        }),
+    )
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): WS_TYPE_LIST_RECEIPTS,
+    vol.Optional("limit"): vol.All(vol.Coerce(int), vol.Range(min=1, max=1000)),
+    vol.Optional("offset", default=0): vol.All(vol.Coerce(int), vol.Range(min=0)),
+    vol.Optional("entity_id"): cv.entity_id,
+    vol.Optional("start_date"): str,  # Format: YYYY-MM-DD
+    vol.Optional("end_date"): str,    # Format: YYYY-MM-DD
+    vol.Optional("include_archived", default=False): bool,
+})
+@websocket_api.async_response
+async def websocket_list_receipts(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict) -> None:
+    """Return one page of receipts from the index, newest first."""
+    index = get_receipt_index(hass)
+    if index is None:
+        connection.send_result(msg["id"], {"receipts": [], "total": 0})
+        return
+
+    receipts, total = await hass.async_add_executor_job(
+        index.query,
+        msg.get("entity_id"),
+        msg.get("start_date"),
+        msg.get("end_date"),
+        msg.get("limit"),
+        msg["offset"],
+        msg["include_archived"],
+    )
+    # A bundle can hold hundreds of meters, the panel only needs the count
+    for receipt in receipts:
+        del receipt["entity_ids"]
+    connection.send_result(msg["id"], {"receipts": receipts, "total": total})
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): WS_TYPE_SUBSCRIBE_JOBS,
+    vol.Optional("job_id"): cv.string,
+})
+@callback
+def websocket_subscribe_jobs(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict) -> None:
+    """Send the progress of one job, or of every job, to this connection only."""
+    queue = get_job_queue(hass)
+    if queue is None:
+        connection.send_error(msg["id"], websocket_api.ERR_NOT_FOUND, "Sensor PDF Generator is not set up")
+        return
+
+    job_id = msg.get("job_id")
+    job = None
+    if job_id is not None:
+        job = queue.async_get(job_id)
+        if job is None:
+            connection.send_error(msg["id"], websocket_api.ERR_NOT_FOUND, f"Unknown PDF generation job: {job_id}")
+            return
+
+    @callback
+    def forward_progress(updated_job) -> None:
+        if job_id is None or updated_job.id == job_id:
+            connection.send_message(websocket_api.event_message(msg["id"], updated_job.as_progress()))
+
+    connection.subscriptions[msg["id"]] = queue.async_add_listener(forward_progress)
+    connection.send_result(msg["id"])
+
+    # The job may have moved on, or even finished, before the panel subscribed
+    if job is not None:
+        forward_progress(job)
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): WS_TYPE_CANCEL_JOB,
+    vol.Required("job_id"): cv.string,
+})
+@callback
+def websocket_cancel_job(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict) -> None:
+    """Cancel a queued or running job."""
+    queue = get_job_queue(hass)
+    cancelled = queue is not None and queue.async_cancel(msg["job_id"])
+    connection.send_result(msg["id"], {"cancelled": cancelled})
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): WS_TYPE_LIST_METERS,
+})
+@callback
+def websocket_list_meters(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict) -> None:
+    """Return the indexed breakers with their sensors, area and floor, plus all floor names."""
+    index = get_meter_index(hass)
+    if index is None:
+        connection.send_error(msg["id"], websocket_api.ERR_NOT_FOUND, "Sensor PDF Generator is not set up")
+        return
+    connection.send_result(msg["id"], index.async_as_dict())
@@ -0,0 +1 @@
+"""Generation benchmarks against a synthetic recorder."""
@@ -0,0 +1,118 @@
+"""Generation throughput against a synthetic recorder, for N meters over one billing month.
+
+The batch pipeline is timed end to end, together with the total time the
+integration's own metrics record for each stage across all meters: query,
+resolve, shape, render and write. Batches and renders run concurrently, so
+stage times overlap and can add up to more than the end to end latency.
+Peak RSS is the process peak, which is why meter counts are run smallest
+first.
+
+The receipts font is not shipped with the integration: point
+SENSOR_PDF_BENCH_FONT at Amiri-Regular.ttf to run the benchmarks.
+"""
+import logging
+import os
+import resource
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.util import dt as dt_util  # noqa: E402
+
+from custom_components.sensor_pdf_generator import generator  # noqa: E402
+from custom_components.sensor_pdf_generator.metrics import COUNTER_BYTES_WRITTEN, STAGES, async_setup_metrics, async_shutdown_metrics  # noqa: E402
+from custom_components.sensor_pdf_generator.receipt_index import async_open_receipt_index, get_receipts_dir  # noqa: E402
+
+from .synthetic_recorder import async_populate_recorder  # noqa: E402
+
+FONT_ENV = "SENSOR_PDF_BENCH_FONT"
+
+# The billing period of every benchmark, as the generate_pdf service parses it
+PERIOD_START = datetime(2025, 1, 1)
+PERIOD_END = datetime(2025, 1, 31)
+
+# Recorded history starts and ends a day either side of the period
+HISTORY_MARGIN = timedelta(days=1)
+
+
+@pytest.fixture
+def recorder_db_url(tmp_path) -> str:
+    """Record to an SQLite file, like a default Home Assistant install, instead of memory."""
+    return f"sqlite:///{tmp_path / 'home-assistant_v2.db'}"
+
+
+@pytest.fixture(autouse=True)
+def quiet_sqlalchemy():
+    """Stop the test harness logging every statement, which would be timed as part of each query."""
+    logger = logging.getLogger("sqlalchemy.engine")
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    yield
+    logger.setLevel(level)
+
+
+@pytest.fixture
+def receipt_font() -> str:
+    """Return the path of the receipts font, skipping the benchmark without one."""
+    font_path = os.environ.get(FONT_ENV)
+    if not font_path or not os.path.isfile(font_path):
+        pytest.skip(f"Set {FONT_ENV} to the path of Amiri-Regular.ttf to run the benchmarks")
+    return font_path
+
+
+def _get_peak_rss_mb() -> float:
+    """Return the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def test_batch_generation(
+    recorder_mock, hass: HomeAssistant, tmp_path, receipt_font, meter_count, record_benchmark, pytestconfig
+) -> None:
+    """Generate one receipt per meter for a month and record the timings."""
+    hass.config.config_dir = str(tmp_path)
+    os.makedirs(tmp_path / ".storage")
+    os.makedirs(tmp_path / "tts")
+    shutil.copy(receipt_font, tmp_path / "tts" / "Amiri-Regular.ttf")
+
+    tz = dt_util.get_default_time_zone()
+    entity_ids = await async_populate_recorder(
+        hass,
+        meter_count,
+        pytestconfig.getoption("--bench-states"),
+        PERIOD_START.replace(tzinfo=tz) - HISTORY_MARGIN,
+        PERIOD_END.replace(tzinfo=tz) + HISTORY_MARGIN,
+    )
+    await async_open_receipt_index(hass)
+    await hass.async_block_till_done()
+
+    metrics = async_setup_metrics(hass)
+
+    start = time.perf_counter()
+    results = await generator.async_generate_receipts(
+        hass, entity_ids, "bench", PERIOD_START, PERIOD_END, {"force": True}
+    )
+    latency = time.perf_counter() - start
+    async_shutdown_metrics(hass)
+
+    generated = [result for result in results.values() if result]
+    assert len(generated) == meter_count
+    receipts_dir = get_receipts_dir(hass)
+    pdf_sizes = [os.path.getsize(os.path.join(receipts_dir, result["filename"])) for result in generated]
+    assert metrics.counters[COUNTER_BYTES_WRITTEN] == sum(pdf_sizes)
+
+    record_benchmark({
+        "latency": round(latency, 4),
+        "meters_per_second": round(meter_count / latency, 2),
+        "stages": {stage: round(metrics.async_stage(stage)["total"], 4) for stage in STAGES},
+        "peak_rss_mb": round(_get_peak_rss_mb(), 1),
+        "pdf_bytes": sum(pdf_sizes),
+        "pdf_bytes_per_receipt": sum(pdf_sizes) // len(pdf_sizes),
+    })
@@ -0,0 +1,190 @@
+"""Shared pytest setup: benchmark options, the recorded benchmark results and the set up integration."""
+import json
+import os
+import platform
+import sys
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_PATH = os.path.join(ROOT_DIR, "custom_components", "sensor_pdf_generator", "manifest.json")
+# Committed baselines, one per release, only written when asked to with --bench-results
+RESULTS_DIR = os.path.join(ROOT_DIR, "tests", "benchmarks", "results")
+# Where a run's results go by default, outside version control
+DEFAULT_RESULTS_PATH = os.path.join(ROOT_DIR, ".benchmarks", "latest.json")
+
+DEFAULT_BENCH_SIZES = "10,100,1000"
+DEFAULT_BENCH_STATES = 24 * 33  # Hourly over the billing month and a day either side
+
+# A stage slower than the previous release by more than this share is reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+# Results of the current session, keyed by benchmark and meter count
+_RESULTS = {}
+
+
+def pytest_addoption(parser):
+    """Add the benchmark options."""
+    group = parser.getgroup("sensor_pdf_generator benchmarks")
+    group.addoption("--bench-sizes", default=DEFAULT_BENCH_SIZES, help="Comma separated meter counts to benchmark")
+    group.addoption("--bench-states", type=int, default=DEFAULT_BENCH_STATES, help="Recorded states per meter")
+    group.addoption(
+        "--bench-results",
+        default=None,
+        help="File the results are written to, by default .benchmarks/latest.json. "
+        "Pass tests/benchmarks/results/<manifest version>.json to record a release's baseline",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    """Run every benchmark once per meter count, smallest first, so peak RSS grows with the size."""
+    if "meter_count" in metafunc.fixturenames:
+        sizes = sorted(int(size) for size in metafunc.config.getoption("--bench-sizes").split(","))
+        metafunc.parametrize("meter_count", sizes, ids=[f"{size}_meters" for size in sizes])
+
+
+@pytest.fixture
+def record_benchmark(request):
+    """Return a function storing the result dict of the running benchmark."""
+    def record(result: dict) -> None:
+        name = request.node.originalname
+        _RESULTS.setdefault(name, {})[str(request.node.callspec.params["meter_count"])] = result
+
+    return record
+
+
+async def _async_write_placeholder_receipts(hass, job) -> dict:
+    """Run a generate job by writing and indexing a placeholder receipt per meter instead of rendering one."""
+    from custom_components.sensor_pdf_generator.jobs import get_job_queue
+    from custom_components.sensor_pdf_generator.receipt_index import async_index_receipt, get_receipts_dir
+
+    def write(path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as receipt:
+            receipt.write(f"%PDF- {os.path.basename(path)}".encode())
+
+    start_date, end_date = job.data["start_date"], job.data["end_date"]
+    generated_files = []
+    for entity_id in job.entity_ids:
+        filename = f"sensor_report_{entity_id.split('.')[1]}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.pdf"
+        path = os.path.join(get_receipts_dir(hass), filename)
+        await hass.async_add_executor_job(write, path)
+        await async_index_receipt(hass, path, [{"entity_id": entity_id, "amount": 1.0}], start_date, end_date)
+        get_job_queue(hass).async_progress(job, entity_id, {"filename": filename})
+        generated_files.append({"entity_id": entity_id, "filename": filename})
+    return {"generated_files": generated_files, "failed_entities": []}
+
+
+@pytest.fixture
+async def integration(recorder_mock, enable_custom_integrations, hass, tmp_path):
+    """Set up the integration from a config entry, with its files in tmp_path, and return the entry.
+
+    Generate jobs write placeholder receipts, so tests need neither
+    recorded history nor the receipts font.
+    """
+    from homeassistant.config_entries import ConfigEntryState
+    from homeassistant.setup import async_setup_component
+    from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+    from custom_components.sensor_pdf_generator.const import DOMAIN
+
+    hass.config.config_dir = str(tmp_path)
+    os.makedirs(tmp_path / ".storage")
+    with patch("custom_components.sensor_pdf_generator._async_run_generate_job", _async_write_placeholder_receipts):
+        assert await async_setup_component(hass, "http", {})
+        assert await async_setup_component(hass, DOMAIN, {})
+        entry = MockConfigEntry(domain=DOMAIN, data={})
+        entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        yield entry
+        if entry.state is ConfigEntryState.LOADED:
+            await hass.config_entries.async_unload(entry.entry_id)
+
+
+def _get_version() -> str:
+    """Return the integration version the results are filed under."""
+    with open(MANIFEST_PATH, encoding="utf-8") as manifest:
+        return json.load(manifest)["version"]
+
+
+def _get_environment() -> dict:
+    """Return what the results were measured on, so runs on other machines are not mistaken for regressions."""
+    environment = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    for package in ("homeassistant", "fpdf"):
+        module = sys.modules.get(package)
+        if module is not None:
+            environment[package] = getattr(module, "__version__", None)
+    return environment
+
+
+def _get_version_key(version: str) -> tuple:
+    """Return a version as a tuple that sorts numerically, non-numeric parts first."""
+    return tuple(int(part) if part.isdigit() else -1 for part in version.split("."))
+
+
+def _load_baseline(results_path: str):
+    """Return the committed baseline of the newest release, other than the file being written, or None."""
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    versions = [
+        name[:-len(".json")]
+        for name in os.listdir(RESULTS_DIR)
+        if name.endswith(".json") and os.path.join(RESULTS_DIR, name) != os.path.abspath(results_path)
+    ]
+    if not versions:
+        return None
+    baseline_path = os.path.join(RESULTS_DIR, f"{max(versions, key=_get_version_key)}.json")
+    with open(baseline_path, encoding="utf-8") as results_file:
+        return json.load(results_file)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """Write this session's results and compare them with the newest release's baseline."""
+    if not _RESULTS:
+        return
+    version = _get_version()
+    results_path = config.getoption("--bench-results") or DEFAULT_RESULTS_PATH
+    previous = _load_baseline(results_path)
+
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    with open(results_path, "w", encoding="utf-8") as results_file:
+        json.dump({
+            "version": version,
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "environment": _get_environment(),
+            "state_count": config.getoption("--bench-states"),
+            "benchmarks": _RESULTS,
+        }, results_file, indent=2, sort_keys=True)
+
+    terminalreporter.section("sensor_pdf_generator benchmarks")
+    terminalreporter.write_line(f"Results written to {results_path}")
+    for name, sizes in _RESULTS.items():
+        for size, result in sorted(sizes.items(), key=lambda item: int(item[0])):
+            stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["stages"].items())
+            terminalreporter.write_line(
+                f"{name}[{size}]: {result['latency']:.2f}s ({stages}), "
+                f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['pdf_bytes'] / 1024:.0f} KiB of PDFs"
+            )
+            before = (previous or {}).get("benchmarks", {}).get(name, {}).get(size)
+            if before is None:
+                continue
+            timings = {"latency": (before["latency"], result["latency"])}
+            timings.update({
+                stage: (before["stages"][stage], seconds)
+                for stage, seconds in result["stages"].items()
+                if before["stages"].get(stage)
+            })
+            for timing, (then, now) in timings.items():
+                if then and now > then * (1 + REGRESSION_THRESHOLD):
+                    terminalreporter.write_line(
+                        f"  {timing} regressed from {then:.2f}s in {previous['version']} to {now:.2f}s",
+                        yellow=True,
+                    )
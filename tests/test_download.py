@@ -0,0 +1,154 @@
+"""Tests for the authenticated downloads of receipts and zip archives of them."""
+import io
+import zipfile
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers import area_registry as ar  # noqa: E402
+from homeassistant.helpers import entity_registry as er  # noqa: E402
+from homeassistant.helpers import floor_registry as fr  # noqa: E402
+
+from custom_components.sensor_pdf_generator.const import DOMAIN  # noqa: E402
+from custom_components.sensor_pdf_generator.jobs import get_job_queue  # noqa: E402
+from custom_components.sensor_pdf_generator.receipt_index import get_receipt_index  # noqa: E402
+from custom_components.sensor_pdf_generator.retention import apply_retention  # noqa: E402
+
+METERS = ["sensor.shop_1_total_energy", "sensor.shop_2_total_energy", "sensor.shop_3_total_energy"]
+JANUARY = "sensor_report_shop_1_total_energy_20250101_20250131.pdf"
+
+
+async def _async_generate(hass: HomeAssistant, entity_ids: list, start_date: str, end_date: str):
+    """Generate the receipts of meters for a period and return the finished job."""
+    response = await hass.services.async_call(
+        DOMAIN,
+        "generate_pdf",
+        {"total_energy_entity_ids": entity_ids, "start_date": start_date, "end_date": end_date},
+        blocking=True,
+        return_response=True,
+    )
+    queue = get_job_queue(hass)
+    job = queue.async_get(response["job_id"])
+    await queue.async_wait(job)
+    return job
+
+
+@pytest.fixture
+async def receipts(integration, hass: HomeAssistant) -> tuple:
+    """Generate January's receipts of every meter and February's of the first, the first meter on a floor."""
+    floor = fr.async_get(hass).async_create("Ground")
+    area = ar.async_get(hass).async_create("Shop 1", floor_id=floor.floor_id)
+    entity_registry = er.async_get(hass)
+    for entity_id in METERS:
+        entity_registry.async_get_or_create(
+            "sensor", "test", entity_id, suggested_object_id=entity_id.split(".")[1]
+        )
+    entity_registry.async_update_entity(METERS[0], area_id=area.id)
+
+    january = await _async_generate(hass, METERS, "2025-01-01", "2025-01-31")
+    february = await _async_generate(hass, METERS[:1], "2025-02-01", "2025-02-28")
+    return january, february
+
+
+async def _async_get_zip(client, query: str) -> list:
+    """Return the members of the archive a query selects, checking they are intact."""
+    response = await client.get(f"/api/{DOMAIN}/receipts.zip?{query}")
+    assert response.status == 200
+    with zipfile.ZipFile(io.BytesIO(await response.read())) as archive:
+        assert archive.testzip() is None
+        return sorted(archive.namelist())
+
+
+async def test_receipt_download(receipts, hass: HomeAssistant, hass_client) -> None:
+    """A receipt is served privately, revalidated by its ETag, and in byte ranges."""
+    client = await hass_client()
+
+    response = await client.get(f"/api/{DOMAIN}/receipts/{JANUARY}")
+    body = await response.read()
+    etag = response.headers["ETag"]
+    assert response.status == 200
+    assert body == f"%PDF- {JANUARY}".encode()
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    response = await client.get(f"/api/{DOMAIN}/receipts/{JANUARY}", headers={"If-None-Match": etag})
+    assert response.status == 304
+    response = await client.get(f"/api/{DOMAIN}/receipts/{JANUARY}", headers={"Range": "bytes=0-4"})
+    assert (response.status, await response.read()) == (206, body[:5])
+
+
+@pytest.mark.parametrize("filename", ["archive%2Freceipt.pdf", ".hidden.pdf", "notes.txt", "missing.pdf"])
+async def test_only_receipts_are_served(receipts, hass: HomeAssistant, hass_client, filename) -> None:
+    """Paths into subfolders, hidden files, other extensions and missing receipts are not found."""
+    client = await hass_client()
+
+    response = await client.get(f"/api/{DOMAIN}/receipts/{filename}")
+
+    assert response.status == 404
+
+
+async def test_downloads_require_authentication(receipts, hass: HomeAssistant, hass_client_no_auth) -> None:
+    """Receipts are not public."""
+    client = await hass_client_no_auth()
+
+    response = await client.get(f"/api/{DOMAIN}/receipts/{JANUARY}")
+
+    assert response.status == 401
+
+
+async def test_archive_filters(receipts, hass: HomeAssistant, hass_client) -> None:
+    """Archives hold the receipts of a job, a period, a floor or meters, and the filters combine."""
+    january, _ = receipts
+    client = await hass_client()
+
+    assert await _async_get_zip(client, f"job_id={january.id}") == sorted(
+        file_info["filename"] for file_info in january.result["generated_files"]
+    )
+    assert await _async_get_zip(client, "start_date=2025-02-01") == [
+        "sensor_report_shop_1_total_energy_20250201_20250228.pdf"
+    ]
+    assert await _async_get_zip(client, "floor=Ground&end_date=2025-01-31") == [JANUARY]
+    assert await _async_get_zip(client, f"job_id={january.id}&entity_id={METERS[1]},{METERS[2]}") == [
+        "sensor_report_shop_2_total_energy_20250101_20250131.pdf",
+        "sensor_report_shop_3_total_energy_20250101_20250131.pdf",
+    ]
+
+
+async def test_archive_compression(receipts, hass: HomeAssistant, hass_client) -> None:
+    """Members are compressed unless store=true asks for them as they are."""
+    client = await hass_client()
+
+    for query, compress_type in (("", zipfile.ZIP_DEFLATED), ("&store=true", zipfile.ZIP_STORED)):
+        response = await client.get(f"/api/{DOMAIN}/receipts.zip?floor=Ground{query}")
+        with zipfile.ZipFile(io.BytesIO(await response.read())) as archive:
+            assert {info.compress_type for info in archive.infolist()} == {compress_type}
+
+
+@pytest.mark.parametrize(
+    ("query", "status"),
+    [("", 400), ("job_id=unknown", 404), ("floor=Nowhere", 404), ("start_date=2030-01-01", 404)],
+)
+async def test_archive_of_nothing(receipts, hass: HomeAssistant, hass_client, query, status) -> None:
+    """Archives need a filter, a known job, and at least one matching receipt."""
+    client = await hass_client()
+
+    response = await client.get(f"/api/{DOMAIN}/receipts.zip?{query}")
+
+    assert response.status == status
+
+
+async def test_archived_receipts_stay_downloadable(receipts, hass: HomeAssistant, hass_client) -> None:
+    """Receipts the retention policy moved into a monthly archive are still served, alone or zipped."""
+    index = get_receipt_index(hass)
+    result = await hass.async_add_executor_job(apply_retention, index, "2025-02-01")
+    assert result["archived"] == 3
+    client = await hass_client()
+
+    response = await client.get(f"/api/{DOMAIN}/receipts/{JANUARY}")
+    assert (response.status, await response.read()) == (200, f"%PDF- {JANUARY}".encode())
+    response = await client.get(f"/api/{DOMAIN}/receipts/{JANUARY}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status == 304
+    assert await _async_get_zip(client, f"entity_id={METERS[0]}") == [
+        JANUARY, "sensor_report_shop_1_total_energy_20250201_20250228.pdf"
+    ]
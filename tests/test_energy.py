@@ -0,0 +1,123 @@
+"""Tests for the readings and consumption read from the recorder."""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.util import dt as dt_util  # noqa: E402
+
+from custom_components.sensor_pdf_generator.energy import (  # noqa: E402
+    CONSUMPTION_WINDOW,
+    ConsumptionCounter,
+    _async_get_state_values_at,
+    get_consumption,
+    get_period_consumption,
+    get_readings_at_boundaries,
+)
+
+from .benchmarks.synthetic_recorder import STATISTICS_GAP, async_populate_recorder  # noqa: E402
+
+# Hourly states over five days, so every read spans several CONSUMPTION_WINDOWs
+HISTORY_DAYS = 5
+METER_COUNT = STATISTICS_GAP + 1
+
+
+def _get_rate(index: int) -> float:
+    """Return the hourly consumption of the index-th synthetic meter."""
+    return 0.5 + (index % 7) / 10
+
+
+@pytest.fixture
+async def meters(recorder_mock, hass: HomeAssistant) -> tuple:
+    """Record the hourly history of a few meters, the first without long-term statistics."""
+    start = datetime(2025, 1, 1, tzinfo=dt_util.get_default_time_zone())
+    end = start + timedelta(days=HISTORY_DAYS)
+    entity_ids = await async_populate_recorder(hass, METER_COUNT, HISTORY_DAYS * 24, start, end)
+    await hass.async_block_till_done()
+    return entity_ids, start
+
+
+def test_counter_counts_rises() -> None:
+    """Rises are consumption, and the first value is only where counting starts."""
+    counter = ConsumptionCounter()
+    for value in (10, 12, 12, 15.5):
+        counter.add(value)
+
+    assert counter.total == pytest.approx(5.5)
+
+
+def test_counter_counts_a_reset_from_zero() -> None:
+    """A drop below RESET_RATIO of the last value is a replaced meter counting up from zero."""
+    counter = ConsumptionCounter()
+    for value in (100, 110, 3, 5):
+        counter.add(value)
+
+    assert counter.total == pytest.approx(10 + 3 + 2)
+
+
+def test_counter_ignores_small_dips_and_gaps() -> None:
+    """Small dips are noise, and unavailable states continue from the last number."""
+    counter = ConsumptionCounter()
+    for value in (100, 99.5, "unavailable", None, "nan", 101):
+        counter.add(value)
+
+    assert counter.total == pytest.approx(1)
+    assert counter.last == 101
+
+
+async def test_state_values_at_boundaries(recorder_mock, hass: HomeAssistant, meters) -> None:
+    """Raw states read window by window give the value of the newest state at each boundary."""
+    entity_ids, start = meters
+    whens = [start + timedelta(days=day, hours=6) for day in range(HISTORY_DAYS)]
+    assert whens[-1] - whens[0] > CONSUMPTION_WINDOW
+
+    values = await _async_get_state_values_at(hass, entity_ids[:2], whens)
+
+    for when in whens:
+        hours = (when - start).total_seconds() / 3600
+        for index, entity_id in enumerate(entity_ids[:2]):
+            assert values[when][entity_id] == pytest.approx(1000 + index + hours * _get_rate(index))
+
+
+async def test_readings_at_boundaries_fall_back_to_raw_states(recorder_mock, hass: HomeAssistant, meters) -> None:
+    """Meters with daily statistics carry their sum, and the others are read from raw states."""
+    entity_ids, start = meters
+    boundaries = [start + timedelta(days=day) for day in range(1, HISTORY_DAYS)]
+
+    readings = await get_readings_at_boundaries(hass, entity_ids[:2], boundaries)
+
+    for when in boundaries:
+        hours = (when - start).total_seconds() / 3600
+        raw, statistics = readings[when][entity_ids[0]], readings[when][entity_ids[1]]
+        assert raw == {"state": pytest.approx(1000 + hours * _get_rate(0)), "sum": None}
+        assert statistics["state"] == pytest.approx(1001 + hours * _get_rate(1))
+        assert statistics["sum"] == pytest.approx(hours * _get_rate(1))
+
+
+async def test_period_consumption_matches_each_period(recorder_mock, hass: HomeAssistant, meters) -> None:
+    """One pass over several periods splits the consumption exactly as streaming each period would."""
+    entity_ids, start = meters
+    periods = [
+        (start + timedelta(days=day), start + timedelta(days=day + 1, hours=12))
+        for day in range(HISTORY_DAYS - 2)
+    ]
+
+    consumption = await get_period_consumption(hass, entity_ids[:2], periods)
+
+    for period in periods:
+        hours = (period[1] - period[0]).total_seconds() / 3600
+        assert consumption[period] == await get_consumption(hass, entity_ids[:2], *period)
+        for index, entity_id in enumerate(entity_ids[:2]):
+            assert consumption[period][entity_id] == pytest.approx(hours * _get_rate(index))
+
+
+async def test_period_consumption_without_states(recorder_mock, hass: HomeAssistant, meters) -> None:
+    """Meters without any state by the end of a period have no consumption for it."""
+    _, start = meters
+    period = (start + timedelta(days=1), start + timedelta(days=2))
+
+    consumption = await get_period_consumption(hass, ["sensor.unknown_total_energy"], [period])
+
+    assert consumption == {period: {"sensor.unknown_total_energy": None}}
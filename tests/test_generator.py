@@ -0,0 +1,71 @@
+"""Tests for reusing the receipts generated from unchanged inputs."""
+import os
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.sensor_pdf_generator import generator  # noqa: E402
+from custom_components.sensor_pdf_generator.receipt_index import (  # noqa: E402
+    async_close_receipt_index,
+    async_open_receipt_index,
+    get_receipts_dir,
+)
+
+METER = "sensor.shop_1_total_energy"
+READINGS = {METER: ({"state": 1000.0, "sum": 0.0}, {"state": 1100.0, "sum": 100.0})}
+
+
+@pytest.fixture
+async def receipts_dir(hass: HomeAssistant, tmp_path) -> str:
+    """Open the receipt index in tmp_path, render placeholder receipts, and return the receipts folder."""
+    hass.config.config_dir = str(tmp_path)
+    os.makedirs(tmp_path / ".storage")
+    await async_open_receipt_index(hass)
+    hass.states.async_set(METER, "1100", {"friendly_name": "Shop 1"})
+    receipts_dir = get_receipts_dir(hass)
+    os.makedirs(receipts_dir, exist_ok=True)
+
+    async def render(hass, backend, workers, total_energy, energy_used, filename, *args) -> str:
+        path = os.path.join(receipts_dir, filename)
+        with open(path, "wb") as receipt:
+            receipt.write(b"%PDF-")
+        return path
+
+    with patch.object(generator, "async_render_receipt", render):
+        yield receipts_dir
+    await async_close_receipt_index(hass)
+
+
+async def _async_generate(hass: HomeAssistant, filename_prefix: str, **options) -> dict:
+    """Generate January's receipt of the meter from known readings and return its file info."""
+    results = await generator.async_generate_receipts(
+        hass, [METER], filename_prefix, datetime(2025, 1, 1), datetime(2025, 1, 31), {"readings": READINGS, **options}
+    )
+    return results[METER]
+
+
+async def test_unchanged_receipts_are_reused(hass: HomeAssistant, receipts_dir) -> None:
+    """A receipt generated again from the same inputs reuses the file already written."""
+    first = await _async_generate(hass, "sensor_report")
+    second = await _async_generate(hass, "sensor_report")
+
+    assert "cached" not in first
+    assert second == {**first, "cached": True}
+
+
+async def test_receipts_are_reused_under_their_own_name_and_template(hass: HomeAssistant, receipts_dir) -> None:
+    """Another file name prefix or template renders a new file instead of reusing one named otherwise."""
+    await _async_generate(hass, "sensor_report")
+    renamed = await _async_generate(hass, "invoice")
+    compiled = await _async_generate(hass, "invoice", compiled_template=True)
+
+    assert renamed["filename"] == "invoice_Shop_1_20250101_20250131.pdf"
+    assert "cached" not in renamed and "cached" not in compiled
+    assert sorted(os.listdir(receipts_dir)) == [
+        "invoice_Shop_1_20250101_20250131.pdf", "sensor_report_Shop_1_20250101_20250131.pdf"
+    ]
@@ -0,0 +1,188 @@
+"""Tests for the background queue of generation jobs."""
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from pytest_homeassistant_custom_component.common import async_capture_events  # noqa: E402
+
+from custom_components.sensor_pdf_generator import _async_run_generate_job  # noqa: E402
+from custom_components.sensor_pdf_generator.const import (  # noqa: E402
+    JOB_CANCELLED,
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_PRIORITY_BULK,
+    JOB_PRIORITY_INTERACTIVE,
+    JOB_QUEUED,
+    JOB_RUNNING,
+)
+from custom_components.sensor_pdf_generator.jobs import ReceiptJobQueue  # noqa: E402
+
+
+class _Runner:
+    """Run jobs that each wait until the test releases them."""
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._hass = hass
+        self.started = []
+        self._releases = {}
+
+    def release(self, job, error: str = None) -> None:
+        """Let a running job finish, or fail with error."""
+        self._releases[job.id].set_result(error)
+
+    async def __call__(self, job) -> dict:
+        self.started.append(job.id)
+        self._releases[job.id] = self._hass.loop.create_future()
+        error = await self._releases[job.id]
+        if error:
+            raise RuntimeError(error)
+        return {"generated_files": [], "failed_entities": []}
+
+
+async def _async_settle() -> None:
+    """Let the workers take up the jobs released or queued, without waiting for the jobs still blocked."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+async def runner(hass: HomeAssistant) -> _Runner:
+    """Return the runner of the jobs of the queue fixture."""
+    return _Runner(hass)
+
+
+@pytest.fixture
+async def queue(hass: HomeAssistant, runner):
+    """Return a job queue, cancelling whatever is left of it after the test."""
+    queue = ReceiptJobQueue(hass, runner)
+    yield queue
+    await queue.async_shutdown()
+
+
+async def test_jobs_of_a_priority_run_in_order(hass: HomeAssistant, queue, runner) -> None:
+    """A job waits for the one queued before it with the same priority."""
+    first = queue.async_submit(["sensor.a"], JOB_PRIORITY_BULK, {})
+    second = queue.async_submit(["sensor.b"], JOB_PRIORITY_BULK, {})
+    await _async_settle()
+
+    assert (first.status, second.status) == (JOB_RUNNING, JOB_QUEUED)
+
+    runner.release(first)
+    await _async_settle()
+    assert (first.status, second.status) == (JOB_COMPLETED, JOB_RUNNING)
+
+    runner.release(second)
+    await queue.async_wait(second)
+    assert runner.started == [first.id, second.id]
+    assert second.result == {"generated_files": [], "failed_entities": []}
+
+
+async def test_interactive_jobs_run_alongside_bulk_jobs(hass: HomeAssistant, queue, runner) -> None:
+    """An interactive job starts and finishes while a bulk job is still running."""
+    bulk = queue.async_submit(["sensor.a"], JOB_PRIORITY_BULK, {})
+    interactive = queue.async_submit(["sensor.b"], JOB_PRIORITY_INTERACTIVE, {})
+    await _async_settle()
+
+    assert (bulk.status, interactive.status) == (JOB_RUNNING, JOB_RUNNING)
+
+    runner.release(interactive)
+    await queue.async_wait(interactive)
+    assert (bulk.status, interactive.status) == (JOB_RUNNING, JOB_COMPLETED)
+
+
+async def test_cancel_queued_and_running_jobs(hass: HomeAssistant, queue, runner) -> None:
+    """A queued job is never run once cancelled, and a running one is stopped."""
+    running = queue.async_submit(["sensor.a"], JOB_PRIORITY_BULK, {})
+    queued = queue.async_submit(["sensor.b"], JOB_PRIORITY_BULK, {})
+    last = queue.async_submit(["sensor.c"], JOB_PRIORITY_BULK, {})
+    await _async_settle()
+
+    assert queue.async_cancel(queued.id)
+    assert queue.async_cancel(running.id)
+    await queue.async_wait(running)
+    await _async_settle()
+
+    assert (running.status, queued.status, last.status) == (JOB_CANCELLED, JOB_CANCELLED, JOB_RUNNING)
+    assert runner.started == [running.id, last.id]
+    assert not queue.async_cancel(running.id)
+    assert not queue.async_cancel("unknown")
+
+
+async def test_failed_job_keeps_its_error(hass: HomeAssistant, queue, runner) -> None:
+    """A job that raises fails with the error, and the next job still runs."""
+    failing = queue.async_submit(["sensor.a"], JOB_PRIORITY_BULK, {})
+    await _async_settle()
+    runner.release(failing, "no states")
+    await queue.async_wait(failing)
+
+    assert (failing.status, failing.error) == (JOB_FAILED, "no states")
+    assert failing.as_progress()["error"] == "no states"
+
+    following = queue.async_submit(["sensor.b"], JOB_PRIORITY_BULK, {})
+    await _async_settle()
+    assert following.status == JOB_RUNNING
+
+
+async def test_progress_is_throttled(hass: HomeAssistant, queue, runner) -> None:
+    """Receipts finished in quick succession fire one update, and the last receipt always fires one."""
+    job = queue.async_submit(["sensor.a", "sensor.b", "sensor.c"], JOB_PRIORITY_BULK, {})
+    await _async_settle()
+    updates = []
+    remove_listener = queue.async_add_listener(lambda updated_job: updates.append(updated_job.as_progress()))
+
+    queue.async_progress(job, "sensor.a", {})
+    queue.async_progress(job, "sensor.b", None)
+    queue.async_progress(job, "sensor.c", {})
+    remove_listener()
+
+    assert [(update["done"], update["failed"]) for update in updates] == [(1, 0), (3, 1)]
+
+
+async def test_shutdown_cancels_every_job(hass: HomeAssistant, queue, runner) -> None:
+    """Shutting down cancels the running and the queued jobs of every priority."""
+    jobs = [
+        queue.async_submit(["sensor.a"], JOB_PRIORITY_BULK, {}),
+        queue.async_submit(["sensor.b"], JOB_PRIORITY_BULK, {}),
+        queue.async_submit(["sensor.c"], JOB_PRIORITY_INTERACTIVE, {}),
+    ]
+    await _async_settle()
+
+    await queue.async_shutdown()
+
+    assert [job.status for job in jobs] == [JOB_CANCELLED] * 3
+    assert runner.started == [jobs[0].id, jobs[2].id]
+    assert all(task.done() for task in (jobs[0].task, jobs[2].task))
+
+
+async def test_completion_event_counts_the_files(hass: HomeAssistant) -> None:
+    """The event of a finished job only counts its files, which stay in the job's result."""
+    events = async_capture_events(hass, "pdf_generator_complete")
+    job = SimpleNamespace(
+        id="job",
+        entity_ids=["sensor.a", "sensor.b"],
+        data={"start_date": datetime(2025, 1, 1), "end_date": datetime(2025, 1, 31)},
+    )
+    results = {"sensor.a": {"filename": "a.pdf", "entity_id": "sensor.a", "entity_name": "A"}, "sensor.b": None}
+
+    with patch("custom_components.sensor_pdf_generator.async_generate_receipts", AsyncMock(return_value=results)):
+        result = await _async_run_generate_job(hass, job)
+    await hass.async_block_till_done()
+
+    assert result["generated_files"] == [results["sensor.a"]]
+    assert [event.data for event in events] == [{
+        "job_id": "job",
+        "meter_count": 2,
+        "success": True,
+        "start_date": "2025-01-01",
+        "end_date": "2025-01-31",
+        "generated_count": 1,
+        "failed_count": 1,
+        "file_count": 1,
+        "filename": "a.pdf",
+    }]
@@ -0,0 +1,106 @@
+"""Tests for the persistent index of the generated receipts."""
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from custom_components.sensor_pdf_generator.receipt_index import ReceiptIndex  # noqa: E402
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Return an open index of an empty receipts folder."""
+    receipts_dir = tmp_path / "receipts"
+    receipts_dir.mkdir()
+    index = ReceiptIndex(str(tmp_path / "receipts.db"), str(receipts_dir))
+    index.open()
+    yield index
+    index.close()
+
+
+def _add_receipt(index: ReceiptIndex, filename: str, entity_ids: list, month: int, mtime: float) -> str:
+    """Write and index a receipt of the given meters for a month of 2025."""
+    path = os.path.join(index.receipts_dir, filename)
+    with open(path, "wb") as receipt:
+        receipt.write(b"%PDF-")
+    os.utime(path, (mtime, mtime))
+    entries = [{"entity_id": entity_id, "entity_name": entity_id, "amount": 1.5} for entity_id in entity_ids]
+    index.add(path, entries, datetime(2025, month, 1), datetime(2025, month, 28))
+    return path
+
+
+def test_query_pages_newest_first(index) -> None:
+    """Pages follow each other without gaps, and a bundle is listed once with all its meters."""
+    for number in range(5):
+        _add_receipt(index, f"receipt_{number}.pdf", [f"sensor.meter_{number}"], 1, 1000 + number)
+    _add_receipt(index, "bundle.pdf", ["sensor.meter_0", "sensor.meter_1"], 1, 2000)
+
+    first, total = index.query(limit=4)
+    second, _ = index.query(limit=4, offset=4)
+
+    assert total == 6
+    assert [receipt["filename"] for receipt in first + second] == [
+        "bundle.pdf", "receipt_4.pdf", "receipt_3.pdf", "receipt_2.pdf", "receipt_1.pdf", "receipt_0.pdf",
+    ]
+    assert first[0]["entity_count"] == 2
+    assert first[0]["amount"] == 3.0
+
+
+def test_query_filters(index) -> None:
+    """Receipts are found by any meter they hold and by overlapping billing periods."""
+    _add_receipt(index, "january.pdf", ["sensor.meter_0"], 1, 1000)
+    _add_receipt(index, "february.pdf", ["sensor.meter_0", "sensor.meter_1"], 2, 2000)
+
+    assert [r["filename"] for r in index.query(entity_id="sensor.meter_1")[0]] == ["february.pdf"]
+    assert [r["filename"] for r in index.query(start_date="2025-02-10")[0]] == ["february.pdf"]
+    assert [r["filename"] for r in index.query(end_date="2025-01-31")[0]] == ["january.pdf"]
+
+
+def test_query_keeps_pages_stable_until_pruned(index) -> None:
+    """Files removed behind the index's back are listed until prune() drops them."""
+    paths = [_add_receipt(index, f"receipt_{number}.pdf", ["sensor.meter"], 1, 1000 + number) for number in range(4)]
+    os.remove(paths[3])
+
+    first, total = index.query(limit=2)
+    second, _ = index.query(limit=2, offset=2)
+
+    assert total == 4
+    assert len({r["filename"] for r in first + second}) == 4
+
+    assert index.prune() == 1
+    receipts, total = index.query()
+    assert total == 3
+    assert "receipt_3.pdf" not in [receipt["filename"] for receipt in receipts]
+
+
+def test_open_prunes_and_imports(tmp_path, index) -> None:
+    """Reopening prunes missing files, and a new index imports the receipts already on disk."""
+    path = _add_receipt(index, "sensor_report_meter_20250101_20250131.pdf", ["sensor.meter"], 1, 1000)
+    _add_receipt(index, "gone.pdf", ["sensor.meter"], 1, 1000)
+    os.remove(os.path.join(index.receipts_dir, "gone.pdf"))
+    index.close()
+
+    index.open()
+    assert [receipt["filename"] for receipt in index.query()[0]] == [os.path.basename(path)]
+
+    imported = ReceiptIndex(str(tmp_path / "new.db"), index.receipts_dir)
+    imported.open()
+    receipts, total = imported.query()
+    imported.close()
+    assert total == 1
+    assert (receipts[0]["start_date"], receipts[0]["end_date"]) == ("2025-01-01", "2025-01-31")
+
+
+def test_find_skips_missing_files(index) -> None:
+    """A cached receipt is only reused while its file exists."""
+    path = os.path.join(index.receipts_dir, "cached.pdf")
+    with open(path, "wb") as receipt:
+        receipt.write(b"%PDF-")
+    index.add(path, [{"entity_id": "sensor.meter"}], cache_key="key")
+
+    assert index.find("key") == "cached.pdf"
+    os.remove(path)
+    assert index.find("key") is None
+    assert index.query()[1] == 0
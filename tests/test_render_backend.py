@@ -0,0 +1,34 @@
+"""Tests for the shared process pool rendering receipts."""
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.sensor_pdf_generator import render_backend  # noqa: E402
+
+
+class _Pool:
+    """Stand in for a process pool, recording how it was shut down."""
+
+    def __init__(self, config_dir: str, workers: int) -> None:
+        self.workers = workers
+        self.shutdowns = []
+
+    def shutdown(self, cancel_futures: bool = True) -> None:
+        self.shutdowns.append(cancel_futures)
+
+
+async def test_changing_the_worker_count_lets_queued_renders_finish(hass: HomeAssistant, monkeypatch) -> None:
+    """A job asking for another worker count gets a new pool, and the old one drains the renders it holds."""
+    monkeypatch.setattr(render_backend, "ProcessRenderPool", _Pool)
+
+    first = render_backend._async_get_render_pool(hass, 2)
+    assert render_backend._async_get_render_pool(hass, 2) is first
+    second = render_backend._async_get_render_pool(hass, 3)
+    await hass.async_block_till_done()
+
+    assert second is not first
+    assert first.shutdowns == [False]
+    await render_backend.async_shutdown_render_pool(hass)
+    assert second.shutdowns == [True]
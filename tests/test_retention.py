@@ -0,0 +1,168 @@
+"""Tests for the retention policy archiving and deleting old receipts."""
+import os
+import threading
+import zipfile
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from custom_components.sensor_pdf_generator.receipt_index import ReceiptIndex  # noqa: E402
+from custom_components.sensor_pdf_generator.retention import (  # noqa: E402
+    _get_month_start,
+    apply_retention,
+    delete_receipt,
+    get_archive_filename,
+)
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Return an open index of an empty receipts folder."""
+    receipts_dir = tmp_path / "receipts"
+    receipts_dir.mkdir()
+    index = ReceiptIndex(str(tmp_path / "receipts.db"), str(receipts_dir))
+    index.open()
+    yield index
+    index.close()
+
+
+def _add_receipt(index: ReceiptIndex, filename: str, month: int = None, mtime: float = None) -> str:
+    """Write and index a receipt billing a month of 2025, or one without a period written at mtime."""
+    path = os.path.join(index.receipts_dir, filename)
+    with open(path, "wb") as receipt:
+        receipt.write(f"%PDF- {filename}".encode())
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    period = (datetime(2025, month, 1), datetime(2025, month, 28)) if month else ()
+    index.add(path, [{"entity_id": "sensor.meter", "amount": 1.0}], *period)
+    return path
+
+
+def _get_members(index: ReceiptIndex, month: str) -> dict:
+    """Return the content of each member of a month's archive, checking it is stored uncompressed."""
+    with zipfile.ZipFile(os.path.join(index.archive_dir, get_archive_filename(month))) as archive:
+        assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
+        return {info.filename: archive.read(info) for info in archive.infolist()}
+
+
+def test_month_start_across_the_year_end() -> None:
+    """Months are counted back from the month of now, across the year end."""
+    assert _get_month_start(datetime(2025, 2, 15), 3) == "2024-11-01"
+    assert _get_month_start(datetime(2025, 2, 15), 0) == "2025-02-01"
+
+
+def test_expired_receipts_are_archived_by_month(index) -> None:
+    """Receipts ended before the hot months move into their month's archive and stay listed from it."""
+    _add_receipt(index, "january.pdf", 1)
+    _add_receipt(index, "february.pdf", 2)
+    _add_receipt(index, "march.pdf", 3)
+
+    result = apply_retention(index, "2025-03-01")
+
+    assert result == {"archived": 2, "deleted": 0, "archives": ["receipts_2025-01.zip", "receipts_2025-02.zip"]}
+    assert _get_members(index, "2025-01") == {"january.pdf": b"%PDF- january.pdf"}
+    assert sorted(os.listdir(index.receipts_dir)) == ["archive", "march.pdf"]
+    assert [receipt["filename"] for receipt in index.query()[0]] == ["march.pdf"]
+    archived = {receipt["filename"]: receipt["archive"] for receipt in index.query(include_archived=True)[0]}
+    assert archived["january.pdf"] == "receipts_2025-01.zip"
+
+
+def test_archives_keep_their_members(index) -> None:
+    """Compacting a month again keeps what its archive holds, and replaces receipts generated again."""
+    _add_receipt(index, "first.pdf", 1)
+    _add_receipt(index, "second.pdf", 1)
+    apply_retention(index, "2025-03-01")
+
+    with open(_add_receipt(index, "second.pdf", 1), "wb") as receipt:
+        receipt.write(b"%PDF- generated again")
+    _add_receipt(index, "third.pdf", 1)
+    apply_retention(index, "2025-03-01")
+
+    assert _get_members(index, "2025-01") == {
+        "first.pdf": b"%PDF- first.pdf",
+        "second.pdf": b"%PDF- generated again",
+        "third.pdf": b"%PDF- third.pdf",
+    }
+    assert index.query(include_archived=True)[1] == 3
+
+
+def test_receipts_without_a_period_expire_by_when_they_were_written(index) -> None:
+    """A receipt without a billing period belongs to the month of its file's mtime."""
+    _add_receipt(index, "old.pdf", mtime=datetime(2025, 1, 15, 12).timestamp())
+    _add_receipt(index, "new.pdf", mtime=datetime(2025, 3, 15, 12).timestamp())
+
+    assert index.expired("2025-03-01") == {"2025-01": ["old.pdf"]}
+
+
+def test_receipts_past_the_deletion_horizon_are_deleted(index) -> None:
+    """Archives and receipts ended before the deletion horizon are removed from disk and the index."""
+    _add_receipt(index, "january.pdf", 1)
+    apply_retention(index, "2025-02-01")
+    _add_receipt(index, "february.pdf", 2)
+    _add_receipt(index, "june.pdf", 6)
+
+    result = apply_retention(index, "2025-04-01", "2025-03-01")
+
+    assert (result["deleted"], result["archived"]) == (2, 0)
+    assert os.listdir(index.archive_dir) == []
+    assert [receipt["filename"] for receipt in index.query(include_archived=True)[0]] == ["june.pdf"]
+
+
+def test_interrupted_compactions_and_removed_files_are_cleaned_up(index) -> None:
+    """Temporary archives left behind are removed, and receipts deleted by hand are forgotten."""
+    os.makedirs(index.archive_dir)
+    leftover = os.path.join(index.archive_dir, ".receipts_2025-01.zip.1234.tmp")
+    open(leftover, "wb").close()
+    os.remove(_add_receipt(index, "removed.pdf", 1))
+
+    result = apply_retention(index, "2025-03-01")
+
+    assert result["archived"] == 0
+    assert not os.path.exists(leftover)
+    assert index.query(include_archived=True)[1] == 0
+
+
+def test_receipts_being_written_are_archived_once_written(index) -> None:
+    """Compaction waits for a receipt generated again meanwhile, and archives the new file instead of deleting it."""
+    path = _add_receipt(index, "january.pdf", 1)
+    lock = index.get_file_lock("january.pdf")
+    lock.acquire()
+    compaction = threading.Thread(target=apply_retention, args=(index, "2025-03-01"))
+    compaction.start()
+    compaction.join(0.2)
+    assert compaction.is_alive()
+
+    with open(path, "wb") as receipt:
+        receipt.write(b"%PDF- generated again")
+    index.add(path, [{"entity_id": "sensor.meter", "amount": 2.0}], datetime(2025, 1, 1), datetime(2025, 1, 28))
+    lock.release()
+    compaction.join()
+
+    assert _get_members(index, "2025-01") == {"january.pdf": b"%PDF- generated again"}
+    assert index.query(include_archived=True)[0][0]["archive"] == "receipts_2025-01.zip"
+
+
+def test_deleting_an_archived_receipt_removes_it_from_its_archive(index) -> None:
+    """The archive is written again without the deleted receipt, and removed with its last one."""
+    _add_receipt(index, "first.pdf", 1)
+    _add_receipt(index, "second.pdf", 1)
+    apply_retention(index, "2025-03-01")
+
+    assert delete_receipt(index, "first.pdf")
+    assert _get_members(index, "2025-01") == {"second.pdf": b"%PDF- second.pdf"}
+    assert [receipt["filename"] for receipt in index.query(include_archived=True)[0]] == ["second.pdf"]
+
+    assert delete_receipt(index, "second.pdf")
+    assert os.listdir(index.archive_dir) == []
+    assert not delete_receipt(index, "second.pdf")
+
+
+def test_deleting_a_receipt_file(index) -> None:
+    """A receipt still in the receipts folder is removed from disk and the index."""
+    path = _add_receipt(index, "january.pdf", 1)
+
+    assert delete_receipt(index, "january.pdf")
+    assert not os.path.exists(path)
+    assert index.query()[1] == 0
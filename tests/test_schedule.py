@@ -0,0 +1,36 @@
+"""Tests for the periods of the scheduled monthly receipts."""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from custom_components.sensor_pdf_generator.energy import get_period_end  # noqa: E402
+from custom_components.sensor_pdf_generator.schedule import _get_previous_period  # noqa: E402
+
+
+def test_previous_period_covers_the_whole_month() -> None:
+    """The period of last month runs from midnight on its 1st to midnight on this month's 1st."""
+    start_date, end_date, period = _get_previous_period(datetime(2025, 3, 10, 6))
+
+    assert (start_date, end_date, period) == (datetime(2025, 2, 1), datetime(2025, 2, 28), "2025-02")
+    assert get_period_end(end_date) == datetime(2025, 3, 1)
+
+
+def test_previous_period_across_the_year_end() -> None:
+    """January's run bills December of the year before."""
+    start_date, end_date, period = _get_previous_period(datetime(2025, 1, 1, 6))
+
+    assert (start_date, end_date, period) == (datetime(2024, 12, 1), datetime(2024, 12, 31), "2024-12")
+
+
+def test_consecutive_periods_are_contiguous() -> None:
+    """Every scheduled period ends exactly where the next month's starts, leap years included."""
+    periods = [
+        _get_previous_period(datetime(year, month, 15))
+        for year in (2023, 2024)
+        for month in range(1, 13)
+    ]
+
+    for (_, end_date, _), (next_start, _, _) in zip(periods, periods[1:]):
+        assert get_period_end(end_date) == next_start
@@ -0,0 +1,128 @@
+"""Tests for the meter readings snapshotted at billing period boundaries."""
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+
+from custom_components.sensor_pdf_generator.const import DEFAULT_LOOKUP_HORIZON_DAYS, DOMAIN  # noqa: E402
+from custom_components.sensor_pdf_generator.energy import DATA_LOOKUP_HORIZON  # noqa: E402
+from custom_components.sensor_pdf_generator.snapshots import (  # noqa: E402
+    SNAPSHOT_MISS_RETRY,
+    SNAPSHOT_STORAGE_KEY,
+    ReadingSnapshots,
+    _get_months,
+    async_get_readings,
+    async_get_readings_at_boundaries,
+    async_setup_snapshots,
+    async_shutdown_snapshots,
+    get_snapshots,
+)
+
+JANUARY = datetime(2025, 1, 1)
+FEBRUARY = datetime(2025, 2, 1)
+
+
+def _reading(state: float) -> dict:
+    """Return a reading as the recorder reads it from long-term statistics."""
+    return {"state": state, "sum": state - 1000}
+
+
+@pytest.fixture
+async def snapshots(hass: HomeAssistant):
+    """Set up the shared snapshots, removing their listeners after the test."""
+    listeners = await async_setup_snapshots(hass)
+    yield get_snapshots(hass)
+    for remove_listener in listeners:
+        remove_listener()
+    await async_shutdown_snapshots(hass)
+
+
+def test_months_across_the_year_end() -> None:
+    """The months up to a given one run oldest first across the year end."""
+    assert _get_months(2025, 2, 4) == [(2024, 11), (2024, 12), (2025, 1), (2025, 2)]
+
+
+async def test_only_past_month_boundaries_are_stored(hass: HomeAssistant, snapshots) -> None:
+    """Readings away from a month's start, or at a boundary still ahead, are not kept."""
+    snapshots.async_add(JANUARY, {"sensor.a": _reading(1000)})
+    snapshots.async_add(datetime(2025, 1, 15), {"sensor.a": _reading(1010)})
+    snapshots.async_add(datetime(2099, 1, 1), {"sensor.a": _reading(1020)})
+
+    assert snapshots.async_get(["sensor.a"], JANUARY) == {"sensor.a": _reading(1000)}
+    assert snapshots.async_missing(["sensor.a"], datetime(2025, 1, 15)) == ["sensor.a"]
+    assert snapshots.async_missing(["sensor.a"], datetime(2099, 1, 1)) == ["sensor.a"]
+
+
+async def test_readings_are_read_once(hass: HomeAssistant, snapshots) -> None:
+    """Only meters without a snapshot are read, and what was read is kept, missing readings included."""
+    snapshots.async_add(JANUARY, {"sensor.a": _reading(1000)})
+    fetch = AsyncMock(return_value={"sensor.b": None})
+
+    with patch("custom_components.sensor_pdf_generator.snapshots.get_readings_at_times", fetch):
+        first = await async_get_readings(hass, ["sensor.a", "sensor.b"], JANUARY)
+        second = await async_get_readings(hass, ["sensor.a", "sensor.b"], JANUARY)
+
+    assert first == second == {"sensor.a": _reading(1000), "sensor.b": None}
+    fetch.assert_awaited_once_with(hass, ["sensor.b"], JANUARY)
+    assert snapshots.async_missing(["sensor.a", "sensor.b"], JANUARY) == []
+
+
+async def test_readings_at_boundaries_keep_the_snapshots(hass: HomeAssistant, snapshots) -> None:
+    """Meters missing a snapshot at any boundary are read, without overwriting the snapshots they have."""
+    snapshots.async_add(JANUARY, {"sensor.a": _reading(1000), "sensor.b": None})
+    snapshots.async_add(FEBRUARY, {"sensor.a": _reading(1100)})
+    fetch = AsyncMock(return_value={
+        JANUARY: {"sensor.b": _reading(2000)},
+        FEBRUARY: {"sensor.b": _reading(2100)},
+    })
+
+    with patch("custom_components.sensor_pdf_generator.snapshots.get_readings_at_boundaries", fetch):
+        readings = await async_get_readings_at_boundaries(hass, ["sensor.a", "sensor.b"], [JANUARY, FEBRUARY])
+
+    fetch.assert_awaited_once_with(hass, ["sensor.b"], [JANUARY, FEBRUARY])
+    assert readings == {
+        JANUARY: {"sensor.a": _reading(1000), "sensor.b": None},
+        FEBRUARY: {"sensor.a": _reading(1100), "sensor.b": _reading(2100)},
+    }
+
+
+async def test_misses_stand_until_the_lookup_horizon_grows(hass: HomeAssistant, snapshots) -> None:
+    """A meter missed at a boundary has no reading there, until it can be looked up further back."""
+    snapshots.async_add(JANUARY, {"sensor.a": None})
+    assert snapshots.async_get(["sensor.a"], JANUARY) == {"sensor.a": None}
+
+    hass.data[DOMAIN][DATA_LOOKUP_HORIZON] = DEFAULT_LOOKUP_HORIZON_DAYS * 2
+    assert snapshots.async_missing(["sensor.a"], JANUARY) == ["sensor.a"]
+    snapshots.async_add(JANUARY, {"sensor.a": _reading(1000)})
+    assert snapshots.async_get(["sensor.a"], JANUARY) == {"sensor.a": _reading(1000)}
+
+
+async def test_backfill_looks_for_misses_again_for_a_while(hass: HomeAssistant, snapshots, freezer) -> None:
+    """Misses are read again every night from when they were first missed, for SNAPSHOT_MISS_RETRY."""
+    entity_ids = ["sensor.a", "sensor.b", "sensor.c"]
+    snapshots.async_add(JANUARY, {"sensor.a": _reading(1000), "sensor.b": None})
+    assert snapshots._async_backfill_missing(entity_ids, JANUARY) == ["sensor.b", "sensor.c"]
+
+    freezer.tick(SNAPSHOT_MISS_RETRY - timedelta(hours=1))
+    snapshots.async_add(JANUARY, {"sensor.b": None})
+    assert snapshots._async_backfill_missing(entity_ids, JANUARY) == ["sensor.b", "sensor.c"]
+    freezer.tick(timedelta(hours=2))
+    assert snapshots._async_backfill_missing(entity_ids, JANUARY) == ["sensor.c"]
+
+
+async def test_misses_stored_as_readings_are_looked_for_again(hass: HomeAssistant, hass_storage) -> None:
+    """Misses stored as None readings, before they were kept apart, no longer stand."""
+    when = datetime.fromisoformat("2025-01-01T00:00:00+00:00")
+    hass_storage[SNAPSHOT_STORAGE_KEY] = {
+        "version": 1,
+        "data": {"snapshots": {when.isoformat(): {"sensor.a": _reading(1000), "sensor.b": None}}},
+    }
+    snapshots = ReadingSnapshots(hass)
+    await snapshots.async_load()
+
+    assert snapshots.async_get(["sensor.a", "sensor.b"], when) == {"sensor.a": _reading(1000)}
+    assert snapshots._async_backfill_missing(["sensor.a", "sensor.b"], when) == ["sensor.b"]
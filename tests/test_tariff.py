@@ -0,0 +1,127 @@
+"""Tests for the tariff engine billing batches of meters."""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+import voluptuous as vol  # noqa: E402
+
+from custom_components.sensor_pdf_generator.billing import get_default_bill  # noqa: E402
+from custom_components.sensor_pdf_generator.tariff import (  # noqa: E402
+    TARIFFS_SCHEMA,
+    TariffPlan,
+    compute_bills,
+    get_hours,
+)
+
+TZ = ZoneInfo("Europe/Berlin")
+
+
+def _get_plan(*configs) -> TariffPlan:
+    """Return the plan of tariff configs, validated like the integration's options."""
+    return TariffPlan(TARIFFS_SCHEMA(list(configs)))
+
+
+def test_flat_tariff() -> None:
+    """A flat tariff prints its own rate and adds its fixed charge."""
+    tariff = _get_plan({"name": "flat", "fixed_charge": 10, "rate": 2}).default
+
+    bills = compute_bills([tariff, tariff], [5, 0])
+
+    assert bills == [
+        {"tariff": "flat", "fixed_charge": 10, "energy_rate": 2, "energy_charge": 10.0, "total_cost": 20.0},
+        {"tariff": "flat", "fixed_charge": 10, "energy_rate": 2, "energy_charge": 0.0, "total_cost": 10.0},
+    ]
+
+
+def test_without_tariffs_meters_pay_the_standard_tariff() -> None:
+    """Meters of an empty plan are billed exactly as before tariffs existed."""
+    plan = _get_plan()
+
+    assert compute_bills([plan.get_tariff("sensor.meter")], [12.5]) == [get_default_bill(12.5)]
+
+
+def test_tiered_tariff() -> None:
+    """Each block of the energy used is priced at its tier's rate."""
+    tariff = _get_plan({
+        "name": "tiered",
+        "fixed_charge": 0,
+        "tiers": [{"up_to": 100, "rate": 1}, {"up_to": 300, "rate": 2}, {"rate": 5}],
+    }).default
+
+    bills = compute_bills([tariff] * 3, [50, 250, 400])
+
+    assert [bill["energy_charge"] for bill in bills] == [50, 100 + 300, 100 + 400 + 500]
+    assert bills[2]["energy_rate"] == 2.5
+
+
+def test_tiers_must_rise() -> None:
+    """Tier bounds that do not rise, or a bounded last tier, are rejected."""
+    with pytest.raises(vol.Invalid):
+        TARIFFS_SCHEMA([{"name": "bad", "tiers": [{"up_to": 100, "rate": 1}, {"up_to": 50, "rate": 2}, {"rate": 3}]}])
+    with pytest.raises(vol.Invalid):
+        TARIFFS_SCHEMA([{"name": "bad", "tiers": [{"up_to": 100, "rate": 1}]}])
+
+
+def test_time_of_use_tariff() -> None:
+    """Energy is priced at the average rate of the meter's hourly consumption."""
+    tariff = _get_plan({
+        "name": "tou",
+        "fixed_charge": 0,
+        "rate": 1,
+        "time_of_use": [{"start_hour": 22, "end_hour": 6, "rate": 3}],
+    }).default
+    start = datetime(2025, 1, 1, 20, tzinfo=TZ)
+    hours = get_hours(start, start + timedelta(hours=4))
+    # 20:00 and 21:00 at the base rate, 22:00 and 23:00 in the night window
+    hourly = {0: {hour.timestamp(): 1.0 for hour in hours}, 1: {hours[0].timestamp(): 2.0}}
+
+    bills = compute_bills([tariff] * 3, [4, 2, 7], hourly, hours)
+
+    assert [bill["energy_charge"] for bill in bills] == [4 * 2.0, 2 * 1.0, 7 * 1.0]
+
+
+def test_time_of_use_ignores_hours_outside_the_period() -> None:
+    """Hourly consumption read for a longer span only bills the hours of the period."""
+    tariff = _get_plan({
+        "name": "tou",
+        "fixed_charge": 0,
+        "rate": 1,
+        "time_of_use": [{"start_hour": 0, "end_hour": 12, "rate": 2}],
+    }).default
+    start = datetime(2025, 1, 2, tzinfo=TZ)
+    hours = get_hours(start, start + timedelta(hours=1))
+    hourly = {0: {(start - timedelta(hours=12)).timestamp(): 100.0, start.timestamp(): 1.0}}
+
+    bills = compute_bills([tariff], [1], hourly, hours)
+
+    assert bills[0]["energy_charge"] == 2.0
+
+
+def test_hours_across_daylight_saving() -> None:
+    """The day clocks go forward has 23 hours, each one starting on the hour."""
+    start = datetime(2025, 3, 30, tzinfo=TZ)
+
+    hours = get_hours(start, datetime(2025, 3, 31, tzinfo=TZ))
+
+    assert len(hours) == 23
+    assert [hour.hour for hour in hours[:4]] == [0, 1, 3, 4]
+
+
+def test_tariff_assignment() -> None:
+    """Meters are assigned by entity first, then area, then floor, else the default tariff."""
+    plan = _get_plan(
+        {"name": "default"},
+        {"name": "entity", "entity_ids": ["sensor.meter"]},
+        {"name": "area", "areas": ["Flat 1"]},
+        {"name": "floor", "floors": ["Ground"]},
+    )
+
+    assert plan.uses_groups
+    assert plan.get_tariff("sensor.meter", "Flat 1", "Ground").name == "entity"
+    assert plan.get_tariff("sensor.other", "Flat 1", "Ground").name == "area"
+    assert plan.get_tariff("sensor.other", "Flat 2", "Ground").name == "floor"
+    assert plan.get_tariff("sensor.other").name == "default"
@@ -0,0 +1,188 @@
+"""Tests for the websocket commands of the receipt panel."""
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers import area_registry as ar  # noqa: E402
+from homeassistant.helpers import device_registry as dr  # noqa: E402
+from homeassistant.helpers import entity_registry as er  # noqa: E402
+from homeassistant.helpers import floor_registry as fr  # noqa: E402
+
+from custom_components.sensor_pdf_generator.const import (  # noqa: E402
+    DOMAIN,
+    JOB_COMPLETED,
+    METER_MANUFACTURER,
+    METER_MODEL_ID,
+)
+from custom_components.sensor_pdf_generator.jobs import get_job_queue  # noqa: E402
+
+METERS = ["sensor.shop_1_total_energy", "sensor.shop_2_total_energy"]
+
+
+async def _async_send_generate(client, message_id: int, entity_ids: list, start_date: str = "2025-01-01") -> None:
+    """Send a generate command for the month starting on start_date."""
+    await client.send_json({
+        "id": message_id,
+        "type": f"{DOMAIN}/generate",
+        "total_energy_entity_ids": entity_ids,
+        "start_date": start_date,
+        "end_date": f"{start_date[:8]}28",
+    })
+
+
+async def _async_receive_job(client, message_id: int) -> tuple:
+    """Return the reply to a generate command and the progress events received until its job completed.
+
+    The job starts right away, so its first events can come before the reply.
+    """
+    reply = None
+    events = []
+    while reply is None or not events or events[-1]["status"] != JOB_COMPLETED:
+        message = await client.receive_json()
+        if message["id"] == message_id:
+            reply = message
+        else:
+            events.append(message["event"])
+    return reply, events
+
+
+async def _async_subscribe(client, message_id: int, job_id: str = None) -> dict:
+    """Subscribe to the progress of one job, or of every job, and return the reply."""
+    await client.send_json({
+        "id": message_id,
+        "type": f"{DOMAIN}/jobs/subscribe",
+        **({"job_id": job_id} if job_id else {}),
+    })
+    return await client.receive_json()
+
+
+async def test_generate_and_follow_progress(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """Subscribers see a generate job start, progress and finish with its files."""
+    client = await hass_ws_client(hass)
+    assert (await _async_subscribe(client, 1))["success"]
+
+    await _async_send_generate(client, 2, METERS)
+    reply, events = await _async_receive_job(client, 2)
+
+    assert {event["job_id"] for event in events} == {reply["result"]["job_id"]}
+    assert events[-1]["files"] == [
+        "sensor_report_shop_1_total_energy_20250101_20250128.pdf",
+        "sensor_report_shop_2_total_energy_20250101_20250128.pdf",
+    ]
+    assert (events[-1]["done"], events[-1]["total"]) == (2, 2)
+
+
+async def test_subscribe_to_one_job(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """A job that finished before the subscription is sent at once, and unknown jobs are not found."""
+    client = await hass_ws_client(hass)
+    await _async_subscribe(client, 1)
+    await _async_send_generate(client, 2, METERS)
+    reply, _ = await _async_receive_job(client, 2)
+    job_id = reply["result"]["job_id"]
+
+    assert (await _async_subscribe(client, 3, job_id))["success"]
+    message = await client.receive_json()
+    assert (message["id"], message["event"]["status"]) == (3, JOB_COMPLETED)
+
+    reply = await _async_subscribe(client, 4, "unknown")
+    assert reply["error"]["code"] == "not_found"
+
+
+async def test_cancel_a_finished_job(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """Jobs that already finished, or never existed, are not cancelled."""
+    client = await hass_ws_client(hass)
+    await _async_subscribe(client, 1)
+    await _async_send_generate(client, 2, METERS)
+    reply, _ = await _async_receive_job(client, 2)
+
+    for message_id, job_id in ((3, reply["result"]["job_id"]), (4, "unknown")):
+        await client.send_json({"id": message_id, "type": f"{DOMAIN}/jobs/cancel", "job_id": job_id})
+        assert (await client.receive_json())["result"] == {"cancelled": False}
+
+
+async def test_invalid_dates(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """A date that does not exist is rejected without queueing a job."""
+    client = await hass_ws_client(hass)
+
+    await _async_send_generate(client, 1, METERS, "2025-13-01")
+
+    assert (await client.receive_json())["error"]["code"] == "invalid_format"
+    assert get_job_queue(hass).async_jobs() == []
+
+
+async def test_list_receipts(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """Receipts are listed newest first one page at a time, with their meter count instead of their meters."""
+    client = await hass_ws_client(hass)
+    await _async_subscribe(client, 1)
+    for message_id, start_date in ((2, "2025-01-01"), (3, "2025-02-01")):
+        await _async_send_generate(client, message_id, METERS, start_date)
+        await _async_receive_job(client, message_id)
+
+    await client.send_json({"id": 4, "type": f"{DOMAIN}/receipts/list", "limit": 3, "offset": 1})
+    result = (await client.receive_json())["result"]
+    await client.send_json({"id": 5, "type": f"{DOMAIN}/receipts/list", "entity_id": METERS[0], "start_date": "2025-02-01"})
+    filtered = (await client.receive_json())["result"]
+
+    assert result["total"] == 4
+    assert len(result["receipts"]) == 3
+    assert all(receipt["entity_count"] == 1 and "entity_ids" not in receipt for receipt in result["receipts"])
+    assert [receipt["filename"] for receipt in filtered["receipts"]] == [
+        "sensor_report_shop_1_total_energy_20250201_20250228.pdf"
+    ]
+
+
+async def test_list_meters(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """Breakers of the supported meter are listed with their sensors, area and floor."""
+    floor = fr.async_get(hass).async_create("Ground")
+    area = ar.async_get(hass).async_create("Shop 1", floor_id=floor.floor_id)
+    device = dr.async_get(hass).async_get_or_create(
+        config_entry_id=integration.entry_id,
+        identifiers={("test", "meter")},
+        manufacturer=METER_MANUFACTURER,
+        model_id=METER_MODEL_ID,
+    )
+    dr.async_get(hass).async_update_device(device.id, area_id=area.id)
+    entity_registry = er.async_get(hass)
+    for sensor_type in ("total_energy", "phase_a_current"):
+        entity_registry.async_get_or_create(
+            "sensor", "test", f"shop_1_{sensor_type}", suggested_object_id=f"shop_1_{sensor_type}", device_id=device.id
+        )
+    # Without its current sensor this breaker is incomplete
+    entity_registry.async_get_or_create(
+        "sensor", "test", "shop_2_total_energy", suggested_object_id="shop_2_total_energy", device_id=device.id
+    )
+    hass.states.async_set("sensor.shop_1_total_energy", "10", {"friendly_name": "Shop 1 energy"})
+    client = await hass_ws_client(hass)
+
+    await client.send_json({"id": 1, "type": f"{DOMAIN}/meters/list"})
+    result = (await client.receive_json())["result"]
+
+    assert result == {
+        "meters": [{
+            "name": "shop_1",
+            "sensors": {"phase_a_current": "sensor.shop_1_phase_a_current", "total_energy": "sensor.shop_1_total_energy"},
+            "area": "Shop 1",
+            "floor": "Ground",
+            "friendly_name": "Shop 1 energy",
+        }],
+        "floors": ["Ground"],
+    }
+
+
+async def test_subscriptions_survive_a_reload(integration, hass: HomeAssistant, hass_ws_client) -> None:
+    """The panel keeps receiving progress after the entry is reloaded, and cannot generate while it is unloaded."""
+    client = await hass_ws_client(hass)
+    await _async_subscribe(client, 1)
+
+    assert await hass.config_entries.async_reload(integration.entry_id)
+    await hass.async_block_till_done()
+    await _async_send_generate(client, 2, METERS[:1])
+    reply, events = await _async_receive_job(client, 2)
+    assert reply["success"]
+    assert events[-1]["job_id"] == reply["result"]["job_id"]
+
+    assert await hass.config_entries.async_unload(integration.entry_id)
+    await hass.async_block_till_done()
+    await _async_send_generate(client, 3, METERS[:1])
+    assert (await client.receive_json())["error"]["code"] == "not_found"